@@ -0,0 +1,56 @@
+"""
+Compare the peak memory and the time of loading the T2 areas of a sample into a matrix, stacking the parsed
+columns (previous loader) versus parsing each file straight into a preallocated column (load_area_matrix).
+
+Run from the repository root:
+    python -m benchmarks.bench_area_loader --areas 200 --points 901
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.bench_spectra_loader import write_shimadzu_files
+from src.Spectra_loader import load_area_matrix, load_spectrum
+
+
+def load_stacked(paths: list) -> np.ndarray:
+    """ The loader used by ProcessSpectroscopyData.load_sample before load_area_matrix. """
+    return np.column_stack([load_spectrum(path)[1] for path in paths])
+
+
+def measure(loader, paths: list) -> tuple:
+    """ Peak traced memory (bytes) and time of one load, and the loaded matrix. """
+    tracemalloc.start()
+    start = time.perf_counter()
+    matrix = loader(paths)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed, matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--areas', type=int, default=200)
+    parser.add_argument('--points', type=int, default=901)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = write_shimadzu_files(folder, args.areas, args.points)
+        stacked_peak, stacked_time, stacked = measure(load_stacked, paths)
+        matrix_peak, matrix_time, matrix = measure(load_area_matrix, paths)
+    assert np.array_equal(stacked, matrix)
+
+    size = matrix.nbytes
+    print(f'{args.areas} areas x {args.points} points, matrix of {size / 2 ** 20:.2f} MiB')
+    print(f'stacked columns  : peak {stacked_peak / 2 ** 20:.2f} MiB ({stacked_peak / size:.2f}x the matrix), '
+          f'{1e3 * stacked_time:.1f} ms')
+    print(f'preallocated     : peak {matrix_peak / 2 ** 20:.2f} MiB ({matrix_peak / size:.2f}x the matrix), '
+          f'{1e3 * matrix_time:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
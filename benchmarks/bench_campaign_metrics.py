@@ -0,0 +1,66 @@
+"""
+Compare the batched (samples x areas x wavelengths) metrics engine with the per-sample calculate_metrics loop.
+
+Run from the repository root:
+    python -m benchmarks.bench_campaign_metrics --samples 500 --points 901 --max-areas 6
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src.Calculator import ProcessSpectroscopyData
+from src.Campaign_metrics import pack_samples, calculate_metrics_batched
+from src.Folder_scanner import SpectroscopyFolderScanner
+
+
+def make_samples(n_samples: int, n_points: int, max_areas: int) -> list:
+    """ Synthetic (t1, t2, t3, t4) per sample with a varying number of areas. """
+    rng = np.random.default_rng(0)
+    samples = []
+    for _ in range(n_samples):
+        n_areas = int(rng.integers(1, max_areas + 1))
+        samples.append((100 + rng.random(n_points), 80 + 5 * rng.random((n_points, n_areas)),
+                        1 + rng.random(n_points), 5 + rng.random((n_points, n_areas))))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=500)
+    parser.add_argument('--points', type=int, default=901)
+    parser.add_argument('--max-areas', type=int, default=6)
+    parser.add_argument('--repeat', type=int, default=5, help='The best of the repeats is reported.')
+    args = parser.parse_args()
+    samples = make_samples(args.samples, args.points, args.max_areas)
+
+    parent = SpectroscopyFolderScanner()
+    parent.data_folders = {str(index): {} for index in range(args.samples)}
+    calculator = ProcessSpectroscopyData(parent)
+    loop_time, pack_time, batched_time = float('inf'), float('inf'), float('inf')
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        for index, (t1, t2, t3, t4) in enumerate(samples):
+            calculator.calculate_metrics(t1, t2, t3, t4, str(index), t2.shape[1])
+        loop_time = min(loop_time, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        packed = pack_samples(samples)
+        packed_at = time.perf_counter()
+        metrics = calculate_metrics_batched(*packed)
+        pack_time = min(pack_time, packed_at - start)
+        batched_time = min(batched_time, time.perf_counter() - packed_at)
+
+    for index in range(args.samples):
+        for key, values in metrics.items():
+            assert np.array_equal(values[index], parent.data_folders[str(index)][key]), (index, key)
+
+    print(f'{args.samples} samples x {args.points} points, 1-{args.max_areas} areas (results are identical)')
+    print(f'per-sample loop : {loop_time:.4f} s')
+    print(f'batched engine  : {batched_time:.4f} s (+ {pack_time:.4f} s to pack the samples)')
+    print(f'Speedup         : {loop_time / batched_time:.1f}x calculation, '
+          f'{loop_time / (batched_time + pack_time):.1f}x including packing')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Compare the per-image time of the sample images with and without reusing the figure templates.
+
+Run from the repository root:
+    python -m benchmarks.bench_image_templates --samples 500 --format png
+"""
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+
+import numpy as np
+
+from src.Save_results_img import ImageSettings, IMAGE_KINDS, render_sample_images
+from src.settings import DEFAULT_IMAGE_OPTIONS
+
+
+def make_samples(n_samples: int, n_points: int) -> list:
+    """ Synthetic processed samples on the usual 1100-200 nm grid. """
+    rng = np.random.default_rng(0)
+    wavelength = np.linspace(1100, 200, n_points)
+    return [{'Wavelength': wavelength,
+             'Transmittance_Avg': 80 + 5 * rng.random(n_points), 'Transmittance_Std_Dev': rng.random(n_points),
+             'Haze_Avg': 10 + 5 * rng.random(n_points), 'Haze_Std_Dev': rng.random(n_points)}
+            for _ in range(n_samples)]
+
+
+def render_all(samples: list, settings: ImageSettings, folder: str, reuse_templates: bool) -> float:
+    """ Render the images of all samples, return the time per image. """
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for index, sample in enumerate(samples):
+            paths = [f'{folder}/{prefix}_{index}.{settings.format}' for prefix, *_ in IMAGE_KINDS]
+            render_sample_images(str(index), sample, settings, paths, reuse_templates=reuse_templates)
+    return (time.perf_counter() - start) / (len(samples) * len(IMAGE_KINDS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=500)
+    parser.add_argument('--points', type=int, default=901)
+    parser.add_argument('--format', default='png')
+    parser.add_argument('--dpi', type=int, default=300)
+    args = parser.parse_args()
+    samples = make_samples(args.samples, args.points)
+    settings = ImageSettings.from_options({**DEFAULT_IMAGE_OPTIONS, 'format': args.format, 'dpi': args.dpi})
+
+    with tempfile.TemporaryDirectory() as folder:
+        fresh = render_all(samples, settings, folder, reuse_templates=False)
+        reused = render_all(samples, settings, folder, reuse_templates=True)
+
+    print(f'{args.samples} samples, {len(IMAGE_KINDS)} {args.format} images each at {args.dpi} dpi')
+    print(f'new figure per image : {1000 * fresh:.1f} ms per image')
+    print(f'reused templates     : {1000 * reused:.1f} ms per image')
+    print(f'Speedup              : {fresh / reused:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Compare the memory of the processed samples held as plain dicts (one wavelength array per sample) with
+SampleRecord (interned wavelength grid), in float64 and with float32 metrics.
+
+Run from the repository root:
+    python -m benchmarks.bench_sample_records --samples 2000 --points 4501
+"""
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from src.Sample_record import SampleRecord
+
+
+def make_samples(n_samples: int, n_points: int, n_areas: int, record_factory) -> dict:
+    """ Processed samples on the same grid, each wavelength array parsed separately as in a run. """
+    rng = np.random.default_rng(0)
+    samples = {}
+    for index in range(n_samples):
+        sample = record_factory()
+        sample.update({
+            't1': '/campaign/T1.txt', 't3': '/campaign/T3.txt',
+            't2': [f'/campaign/sample{index}/T2-{area + 1}.txt' for area in range(n_areas)],
+            't4': [f'/campaign/sample{index}/T4-{area + 1}.txt' for area in range(n_areas)],
+            'path': f'/campaign/sample{index}', 'outputs': [],
+            'Wavelength': np.linspace(1100, 200, n_points),
+        })
+        for key in ('Transmittance_Avg', 'Transmittance_Std_Dev', 'Haze_Avg', 'Haze_Std_Dev'):
+            sample[key] = rng.random(n_points)
+        samples[f'sample{index}'] = sample
+    return samples
+
+
+def measure(record_factory, args) -> int:
+    """ Traced memory held by the samples, in bytes. """
+    tracemalloc.start()
+    samples = make_samples(args.samples, args.points, args.areas, record_factory)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del samples
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=2000)
+    parser.add_argument('--points', type=int, default=4501)
+    parser.add_argument('--areas', type=int, default=3)
+    args = parser.parse_args()
+
+    plain = measure(dict, args)
+    record = measure(SampleRecord, args)
+    compact = measure(lambda: SampleRecord(float32_metrics=True), args)
+
+    print(f'{args.samples} samples x {args.points} points')
+    print(f'dict per sample          : {plain / 2 ** 20:8.1f} MiB')
+    print(f'SampleRecord             : {record / 2 ** 20:8.1f} MiB ({plain / record:.2f}x smaller)')
+    print(f'SampleRecord, float32    : {compact / 2 ** 20:8.1f} MiB ({plain / compact:.2f}x smaller)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Compare the dedicated Shimadzu parser with the previous pandas read path.
+
+Run from the repository root:
+    python -m benchmarks.bench_spectra_loader --files 2000 --points 901
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.Spectra_loader import load_spectrum
+
+
+def write_shimadzu_files(folder: str, n_files: int, n_points: int) -> list:
+    """ Write synthetic two-column Shimadzu exports and return their paths. """
+    rng = np.random.default_rng(0)
+    wavelength = np.linspace(1100, 200, n_points)
+    paths = []
+    for index in range(n_files):
+        path = os.path.join(folder, f'T2-{index + 1}.txt')
+        values = 80 + 5 * rng.random(n_points)
+        with open(path, 'w') as file:
+            file.write(f'"T2-{index + 1}.spc - RawData"\n"Wavelength nm.","T%"\n')
+            file.writelines(f'{w:.2f},{v:.3f}\n' for w, v in zip(wavelength, values))
+        paths.append(path)
+    return paths
+
+
+def read_pandas(path: str):
+    """ The read path used by ProcessSpectroscopyData before the dedicated parser. """
+    values = pd.read_csv(path, sep=",", header=1).values.ravel()
+    return values[::2], values[1::2]
+
+
+def time_reader(reader, paths: list) -> float:
+    start = time.perf_counter()
+    for path in paths:
+        reader(path)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--points', type=int, default=901)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = write_shimadzu_files(folder, args.files, args.points)
+        for path in paths[:10]:
+            old_wavelength, old_values = read_pandas(path)
+            new_wavelength, new_values = load_spectrum(path)
+            assert np.array_equal(old_wavelength, new_wavelength) and np.array_equal(old_values, new_values)
+
+        pandas_time = time_reader(read_pandas, paths)
+        parser_time = time_reader(load_spectrum, paths)
+
+    print(f'{args.files} files x {args.points} points')
+    print(f'pandas read_csv : {pandas_time:.3f} s ({1e3 * pandas_time / args.files:.3f} ms/file)')
+    print(f'Shimadzu parser : {parser_time:.3f} s ({1e3 * parser_time / args.files:.3f} ms/file)')
+    print(f'Speedup         : {pandas_time / parser_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
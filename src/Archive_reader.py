@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import gzip
+import os
+import threading
+import time
+import zipfile
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple
+
+ARCHIVE_EXTENSION = '.zip'
+COMPRESSED_EXTENSION = '.gz'
+OUTPUT_FOLDER_SUFFIX = '_results'
+
+
+class ArchiveEntry:
+    """
+    A folder or a file listed from a .zip archive, with the parts of the os.DirEntry interface used by
+    FolderIndex. Its path is the archive's path followed by the member's path, e.g. campaign.zip/sample1/T2-1.txt.
+    """
+
+    def __init__(self, name: str, path: str, is_folder: bool):
+        self.name = name
+        self.path = path
+        self.is_folder = is_folder
+
+    def is_dir(self) -> bool:
+        return self.is_folder
+
+    def stat(self) -> FileStat:
+        return file_stat(self.path)
+
+
+class FileStat(NamedTuple):
+    """ The fields of os.stat_result used by the pipeline, for files inside an archive. """
+    st_size: int
+    st_mtime_ns: int
+    st_ctime: float
+
+
+class OpenedArchive:
+    """
+    An opened .zip archive with the folder tree of its members, built once from its central directory.
+
+    :param path: Path of the archive.
+    """
+
+    def __init__(self, path: str):
+        stat = os.stat(path)
+        self.signature = (stat.st_mtime_ns, stat.st_size)
+        self.zip_file = zipfile.ZipFile(path)
+        self.members: Dict[str, zipfile.ZipInfo] = {}  # Member path: info, files only
+        self.folders: Dict[str, Tuple[List[str], List[str]]] = {'': ([], [])}  # Folder: (files, subfolders)
+        for info in self.zip_file.infolist():
+            parts = info.filename.rstrip('/').split('/')
+            for depth in range(1, len(parts) if not info.is_dir() else len(parts) + 1):
+                folder = '/'.join(parts[:depth])
+                if folder not in self.folders:
+                    self.folders[folder] = ([], [])
+                    self.folders['/'.join(parts[:depth - 1])][1].append(parts[depth - 1])
+            if not info.is_dir():
+                self.members[info.filename.rstrip('/')] = info
+                self.folders['/'.join(parts[:-1])][0].append(parts[-1])
+
+    def mtime(self, member: str) -> float:
+        """ Modification time of a member, as stored in the archive. """
+        return time.mktime(self.members[member].date_time + (0, 0, -1))
+
+
+# Archives opened by this process, reused by all the samples they contain
+_archives: Dict[str, OpenedArchive] = {}
+_archives_lock = threading.Lock()
+
+
+def is_archive(path: str) -> bool:
+    """ Whether a path is a .zip archive on disk. """
+    return path.lower().endswith(ARCHIVE_EXTENSION) and os.path.isfile(path)
+
+
+def split_archive_path(path: str) -> Optional[Tuple[str, str]]:
+    """
+    Split a path inside a .zip archive.
+
+    :param path: A path, e.g. campaign.zip/sample1/T2-1.txt.
+    :return: The archive's path and the member's path ('' for the archive itself, '/' separated), or None if
+        the path is not inside an archive.
+    """
+    if ARCHIVE_EXTENSION not in path.lower():
+        return None
+    candidate = os.path.normpath(path)
+    while True:
+        if is_archive(candidate):
+            member = os.path.relpath(os.path.normpath(path), candidate)
+            return candidate, '' if member == '.' else member.replace(os.sep, '/')
+        parent = os.path.dirname(candidate)
+        if parent == candidate:
+            return None
+        candidate = parent
+
+
+def open_archive(path: str) -> OpenedArchive:
+    """
+    The opened archive, opened on the first request and reopened only if the archive file changed.
+
+    :param path: Path of the archive.
+    """
+    key = os.path.abspath(path)
+    stat = os.stat(key)
+    with _archives_lock:
+        archive = _archives.get(key)
+        if archive is None or archive.signature != (stat.st_mtime_ns, stat.st_size):
+            if archive is not None:
+                archive.zip_file.close()
+            archive = _archives[key] = OpenedArchive(key)
+        return archive
+
+
+def list_folder(path: str) -> Optional[Tuple[List[ArchiveEntry], List[ArchiveEntry]]]:
+    """
+    The files and subfolders of an archive, or of a folder inside an archive.
+
+    :param path: Path of the archive or of a folder inside it.
+    :return: Files and subfolders, None if the path is not an archive folder.
+    """
+    location = split_archive_path(path)
+    if location is None:
+        return None
+    archive = open_archive(location[0])
+    if location[1] not in archive.folders:
+        return None
+    file_names, folder_names = archive.folders[location[1]]
+    files = [ArchiveEntry(name, os.path.join(path, name), False) for name in file_names]
+    folders = [ArchiveEntry(name, os.path.join(path, name), True) for name in folder_names]
+    return files, folders
+
+
+def open_input(path: str) -> BinaryIO:
+    """
+    Open an input file for reading, a .zip member or a .gz file is decompressed in memory while it is read.
+
+    :param path: Path of the file, possibly inside a .zip archive.
+    :return: Binary file object.
+    """
+    location = split_archive_path(path)
+    if location is None:
+        file = open(path, 'rb')
+    else:
+        # ZipFile serializes the reads of its shared file handle, the prefetch threads can read members at once
+        archive = open_archive(location[0])
+        if location[1] not in archive.members:
+            raise FileNotFoundError(f'{location[1]} is not in {location[0]}')
+        file = archive.zip_file.open(archive.members[location[1]])
+    if path.lower().endswith(COMPRESSED_EXTENSION):
+        return gzip.GzipFile(fileobj=file)
+    return file
+
+
+def read_input(path: str) -> bytes:
+    """ Content of an input file, see open_input. """
+    with open_input(path) as file:
+        return file.read()
+
+
+def file_stat(path: str) -> os.stat_result | FileStat:
+    """
+    Size and modification time of an input file, possibly inside a .zip archive.
+
+    :param path: Path of the file.
+    :raises FileNotFoundError: If the file or the member does not exist.
+    """
+    location = split_archive_path(path)
+    if location is None:
+        return os.stat(path)
+    archive = open_archive(location[0])
+    if location[1] not in archive.members:
+        raise FileNotFoundError(f'{location[1]} is not in {location[0]}')
+    mtime = archive.mtime(location[1])
+    return FileStat(archive.members[location[1]].file_size, int(mtime * 1e9), mtime)
+
+
+def output_folder(path: str) -> str:
+    """
+    Folder where the results of a folder are written. Results can not be written into an archive, so those of
+    campaign.zip/sample1 go to campaign_results/sample1 next to the archive, created when needed.
+
+    :param path: Path of a folder, possibly inside a .zip archive.
+    :return: Path of a folder on disk.
+    """
+    location = split_archive_path(path)
+    if location is None:
+        return path
+    archive_path, member = location
+    folder = os.path.join(os.path.splitext(archive_path)[0] + OUTPUT_FOLDER_SUFFIX, *filter(None, member.split('/')))
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def display_name(name: str) -> str:
+    """ Name of a folder or of an archive without its .zip extension. """
+    return name[:-len(ARCHIVE_EXTENSION)] if name.lower().endswith(ARCHIVE_EXTENSION) else name
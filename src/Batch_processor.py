@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import argparse
+import os
+import traceback
+from typing import Dict, List, Optional, Sequence
+
+import matplotlib
+
+matplotlib.use('Agg')  # Headless runs must never touch an interactive backend
+
+from src.Archive_reader import is_archive  # noqa: E402
+from src.Calculator import ProcessSpectroscopyData  # noqa: E402
+from src.Folder_scanner import SpectroscopyFolderScanner  # noqa: E402
+from src.Save_campaign_plots import SaveCampaignPlots  # noqa: E402
+from src.Save_results_into_single_xlsx import SaveIntoSingleExcel  # noqa: E402
+from src.settings import SETTINGS, DEFAULT_IMAGE_OPTIONS  # noqa: E402
+
+
+class BatchProcessor(SpectroscopyFolderScanner):
+    """
+    Run the full processing pipeline over one or more root folders without any GUI.
+
+    :param file_naming: File naming style. Default is "conventional".
+    :param save_images: Save transmittance and haze plots for each sample.
+    :param save_xlsx: Save an .xlsx file with the results for each sample.
+    :param save_all: Save the results of all samples of a root folder into a single .xlsx file.
+    :param combined_format: Format of the combined results file: xlsx, csv or npz (one array per column).
+    :param save_pdf: Save the plots of all samples of a root folder into one multi-page PDF.
+    :param contact_sheet: Save contact sheets tiling the plots of many samples per image.
+    :param image_options: Image size in cm, format and axis limits. Missing keys fall back to the defaults.
+    :param workers: Number of worker processes for the samples, 0 uses all CPU cores.
+    :param image_workers: Number of processes rendering the images, 0 for automatic, 1 renders them in line.
+    :param batched_metrics: Calculate the metrics of all samples of a root folder at once.
+    :param streaming_stats: Load the areas of a sample one at a time and use running statistics, the values of
+        each area are not kept.
+    :param float32_metrics: Keep the calculated metrics as float32, halving their memory.
+    :param prefetch_depth: Samples read ahead by threads while one is processed, 0 reads each in line.
+    :param max_depth: Subfolder levels searched below each root folder, None for no limit.
+    :param discovery_threads: Threads listing the folders of a level in parallel.
+    :param incremental: Skip samples unchanged since the last run, using the manifest in the root folder.
+    :param force_rebuild: With incremental, ignore the last run and rebuild everything.
+    :param save_store: Save all results of a root folder into a binary results store (.npz).
+    """
+
+    def __init__(self, file_naming: str = 'file_names_conventional', save_images: bool = False,
+                 save_xlsx: bool = False, save_all: bool = False, image_options: Optional[Dict] = None,
+                 workers: int = 1, batched_metrics: bool = False, max_depth: Optional[int] = 1,
+                 discovery_threads: int = 8, incremental: bool = False, force_rebuild: bool = False,
+                 save_store: bool = False, combined_format: str = 'xlsx', image_workers: int = 0,
+                 save_pdf: bool = False, contact_sheet: bool = False, streaming_stats: bool = False,
+                 prefetch_depth: int = 2, float32_metrics: bool = False):
+        super().__init__(file_naming)
+        self.save_images_flag = save_images
+        self.save_xlsx_flag = save_xlsx
+        self.save_all_flag = save_all
+        self.combined_format = combined_format
+        self.save_pdf_flag = save_pdf
+        self.contact_sheet_flag = contact_sheet
+        self.image_options.update(image_options or {})
+        self.workers = workers if workers > 0 else os.cpu_count() or 1
+        self.image_workers = image_workers
+        self.batched_metrics = batched_metrics
+        self.streaming_stats = streaming_stats
+        self.prefetch_depth = prefetch_depth
+        self.float32_metrics = float32_metrics
+        self.max_depth = max_depth
+        self.discovery_threads = discovery_threads
+        self.incremental = incremental or force_rebuild
+        self.force_rebuild = force_rebuild
+        self.save_store_flag = save_store
+        self.failed_samples = {}  # "root folder name/sample name": error
+
+    def process_root_folder(self, root_folder_path: str) -> Dict:
+        """
+        Discover, calculate and export all samples of a single root folder.
+
+        :param root_folder_path: Path of the root folder.
+        :return: The processed data folders.
+        """
+        self.set_root_folder(root_folder_path)
+        self.proceed_each_folder()
+        self.process_and_sort_data_folders()
+        if not self.data_folders:
+            self.show_warning("Warning!", f"No complete T1-T4 sets were found in {root_folder_path}")
+            return self.data_folders
+        data_calculator = ProcessSpectroscopyData(self)
+        data_calculator.process_samples()
+        for sample_name, error in data_calculator.failed_samples.items():
+            self.failed_samples[f'{self.root_folder_name}/{sample_name}'] = error
+        SaveIntoSingleExcel(self)
+        SaveCampaignPlots(self)
+        self.export_results_store()
+        return self.data_folders
+
+    def run(self, root_folders: Sequence[str]) -> List[str]:
+        """
+        Process every root folder. A failing root folder is reported and skipped, so one bad folder
+        does not stop the rest of the batch.
+
+        :param root_folders: Paths of the root folders.
+        :return: List of root folders which failed.
+        """
+        failed = []
+        for root_folder_path in root_folders:
+            if not os.path.isdir(root_folder_path) and not is_archive(root_folder_path):
+                self.show_warning("Warning!", f"{root_folder_path} is not a directory or a .zip archive, skipped")
+                failed.append(root_folder_path)
+                continue
+            try:
+                self.process_root_folder(root_folder_path)
+            except Exception:  # Keep the batch going, the traceback is printed
+                traceback.print_exc()
+                failed.append(root_folder_path)
+        return failed
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    """ Build the command-line interface of the batch processor. """
+    parser = argparse.ArgumentParser(
+        description='Calculate transmittance and haze for Shimadzu UV-2600 data folders without the GUI.')
+    parser.add_argument('root_folders', nargs='+', help='Root folder(s) with the T1-T4 measurements.')
+    parser.add_argument('--file-naming', default='file_names_conventional', choices=list(SETTINGS.keys()),
+                        help='File naming style from settings.py.')
+    parser.add_argument('--save-images', action='store_true', help='Save plots for each sample.')
+    parser.add_argument('--save-xlsx', action='store_true', help="Save xlsx's for each sample.")
+    parser.add_argument('--save-all', action='store_true', help='Save all data of a root folder in one xlsx.')
+    parser.add_argument('--combined-format', default='xlsx', choices=['xlsx', 'csv', 'npz'],
+                        help='Format of the file written by --save-all, npz keeps one array per column.')
+    parser.add_argument('--save-pdf', action='store_true',
+                        help='Save the plots of all samples of a root folder into one multi-page PDF.')
+    parser.add_argument('--contact-sheet', action='store_true',
+                        help='Save contact sheets tiling the plots of 20 samples per image (image format).')
+    parser.add_argument('--save-store', action='store_true',
+                        help='Save all results of a root folder into a binary .npz results store.')
+    parser.add_argument('--image-width', type=float, default=DEFAULT_IMAGE_OPTIONS['width'],
+                        help='Image width in cm.')
+    parser.add_argument('--image-height', type=float, default=DEFAULT_IMAGE_OPTIONS['height'],
+                        help='Image height in cm.')
+    parser.add_argument('--image-format', default=DEFAULT_IMAGE_OPTIONS['format'],
+                        choices=["png", "jpg", "jpeg", "tiff"], help='Image format.')
+    parser.add_argument('--x-min', type=float, default=DEFAULT_IMAGE_OPTIONS['x_min'], help='X-axis min.')
+    parser.add_argument('--x-max', type=float, default=DEFAULT_IMAGE_OPTIONS['x_max'], help='X-axis max.')
+    parser.add_argument('--y-min', type=float, default=DEFAULT_IMAGE_OPTIONS['y_min'], help='Y-axis min.')
+    parser.add_argument('--y-max', type=float, default=DEFAULT_IMAGE_OPTIONS['y_max'], help='Y-axis max.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes for the samples, 0 uses all CPU cores.')
+    parser.add_argument('--image-workers', type=int, default=0,
+                        help='Processes rendering the images next to the calculation, 0 for automatic, '
+                             '1 renders them in line. Not used with --workers, each worker renders its own images.')
+    parser.add_argument('--batched-metrics', action='store_true',
+                        help='Load all samples first and calculate their metrics at once (needs more memory).')
+    parser.add_argument('--streaming-stats', action='store_true',
+                        help='Load the areas of a sample one at a time, for samples with many areas. '
+                             'The values of each area are not kept. Not used with --batched-metrics.')
+    parser.add_argument('--float32-metrics', action='store_true',
+                        help='Keep the calculated metrics as float32 (about 7 significant digits), halving their '
+                             'memory for campaigns of thousands of samples. The exported files use them too.')
+    parser.add_argument('--prefetch-depth', type=int, default=2,
+                        help='Samples read ahead by threads while one is calculated and saved, caps the memory '
+                             'of read-ahead samples. 0 reads each sample in line. Not used with --workers.')
+    parser.add_argument('--max-depth', type=int, default=1,
+                        help='Subfolder levels searched below each root folder, -1 for no limit.')
+    parser.add_argument('--discovery-threads', type=int, default=8,
+                        help='Threads listing the folders in parallel, useful on high-latency mounts.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only process samples changed since the last run, reuse the cached results of the rest.')
+    parser.add_argument('--force-rebuild', action='store_true',
+                        help='Process all samples and rewrite the cache used by --incremental.')
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """
+    Entry point of the headless batch run.
+
+    :param argv: Command-line arguments, sys.argv is used if None.
+    :return: Exit code, 1 if any root folder or sample failed.
+    """
+    args = build_arg_parser().parse_args(argv)
+    image_options = {
+        'width': args.image_width,
+        'height': args.image_height,
+        'format': args.image_format,
+        'x_min': args.x_min,
+        'x_max': args.x_max,
+        'y_min': args.y_min,
+        'y_max': args.y_max,
+    }
+    processor = BatchProcessor(args.file_naming, save_images=args.save_images, save_xlsx=args.save_xlsx,
+                               save_all=args.save_all, image_options=image_options, workers=args.workers,
+                               batched_metrics=args.batched_metrics,
+                               max_depth=args.max_depth if args.max_depth >= 0 else None,
+                               discovery_threads=args.discovery_threads, incremental=args.incremental,
+                               force_rebuild=args.force_rebuild, save_store=args.save_store,
+                               combined_format=args.combined_format, image_workers=args.image_workers,
+                               save_pdf=args.save_pdf, contact_sheet=args.contact_sheet,
+                               streaming_stats=args.streaming_stats, prefetch_depth=args.prefetch_depth,
+                               float32_metrics=args.float32_metrics)
+    failed = processor.run(args.root_folders)
+    if failed:
+        print(f'Processing failed for: {", ".join(failed)}')
+    if processor.failed_samples:
+        print(f'Failed samples: {", ".join(processor.failed_samples)}')
+    return 1 if failed or processor.failed_samples else 0
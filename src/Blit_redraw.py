@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+from matplotlib.artist import Artist
+from matplotlib.backends.backend_agg import RendererAgg
+from matplotlib.figure import Figure
+
+
+class BlitRedrawer:
+    """
+    Redraw the changing artists of a figure (data lines, bands, legend, overlays) over a cached background.
+
+    The artists given by artists() are animated, so a full draw renders the static part of the figure (axes,
+    ticks, labels), which is cached, then the artists on top of it. A request() then restores the cached
+    background and draws only the artists, instead of drawing the whole figure again. Requests made before the
+    redraw runs, e.g. by hide_all for each line, are coalesced into a single redraw.
+
+    The overlay (the legend) is drawn on top of the artists. Drawing a legend of hundreds of samples, and
+    placing it at the 'best' location, costs more than the lines, so it is rendered once into an image, which
+    is pasted on each redraw until the overlay is changed or replaced.
+
+    Changes of the static part (zoom, new axis limits, resize) still need canvas.draw_idle(), which also renews
+    the cache. Without a cache or blitting support, request() falls back to draw_idle(). The listeners are called
+    after each redraw, e.g. to copy the finished plot for a crosshair.
+
+    :param fig: Figure to redraw.
+    :param artists: Returns the artists to redraw, in drawing order, called on each redraw.
+    :param overlay: Returns the artist drawn on top of them, e.g. the legend.
+    """
+
+    def __init__(self, fig: Figure, artists: Callable[[], Iterable[Artist]],
+                 overlay: Callable[[], Optional[Artist]] = lambda: None):
+        self.fig = fig
+        self.artists = artists
+        self.overlay = overlay
+        self.overlay_image: Optional[Tuple[Artist, int, int, np.ndarray]] = None  # Overlay, x, y, RGBA image
+        self.background = None
+        self.background_size: Optional[Tuple[float, float]] = None
+        self.pending = False
+        self.listeners: List[Callable[[], None]] = []
+        self.redraws = 0  # Blitted redraws, for benchmarks
+        self.timer = fig.canvas.new_timer(interval=0)
+        self.timer.single_shot = True
+        self.timer.add_callback(self.redraw)
+        fig.canvas.mpl_connect('draw_event', self.on_draw)
+        self._animated_artists()
+
+    def _animated_artists(self) -> list:
+        artists = sorted(self.artists(), key=lambda artist: artist.get_zorder())
+        overlay = self.overlay()
+        for artist in artists + [overlay] * (overlay is not None):
+            artist.set_animated(True)
+        return artists
+
+    def _draw_overlay(self) -> None:
+        """ Paste the image of the overlay, rendered first if the overlay changed. """
+        overlay = self.overlay()
+        if overlay is None or not overlay.get_visible():
+            return
+        if self.overlay_image is None or self.overlay_image[0] is not overlay or overlay.stale:
+            width, height = self.fig.canvas.get_width_height(physical=True)
+            renderer = RendererAgg(width, height, self.fig.dpi)
+            overlay.draw(renderer)
+            # Crop to the drawn pixels, the buffer's rows go down from the top and draw_image takes them up
+            buffer = np.asarray(renderer.buffer_rgba())
+            rows, columns = np.nonzero(buffer[:, :, 3].any(axis=1))[0], np.nonzero(buffer[:, :, 3].any(axis=0))[0]
+            if rows.size == 0:
+                return
+            x0, y0 = columns[0], height - 1 - rows[-1]
+            image = buffer[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1][::-1].copy()
+            self.overlay_image = (overlay, x0, y0, image)
+            overlay.stale = False
+        _, x0, y0, image = self.overlay_image
+        renderer = self.fig.canvas.get_renderer()
+        gc = renderer.new_gc()
+        renderer.draw_image(gc, x0, y0, image)
+        gc.restore()
+
+    def on_draw(self, event) -> None:
+        """ After a full draw: cache the background, then draw the artists on it. """
+        canvas = self.fig.canvas
+        if canvas.supports_blit:
+            self.background = canvas.copy_from_bbox(self.fig.bbox)
+            self.background_size = (self.fig.bbox.width, self.fig.bbox.height)
+        for artist in self._animated_artists():
+            if artist.get_visible():
+                artist.draw(event.renderer)
+        overlay = self.overlay()
+        if overlay is not None and overlay.get_visible():
+            overlay.draw(event.renderer)
+        if canvas.supports_blit:
+            for listener in self.listeners:
+                listener()
+
+    def request(self) -> None:
+        """ Redraw the artists on the next idle moment of the GUI loop, once for all the requests until then. """
+        self._animated_artists()  # New artists must not be drawn into the background
+        if not self.pending:
+            self.pending = True
+            self.timer.start()
+
+    def redraw(self) -> None:
+        """ Redraw the artists now over the cached background, or the whole figure if there is none. """
+        self.pending = False
+        canvas = self.fig.canvas
+        if self.background is None or self.background_size != (self.fig.bbox.width, self.fig.bbox.height):
+            canvas.draw_idle()
+            return
+        canvas.restore_region(self.background)
+        for artist in self._animated_artists():
+            if artist.get_visible():
+                self.fig.draw_artist(artist)
+        self._draw_overlay()
+        canvas.blit(self.fig.bbox)
+        self.redraws += 1
+        for listener in self.listeners:
+            listener()
@@ -1,51 +1,323 @@
 from __future__ import annotations
 
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import date
+from multiprocessing import get_context
+from typing import Dict, List, Tuple
 
 import numpy as np
 import pandas as pd
 from numpy import ndarray
 from tqdm import tqdm
 
-from src.Save_results_img import SavePlotsImg
+from src.Archive_reader import output_folder
+from src.Campaign_metrics import group_by_wavelength_grid, pack_samples, calculate_metrics_batched
+from src.Folder_scanner import SpectroscopyFolderScanner
+from src.Manifest import SampleManifest
+from src.Sample_prefetcher import SamplePrefetcher
+from src.Sample_record import SampleRecord
+from src.Save_results_img import SavePlotsImg, ImageExporter, ImageSettings
+from src.Spectra_loader import load_area_matrix, load_spectrum, ReferenceSpectrumCache
+from src.Streaming_stats import SampleAccumulator
 
 
 class ProcessSpectroscopyData:
-    def __init__(self, parent):
+    def __init__(self, parent, reference_cache: ReferenceSpectrumCache = None):
         self.parent = parent
         self.data = self.parent.data_folders
         self.file_naming = self.parent.file_naming
+        self.reference_cache = reference_cache if reference_cache is not None else ReferenceSpectrumCache()
+        self.failed_samples: Dict[str, str] = {}
+        self.cancelled_samples: List[str] = []  # Samples left out because the run was cancelled
+        self.image_exporter: ImageExporter | None = None
 
     def process_samples(self):
         """
         Process each sample in self.data_folders and perform calculations.
+
+        With parent.batched_metrics the metrics of all samples are calculated at once, otherwise with more than
+        one worker (parent.workers) the samples are spread over a process pool.
+        With parent.incremental, samples unchanged since the last run (see SampleManifest) are not processed again,
+        their cached metrics are loaded instead. parent.force_rebuild ignores the previous run.
+        Otherwise the next parent.prefetch_depth samples are read by threads while a sample is processed.
+        With parent.streaming_stats the areas of a sample are loaded one at a time (see accumulate_areas), except
+        with parent.batched_metrics which needs all areas at once.
+        The progress is sent to parent.report_progress. If parent.cancel_requested() becomes true, the run stops
+        after the samples being processed, the others are removed and listed in self.cancelled_samples.
+        """
+        if not self.parent.incremental:
+            self._process_pending_samples()
+            return
+
+        manifest = SampleManifest(self.parent.root_folder_path)
+        if self.parent.force_rebuild:
+            manifest.clear()
+        settings = self.run_settings()
+        all_samples = self.data
+        pending = {}
+        for sample_name, sample in all_samples.items():
+            if manifest.is_up_to_date(sample_name, sample, settings):
+                sample.update(manifest.load_metrics(sample_name))
+            else:
+                pending[sample_name] = sample
+        print(f'{len(all_samples) - len(pending)} unchanged sample(s) loaded from the cache, '
+              f'{len(pending)} to process')
+
+        # The inner dicts are shared, so results written to self.data end up in all_samples. Failed and
+        # cancelled samples are removed from pending, so its names are kept aside
+        pending_names = list(pending)
+        self.data = pending
+        try:
+            if pending:
+                self._process_pending_samples()
+        finally:
+            self.data = all_samples
+        for sample_name in pending_names:
+            if sample_name not in pending:
+                del all_samples[sample_name]
+            elif sample_name not in self.failed_samples:  # Its images failed, so it is processed again next run
+                manifest.record(sample_name, all_samples[sample_name], settings)
+        manifest.save()
+
+    def _process_pending_samples(self) -> None:
+        """
+        Process all samples of self.data in the way selected by the parent's options.
+
+        Except with worker processes for the samples, the images are handed to an ImageExporter, so they are
+        rendered by parent.image_workers processes while the next samples are calculated.
         """
+        if not self.parent.batched_metrics and self.parent.workers > 1 and len(self.data) > 1:
+            self.process_samples_parallel(self.parent.workers)
+            return
 
-        for sample_name in tqdm(self.data.keys(), desc="Processing Samples", colour='blue'):
-            paths = self.data[sample_name]
-            # Load data for T1 and T3, splitting into wavelengths and measurements
-            t1 = pd.read_csv(paths['t1'], sep=",", header=1).values.ravel()
-            t3 = pd.read_csv(paths['t3'], sep=",", header=1).values.ravel()
-            measurements_t1 = t1[1::2]  # Measurements are at odd indices
-            measurements_t3 = t3[1::2]
+        if self.parent.save_images_flag:
+            # The images are counted beside the calculation as they are saved, see ProgressWindow
+            self.image_exporter = ImageExporter(
+                ImageSettings.from_options(self.parent.image_options),
+                resolve_image_workers(self.parent.image_workers, len(self.data)),
+                lambda done, submitted: self.parent.report_progress('Saving images', done, submitted, background=True))
+        try:
+            if self.parent.batched_metrics:
+                self.process_samples_batched()
+            elif self.parent.streaming_stats:
+                # The areas are read one at a time, reading whole samples ahead would defeat the constant memory
+                for index, sample_name in enumerate(tqdm(self.data.keys(), desc="Processing Samples",
+                                                         colour='blue')):
+                    if self.parent.cancel_requested():
+                        break
+                    self.process_sample(sample_name)
+                    self.parent.report_progress('Processing samples', index + 1, len(self.data))
+                print(self.reference_cache.report())
+            else:
+                prefetcher = SamplePrefetcher(self.data.keys(), self.load_sample, self.parent.prefetch_depth)
+                for index, (sample_name, loaded) in enumerate(tqdm(prefetcher, desc="Processing Samples",
+                                                                   colour='blue')):
+                    if self.parent.cancel_requested():
+                        break
+                    self.process_sample(sample_name, loaded)
+                    self.parent.report_progress('Processing samples', index + 1, len(self.data))
+                print(self.reference_cache.report())
+                print(prefetcher.report())
+        finally:
+            if self.image_exporter is not None:
+                exporter, self.image_exporter = self.image_exporter, None
+                with exporter.lock:
+                    done, submitted = exporter.done, exporter.submitted
+                if done < submitted:  # The wait for the last images becomes the current stage
+                    self.parent.report_progress('Saving images', done, submitted)
+                # A sample whose images failed is listed, its metrics are still exported and plotted
+                self.failed_samples.update(exporter.finish())
+            self.drop_cancelled_samples()
 
-            # Extract wavelength from the first t2 file, assuming it's the first column
-            self.data[sample_name]['Wavelength'] = t1[::2]
+    def drop_cancelled_samples(self) -> None:
+        """ Remove the samples which were not processed because the run was cancelled. """
+        if not self.parent.cancel_requested():
+            return
+        self.cancelled_samples.extend(sample_name for sample_name, sample in self.data.items()
+                                      if 'Transmittance_Avg' not in sample)
+        for sample_name in self.cancelled_samples:
+            self.data.pop(sample_name, None)
+        print(f'Run cancelled, {len(self.cancelled_samples)} sample(s) were not processed')
+
+    def run_settings(self) -> Dict:
+        """ The settings which change the results or the outputs of a sample. """
+        settings = {
+            'file_naming': self.file_naming,
+            'save_images': bool(self.parent.save_images_flag),
+            'save_xlsx': bool(self.parent.save_xlsx_flag),
+            'image_options': dict(self.parent.image_options) if self.parent.save_images_flag else None,
+        }
+        if self.parent.streaming_stats:  # No values per area, so a cached full run stays valid without it
+            settings['streaming_stats'] = True
+        if self.parent.float32_metrics:
+            settings['float32_metrics'] = True
+        return settings
+
+    def load_sample(self, sample_name: str) -> Tuple[ndarray, ndarray, ndarray, ndarray]:
+        """
+        Load the measurements of a sample and store its wavelengths.
+
+        :param sample_name: str - Name of the sample.
+        :return: T1 and T3 of shape (wavelengths,), T2 and T4 of shape (wavelengths, areas), Fortran-ordered.
+        """
+        paths = self.data[sample_name]
+        # Load data for T1 and T3, the wavelength is taken from T1. References shared by several
+        # samples are parsed only once
+        wavelength, measurements_t1 = self.reference_cache.load(paths['t1'])
+        _, measurements_t3 = self.reference_cache.load(paths['t3'])
+        self.data[sample_name]['Wavelength'] = wavelength
+
+        # Load T2 and T4, one column per measurement area, each file parsed straight into its column
+        t2 = load_area_matrix(paths['t2'])
+        t4 = load_area_matrix(paths['t4'])
+        return measurements_t1, t2, measurements_t3, t4
+
+    def accumulate_areas(self, sample_name: str, accumulator: SampleAccumulator = None) -> SampleAccumulator:
+        """
+        Calculate the metrics of a sample with running statistics, loading one T2/T4 area pair at a time, so the
+        memory does not grow with the number of areas. The values of each area are not kept.
+
+        The results equal calculate_metrics (population standard deviation) up to floating point rounding.
+
+        :param sample_name: str - Name of the sample.
+        :param accumulator: Statistics of the first areas of the sample, from a previous call or restored with
+            SampleAccumulator.from_state. Only the areas after accumulator.n_areas are loaded and added.
+        :return: The accumulator, holding all areas of the sample.
+        """
+        paths = self.data[sample_name]
+        if len(paths['t2']) != len(paths['t4']):
+            raise ValueError(f"{sample_name} has {len(paths['t2'])} T2 but {len(paths['t4'])} T4 files")
+        if accumulator is None:
+            wavelength, measurements_t1 = self.reference_cache.load(paths['t1'])
+            _, measurements_t3 = self.reference_cache.load(paths['t3'])
+            accumulator = SampleAccumulator(wavelength, measurements_t1, measurements_t3)
+        for t2_file, t4_file in zip(paths['t2'][accumulator.n_areas:], paths['t4'][accumulator.n_areas:]):
+            accumulator.add_area(load_spectrum(t2_file)[1], load_spectrum(t4_file)[1])
+        self.data[sample_name].update(accumulator.metrics())
+        return accumulator
+
+    def save_sample_results(self, sample_name: str) -> None:
+        """
+        Save the images and the xlsx of a sample, as selected by the parent's flags. The saved files are listed
+        in the sample's 'outputs'.
+
+        :param sample_name: str - Name of the sample.
+        """
+        outputs = []
+        if self.parent.save_images_flag:
+            if self.image_exporter is not None:
+                outputs.extend(self.image_exporter.submit(sample_name, self.data[sample_name]))
+            else:
+                outputs.extend(SavePlotsImg(self, sample_name).saved_paths)
+        if self.parent.save_xlsx_flag:
+            outputs.append(self.save_results_xlsx(sample_name))
+        self.data[sample_name]['outputs'] = outputs
 
-            # Load and process T2 and T4
-            t2_data_frames = [pd.read_csv(file, sep=",", header=1) for file in paths['t2']]
-            t4_data_frames = [pd.read_csv(file, sep=",", header=1) for file in paths['t4']]
-            t2 = np.concatenate([df.iloc[:, 1:].values for df in t2_data_frames], axis=1)
-            t4 = np.concatenate([df.iloc[:, 1:].values for df in t4_data_frames], axis=1)
+    def process_sample(self, sample_name: str, loaded: Tuple[ndarray, ndarray, ndarray, ndarray] = None) -> None:
+        """
+        Load, calculate and save the results of a single sample.
+
+        :param sample_name: str - Name of the sample.
+        :param loaded: The measurements returned by load_sample, if the sample was already loaded.
+        """
+        if self.parent.streaming_stats:
+            self.accumulate_areas(sample_name)
+        else:
+            t1, t2, t3, t4 = loaded if loaded is not None else self.load_sample(sample_name)
             # Perform calculations
-            self.calculate_metrics(measurements_t1, t2, measurements_t3, t4, sample_name, len(paths['t2']))
+            self.calculate_metrics(t1, t2, t3, t4, sample_name, t2.shape[1])
+        # Save results
+        self.save_sample_results(sample_name)
+
+    def process_samples_batched(self) -> None:
+        """
+        Load all samples, then calculate the metrics of all samples sharing a wavelength grid in a few vectorized
+        passes (see Campaign_metrics) and write them back per sample. Needs the whole campaign in memory.
+        """
+        loaded = {}
+        prefetcher = SamplePrefetcher(self.data.keys(), self.load_sample, self.parent.prefetch_depth)
+        for index, (sample_name, measurements) in enumerate(tqdm(prefetcher, desc="Loading Samples",
+                                                                 colour='blue')):
+            if self.parent.cancel_requested():
+                return
+            loaded[sample_name] = measurements
+            self.parent.report_progress('Loading samples', index + 1, len(self.data))
+        groups = group_by_wavelength_grid({sample_name: self.data[sample_name]['Wavelength']
+                                           for sample_name in loaded})
+        for sample_names in groups:
+            packed = pack_samples([loaded[sample_name] for sample_name in sample_names])
+            metrics = calculate_metrics_batched(*packed, keep_per_area=True)
+            n_areas = np.count_nonzero(packed[-1], axis=1)
+            for index, sample_name in enumerate(sample_names):
+                for key, values in metrics.items():
+                    if key.endswith('_Per_Area'):
+                        self.data[sample_name][key] = values[index, :n_areas[index]]
+                    else:
+                        self.data[sample_name][key] = values[index]
+        del loaded
+        print(f'Metrics of {len(self.data)} samples calculated in {len(groups)} batch(es)')
+
+        for index, sample_name in enumerate(tqdm(self.data.keys(), desc="Saving Results", colour='blue')):
+            self.save_sample_results(sample_name)
+            self.parent.report_progress('Saving results', index + 1, len(self.data))
+        print(self.reference_cache.report())
+
+    def process_samples_parallel(self, workers: int) -> None:
+        """
+        Process the samples in a pool of worker processes.
+
+        Results are merged back into self.data in its (natsorted) order. A failing sample is reported,
+        stored in self.failed_samples and removed from self.data, the other samples are still processed.
+
+        :param workers: int - Number of worker processes.
+        """
+        options = {
+            'file_naming': self.file_naming,
+            'save_images_flag': self.parent.save_images_flag,
+            'save_xlsx_flag': self.parent.save_xlsx_flag,
+            'image_options': self.parent.image_options,
+            'streaming_stats': self.parent.streaming_stats,
+            'float32_metrics': self.parent.float32_metrics,
+        }
+        results = {}
+        hits, misses = 0, 0
+        # 'spawn' gives clean workers, a forked copy of a running Tk application is not safe to use
+        with ProcessPoolExecutor(max_workers=min(workers, len(self.data)), mp_context=get_context('spawn'),
+                                 initializer=_init_worker) as executor:
+            futures = {executor.submit(_process_sample_in_worker, sample_name, dict(self.data[sample_name]),
+                                       options): sample_name for sample_name in self.data}
+            for index, future in enumerate(tqdm(as_completed(futures), total=len(futures),
+                                                desc="Processing Samples", colour='blue')):
+                sample_name = futures[future]
+                if self.parent.cancel_requested():
+                    # Samples not started yet are dropped, the running ones still complete
+                    for pending in futures:
+                        pending.cancel()
+                if future.cancelled():
+                    self.cancelled_samples.append(sample_name)
+                    continue
+                self.parent.report_progress('Processing samples', index + 1, len(futures))
+                try:
+                    results[sample_name], (sample_hits, sample_misses) = future.result()
+                except Exception as error:  # Report the failing sample and keep going
+                    self.failed_samples[sample_name] = f'{type(error).__name__}: {error}'
+                    print(f'Processing failed for {sample_name}: {self.failed_samples[sample_name]}')
+                    continue
+                hits += sample_hits
+                misses += sample_misses
 
-            # Save results
-            if self.parent.save_images_flag:
-                SavePlotsImg(self, sample_name)
-            if self.parent.save_xlsx_flag:
-                self.save_results_xlsx(sample_name)
+        for sample_name in list(self.data):
+            if sample_name in results:
+                self.data[sample_name].update(results[sample_name])
+            else:
+                del self.data[sample_name]
+        print(f'Reference spectra cache: {hits} hits, {misses} misses '
+              f'over {min(workers, len(futures))} worker processes')
+        if self.failed_samples:
+            print(f'{len(self.failed_samples)} sample(s) failed: {", ".join(self.failed_samples)}')
+        if self.cancelled_samples:
+            print(f'Run cancelled, {len(self.cancelled_samples)} sample(s) were not processed')
 
     def calculate_metrics(self, t1: ndarray, t2: ndarray, t3: ndarray, t4: ndarray,
                           sample_name: str, num_measurement_areas: int, threshold: int | float = None) -> None:
@@ -75,13 +347,16 @@ class ProcessSpectroscopyData:
             average of haze values across all measurement areas
         - Haze Standard Deviation (Haze_Std_Dev):
             standard deviation of haze values across all measurement areas
+
+        The values of each area are kept as Transmittance_Per_Area and Haze_Per_Area.
         """
         # Calculate transmittance metrics for each measurement area
         transmittance_calculations_per_area = [100 * (t2[:, area_index] / t1)
                                                for area_index in range(num_measurement_areas)]
+        transmittance_per_area = np.vstack(transmittance_calculations_per_area)
         #
-        transmittance_avg_per_area = np.average(np.vstack(transmittance_calculations_per_area), axis=0)
-        transmittance_std_dev_per_area = np.std(np.vstack(transmittance_calculations_per_area), axis=0)
+        transmittance_avg_per_area = np.average(transmittance_per_area, axis=0)
+        transmittance_std_dev_per_area = np.std(transmittance_per_area, axis=0)
         #
         # transmittance_avg_per_area = np.average(t2, axis=1)
         # transmittance_std_dev_per_area = np.std(t2, axis=1)
@@ -97,8 +372,9 @@ class ProcessSpectroscopyData:
         # t1)) for area_index in range(num_measurement_areas)]
 
         # Calculate average, variance, and standard deviation for haze across all areas
-        aggregate_haze_avg = np.average(np.vstack(haze_calculations_per_area), axis=0)
-        aggregate_haze_std_dev = np.std(np.vstack(haze_calculations_per_area), axis=0)
+        haze_per_area = np.vstack(haze_calculations_per_area)
+        aggregate_haze_avg = np.average(haze_per_area, axis=0)
+        aggregate_haze_std_dev = np.std(haze_per_area, axis=0)
 
         # Apply a threshold to haze values
         # This is a very bad approach. Change it
@@ -111,12 +387,16 @@ class ProcessSpectroscopyData:
         self.data[sample_name]['Transmittance_Std_Dev'] = transmittance_std_dev_per_area
         self.data[sample_name]['Haze_Avg'] = aggregate_haze_avg
         self.data[sample_name]['Haze_Std_Dev'] = aggregate_haze_std_dev
+        # Values of each area, shape (areas, wavelengths)
+        self.data[sample_name]['Transmittance_Per_Area'] = transmittance_per_area
+        self.data[sample_name]['Haze_Per_Area'] = haze_per_area
 
-    def save_results_xlsx(self, sample_name: str) -> None:
+    def save_results_xlsx(self, sample_name: str) -> str:
         """
         Save the calculated metrics to an Excel file.
 
         :param sample_name: str - Name of the sample.
+        :return: str - Path of the saved file.
         """
         # Assuming metrics are stored in self.data[sample_name]
         metrics = self.data[sample_name]
@@ -131,6 +411,56 @@ class ProcessSpectroscopyData:
         })
 
         # Save DataFrame to Excel
-        excel_file_path = os.path.join(self.data[sample_name]['path'], f'{date.today()}_{sample_name}_data.xlsx')
+        excel_file_path = os.path.join(output_folder(self.data[sample_name]['path']),
+                                       f'{date.today()}_{sample_name}_data.xlsx')
         df.to_excel(excel_file_path, index=False)
         print(f'File was saved for {sample_name} in {excel_file_path}')
+        return excel_file_path
+
+
+def resolve_image_workers(image_workers: int, n_samples: int) -> int:
+    """
+    Number of processes rendering the images.
+
+    :param image_workers: Requested number, 0 for automatic (up to 4, one core is left for the calculation).
+    :param n_samples: Number of samples with images to save.
+    :return: The number of processes, 1 means rendering on the calling thread.
+    """
+    if image_workers <= 0:
+        image_workers = min(4, max(1, (os.cpu_count() or 1) - 1))
+    return max(1, min(image_workers, n_samples))
+
+
+# Reference cache of a worker process, it lives as long as the process and is shared by all its samples
+_worker_reference_cache: ReferenceSpectrumCache | None = None
+
+
+def _init_worker() -> None:
+    """ Pin the workers to the non-interactive backend and create their reference cache. """
+    global _worker_reference_cache
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')
+    _worker_reference_cache = ReferenceSpectrumCache()
+
+
+def _process_sample_in_worker(sample_name: str, sample: Dict, options: Dict) -> Tuple[Dict, Tuple[int, int]]:
+    """
+    Process a single sample in a worker process.
+
+    :param sample_name: Name of the sample.
+    :param sample: Dict with the T1-T4 paths and the sample folder path.
+    :param options: File naming, save flags and image options of the run.
+    :return: The sample dict with the calculated metrics and the (hits, misses) of the reference cache.
+    """
+    parent = SpectroscopyFolderScanner(options['file_naming'])
+    parent.save_images_flag = options['save_images_flag']
+    parent.save_xlsx_flag = options['save_xlsx_flag']
+    parent.image_options = options['image_options']
+    parent.streaming_stats = options['streaming_stats']
+    parent.float32_metrics = options['float32_metrics']
+    parent.data_folders = {sample_name: SampleRecord(sample, parent.float32_metrics)}
+    hits, misses = _worker_reference_cache.hits, _worker_reference_cache.misses
+    calculator = ProcessSpectroscopyData(parent, _worker_reference_cache)
+    calculator.process_sample(sample_name)
+    return (calculator.data[sample_name],
+            (_worker_reference_cache.hits - hits, _worker_reference_cache.misses - misses))
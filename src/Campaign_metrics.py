@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+
+def group_by_wavelength_grid(wavelengths: Dict[str, ndarray]) -> List[List[str]]:
+    """
+    Group samples measured on exactly the same wavelength grid.
+
+    :param wavelengths: Dict with sample names as keys and their wavelength arrays as values.
+    :return: Lists of sample names sharing a grid, in the order of their first appearance.
+    """
+    groups: Dict[bytes, List[str]] = {}
+    for sample_name, wavelength in wavelengths.items():
+        groups.setdefault(np.ascontiguousarray(wavelength, dtype=np.float64).tobytes(), []).append(sample_name)
+    return list(groups.values())
+
+
+def pack_samples(samples: List[Tuple[ndarray, ndarray, ndarray, ndarray]]) -> Tuple[ndarray, ...]:
+    """
+    Pack the measurements of samples sharing a wavelength grid into 3-D arrays.
+
+    :param samples: List of (t1, t2, t3, t4) per sample. t1 and t3 have shape (wavelengths,), t2 and t4 have
+        shape (wavelengths, areas) as loaded by ProcessSpectroscopyData.
+    :return: t1 and t3 of shape (samples, wavelengths), t2 and t4 of shape (samples, max areas, wavelengths)
+        padded with NaN, and the (samples, max areas) mask of the measured areas.
+    """
+    n_samples = len(samples)
+    n_wavelengths = samples[0][0].shape[0]
+    max_areas = max(t2.shape[1] for _, t2, _, _ in samples)
+
+    t1 = np.empty((n_samples, n_wavelengths))
+    t3 = np.empty((n_samples, n_wavelengths))
+    t2 = np.full((n_samples, max_areas, n_wavelengths), np.nan)
+    t4 = np.full((n_samples, max_areas, n_wavelengths), np.nan)
+    mask = np.zeros((n_samples, max_areas), dtype=bool)
+    for index, (sample_t1, sample_t2, sample_t3, sample_t4) in enumerate(samples):
+        n_areas = sample_t2.shape[1]
+        t1[index] = sample_t1
+        t3[index] = sample_t3
+        t2[index, :n_areas] = sample_t2.T
+        t4[index, :n_areas] = sample_t4.T
+        mask[index, :n_areas] = True
+    return t1, t2, t3, t4, mask
+
+
+def calculate_metrics_batched(t1: ndarray, t2: ndarray, t3: ndarray, t4: ndarray, mask: ndarray,
+                              threshold: int | float = None, block_size: int = 16,
+                              keep_per_area: bool = False) -> Dict[str, ndarray]:
+    """
+    Calculate transmittance and haze metrics of many samples at once.
+
+    Uses the same formulas as ProcessSpectroscopyData.calculate_metrics (haze by ASTM-D1003-21). Padded areas are
+    excluded through the mask, and the reductions run over the areas in the same order as np.average/np.std do on
+    a single sample, so the results are identical to the per-sample calculation.
+    The samples are processed in blocks of block_size, so the temporary arrays stay in the CPU cache.
+
+    :param t1: ndarray: Reference transmittance measurements, shape (samples, wavelengths).
+    :param t2: ndarray: Transmittance measurements, shape (samples, areas, wavelengths).
+    :param t3: ndarray: Reference haze measurements, shape (samples, wavelengths).
+    :param t4: ndarray: Haze measurements, shape (samples, areas, wavelengths).
+    :param mask: ndarray: Bool mask of the measured areas, shape (samples, areas).
+    :param threshold: float: Threshold value for average T2 below which haze is considered meaningless.
+    :param block_size: int: Number of samples calculated in one vectorized pass.
+    :param keep_per_area: bool: Also return the values of each area.
+    :return: Dict with Transmittance_Avg, Transmittance_Std_Dev, Haze_Avg and Haze_Std_Dev of shape
+        (samples, wavelengths), and with keep_per_area Transmittance_Per_Area and Haze_Per_Area of shape
+        (samples, areas, wavelengths), NaN for the padded areas.
+    """
+    metrics = {key: np.empty(t1.shape) for key in
+               ('Transmittance_Avg', 'Transmittance_Std_Dev', 'Haze_Avg', 'Haze_Std_Dev')}
+    if keep_per_area:
+        metrics['Transmittance_Per_Area'] = np.empty(t2.shape)
+        metrics['Haze_Per_Area'] = np.empty(t2.shape)
+    for start in range(0, t1.shape[0], block_size):
+        block = slice(start, start + block_size)
+        _calculate_block(t1[block], t2[block], t3[block], t4[block], mask[block],
+                         {key: values[block] for key, values in metrics.items()})
+
+    # Apply a threshold to haze values, same as the per-sample calculation
+    if threshold:
+        metrics['Haze_Avg'][metrics['Transmittance_Avg'] < threshold] = np.nan
+        metrics['Haze_Std_Dev'][metrics['Transmittance_Avg'] < threshold] = np.nan
+    return metrics
+
+
+def _calculate_block(t1: ndarray, t2: ndarray, t3: ndarray, t4: ndarray, mask: ndarray,
+                     out: Dict[str, ndarray]) -> None:
+    """ Calculate the metrics of a block of samples into the views given in out (per area too, if present). """
+    padded = ~mask[:, :, np.newaxis] if not mask.all() else None
+    counts = np.count_nonzero(mask, axis=1)[:, np.newaxis]
+    with np.errstate(invalid='ignore'):  # Padded areas are NaN and are zeroed before the reductions
+        # 100 * (t2 / t1)
+        transmittance_per_area = np.divide(t2, t1[:, np.newaxis, :])
+        transmittance_per_area *= 100
+        # 100 * (t4 / t2 - t3 / t1)
+        haze_per_area = np.divide(t4, t2)
+        haze_per_area -= (t3 / t1)[:, np.newaxis, :]
+        haze_per_area *= 100
+    if 'Transmittance_Per_Area' in out:
+        out['Transmittance_Per_Area'][...] = transmittance_per_area
+        out['Haze_Per_Area'][...] = haze_per_area
+
+    out['Transmittance_Avg'][...], out['Transmittance_Std_Dev'][...] = _masked_avg_std(transmittance_per_area,
+                                                                                       padded, counts)
+    out['Haze_Avg'][...], out['Haze_Std_Dev'][...] = _masked_avg_std(haze_per_area, padded, counts)
+
+
+def _masked_avg_std(per_area: ndarray, padded: ndarray | None, counts: ndarray) -> Tuple[ndarray, ndarray]:
+    """
+    Average and population standard deviation over the areas (axis 1), ignoring the padded areas.
+
+    Padded entries are set to zero, so they add nothing to the sums, and the sums are divided by the number of
+    measured areas. This is the arithmetic of np.average and np.std, in the same order, done in place.
+
+    :param per_area: ndarray: Values of shape (samples, areas, wavelengths), overwritten.
+    :param padded: ndarray: Bool mask of the padded areas, shape (samples, areas, 1), None if nothing is padded.
+    :param counts: ndarray: Number of measured areas per sample, shape (samples, 1).
+    :return: Average and standard deviation, shape (samples, wavelengths).
+    """
+    if padded is not None:
+        np.copyto(per_area, 0.0, where=padded)
+    avg = per_area.sum(axis=1)
+    avg /= counts
+    per_area -= avg[:, np.newaxis, :]
+    np.multiply(per_area, per_area, out=per_area)
+    if padded is not None:
+        np.copyto(per_area, 0.0, where=padded)
+    std_dev = per_area.sum(axis=1)
+    std_dev /= counts
+    np.sqrt(std_dev, out=std_dev)
+    return avg, std_dev
@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from matplotlib.axes import Axes
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.colors import to_rgba
+from matplotlib.lines import Line2D
+from numpy import ndarray
+
+# Number of samples from which the plots draw them as collections
+COLLECTION_PLOT_THRESHOLD = 50
+NO_LINE_STYLES = ('', ' ', 'None', 'none')
+NO_MARKERS = (None, '', ' ', 'None', 'none')
+
+
+def visible_index_range(wavelength: ndarray, x_min: float, x_max: float) -> Tuple[int, int]:
+    """
+    Index range of the points inside [x_min, x_max], extended by one point on each side so the lines reach the
+    edges of the axes. The grid may be ascending or descending.
+
+    :return: Start and stop indices, an empty range if no point is inside.
+    """
+    inside = np.flatnonzero((wavelength >= min(x_min, x_max)) & (wavelength <= max(x_min, x_max)))
+    if inside.size == 0:
+        return 0, 0
+    return max(inside[0] - 1, 0), min(inside[-1] + 2, len(wavelength))
+
+
+def pixel_bins(columns: ndarray, start: int, stop: int) -> ndarray:
+    """
+    Split [start, stop) into bins of consecutive points falling into the same pixel column.
+
+    :param columns: Pixel column of each point of the grid, the floor of its x in display coordinates.
+    :param start: First index of the visible range.
+    :param stop: End of the visible range.
+    :return: Start index of each bin.
+    """
+    run = columns[start:stop]
+    return start + np.concatenate([[0], np.flatnonzero(run[1:] != run[:-1]) + 1])
+
+
+def _bin_extreme_indices(block: ndarray, offsets: ndarray, reduce: np.ufunc) -> ndarray:
+    """ Index in block of the first minimum (reduce=np.fmin) or maximum of each bin of each row, NaN ignored. """
+    extremes = reduce.reduceat(block, offsets, axis=1)
+    lengths = np.diff(np.append(offsets, block.shape[1]))
+    positions = np.where(block == np.repeat(extremes, lengths, axis=1), np.arange(block.shape[1]), block.shape[1])
+    indices = np.minimum.reduceat(positions, offsets, axis=1)
+    return np.where(indices < block.shape[1], indices, offsets)  # A bin of NaN only keeps its first point
+
+
+def m4_decimation(values: ndarray, bin_starts: ndarray, stop: int) -> ndarray:
+    """
+    Indices of the points to draw for rows of values sharing a grid: the first, the minimum, the maximum and the
+    last point of each bin, in order (M4 decimation). With a bin per pixel column (see pixel_bins), the
+    decimated line covers the same pixels as the full one, including the segments joining neighbouring columns.
+
+    :param values: Values of shape (rows, points).
+    :param bin_starts: Start index of each bin, the first one is the start of the visible range.
+    :param stop: End of the visible range.
+    :return: Indices of shape (rows, kept points).
+    """
+    start = int(bin_starts[0]) if len(bin_starts) else stop
+    n_points = stop - start
+    if n_points <= 4 * len(bin_starts):
+        return np.broadcast_to(np.arange(start, stop), (values.shape[0], n_points))
+    block = values[:, start:stop]
+    offsets = bin_starts - start
+    lowest = _bin_extreme_indices(block, offsets, np.fmin)
+    highest = _bin_extreme_indices(block, offsets, np.fmax)
+    firsts = np.broadcast_to(offsets, lowest.shape)
+    lasts = np.broadcast_to(np.append(offsets[1:], n_points) - 1, lowest.shape)
+    indices = np.stack([firsts, np.minimum(lowest, highest), np.maximum(lowest, highest), lasts], axis=2)
+    return start + indices.reshape(values.shape[0], 4 * len(offsets))
+
+
+def band_envelope(wavelength: ndarray, lower: ndarray, upper: ndarray, bin_starts: ndarray, stop: int) -> ndarray:
+    """
+    Polygon of a std band over the visible range, its lower and upper edges M4 decimated (see m4_decimation).
+
+    :return: Vertices of shape (points, 2).
+    """
+    low, high = m4_decimation(np.vstack([lower, upper]), bin_starts, stop)
+    return np.column_stack([np.concatenate([wavelength[low], wavelength[high][::-1]]),
+                            np.concatenate([lower[low], upper[high][::-1]])])
+
+
+class SampleLine(Line2D):
+    """
+    Stand-in for the line of a sample drawn by SampleCollections, so ControlPanel and the legend use it like
+    the Line2D of the per-line mode. It is not added to the axes, its color, width, style, markers and
+    visibility are applied to the collections on the next draw.
+    """
+
+    def __init__(self, collections: SampleCollections, sample_name: str, color: str):
+        self.collections = None  # The setters below are called by Line2D.__init__
+        super().__init__([], [], color=color, linewidth=1, label=sample_name)
+        self.collections = collections
+
+    def _style_changed(self) -> None:
+        if self.collections is not None:
+            self.collections.invalidate(decimation=False)
+
+    def set_color(self, color) -> None:
+        super().set_color(color)
+        self._style_changed()
+
+    def set_linewidth(self, w) -> None:
+        super().set_linewidth(w)
+        self._style_changed()
+
+    def set_linestyle(self, ls) -> None:
+        super().set_linestyle(ls)
+        self._style_changed()
+
+    def set_marker(self, marker) -> None:
+        super().set_marker(marker)
+        self._style_changed()
+
+    def set_markersize(self, sz) -> None:
+        super().set_markersize(sz)
+        self._style_changed()
+
+    def set_visible(self, b) -> None:
+        super().set_visible(b)
+        self._style_changed()
+
+
+class _LineLayer(LineCollection):
+    """
+    LineCollection bringing the collections up to date before it is drawn, then drawing the markers, which are
+    not in the axes: the axes lists its artists before the collections are prepared.
+    """
+
+    def __init__(self, collections: SampleCollections, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.collections = collections
+
+    def draw(self, renderer) -> None:
+        self.collections.prepare()
+        super().draw(renderer)
+        for marker_line in self.collections.marker_lines.values():
+            if marker_line.get_visible():
+                marker_line.draw(renderer)
+
+
+class _BandLayer(PolyCollection):
+    """ PolyCollection bringing the collections up to date before it is drawn. """
+
+    def __init__(self, collections: SampleCollections, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.collections = collections
+
+    def draw(self, renderer) -> None:
+        self.collections.prepare()
+        super().draw(renderer)
+
+
+class SampleCollections:
+    """
+    Draw the lines of many samples as a single LineCollection and their std bands as a single PolyCollection.
+
+    The data is decimated for display: for the current view, each pixel column keeps the first, the minimum, the
+    maximum and the last point of the line (and of the band's lower and upper edges), so the picture matches the
+    full data with at most four vertices per column and sample. Zooming, panning or resizing decimates again on
+    the next draw. Samples sharing a wavelength grid are decimated together.
+
+    Each sample has a SampleLine (see self.lines) carrying its style, changing it is applied on the next draw,
+    so changing many samples at once costs a single update.
+
+    :param ax: Axes to draw into.
+    :param band_alpha: Opacity of the std bands.
+    """
+
+    def __init__(self, ax: Axes, band_alpha: float = 0.1):
+        self.ax = ax
+        self.band_alpha = band_alpha
+        self.data: Dict[str, Tuple[ndarray, ndarray, ndarray]] = {}  # Wavelength, average, std of each sample
+        self.lines: Dict[str, SampleLine] = {}
+        # Markers of the samples which have some, on the decimated data, drawn by the line layer
+        self.marker_lines: Dict[str, Line2D] = {}
+        self.decimated: Dict[str, Tuple[ndarray, ndarray]] = {}  # Line vertices and band polygon of each sample
+        self.decimation_key: Optional[Tuple] = None
+        self.styles_changed = True
+        self.band_layer = _BandLayer(self, [], linewidths=0)
+        self.line_layer = _LineLayer(self, [])
+        ax.add_collection(self.band_layer, autolim=False)
+        ax.add_collection(self.line_layer, autolim=False)
+
+    def add_sample(self, sample_name: str, wavelength: ndarray, avg: ndarray, std_dev: ndarray,
+                   color: str) -> SampleLine:
+        """
+        Add a sample, drawn on the next draw.
+
+        :return: The SampleLine of the sample.
+        """
+        self.lines[sample_name] = SampleLine(self, sample_name, color)
+        self.set_sample(sample_name, wavelength, avg, std_dev)
+        return self.lines[sample_name]
+
+    def set_sample(self, sample_name: str, wavelength: ndarray, avg: ndarray, std_dev: ndarray) -> None:
+        """ Replace the data of a sample, e.g. after a live update. """
+        self.data[sample_name] = (wavelength, np.asarray(avg, dtype=float), np.asarray(std_dev, dtype=float))
+        self.ax.update_datalim([(np.nanmin(wavelength), np.nanmin(avg - std_dev)),
+                                (np.nanmax(wavelength), np.nanmax(avg + std_dev))])
+        self.invalidate()
+
+    def invalidate(self, decimation: bool = True) -> None:
+        """
+        Mark the collections as outdated, they are rebuilt on the next draw.
+
+        :param decimation: The data changed, not only the styles, so decimate again.
+        """
+        if decimation:
+            self.decimation_key = None
+        self.styles_changed = True
+        self.ax.stale = True
+
+    def prepare(self) -> None:
+        """ Decimate for the current view if it changed, then rebuild the collections if anything changed. """
+        x_min, x_max = self.ax.get_xlim()
+        key = (x_min, x_max, self.ax.bbox.x0, self.ax.bbox.width)  # The pixel columns of the points
+        if key != self.decimation_key:
+            self.decimate(x_min, x_max)
+            self.decimation_key = key
+            self.styles_changed = True
+        if self.styles_changed:
+            self.apply_styles()
+            self.styles_changed = False
+
+    def decimate(self, x_min: float, x_max: float) -> None:
+        """ Decimate the lines and the bands of all samples for the x-range, on the pixel columns of the axes. """
+        grids: Dict[int, List[str]] = {}
+        for sample_name, (wavelength, _, _) in self.data.items():
+            grids.setdefault(id(wavelength), []).append(sample_name)
+        x_transform = self.ax.get_xaxis_transform()
+        self.decimated = {}
+        for sample_names in grids.values():
+            wavelength = self.data[sample_names[0]][0]
+            start, stop = visible_index_range(wavelength, x_min, x_max)
+            columns = np.floor(x_transform.transform(np.column_stack([wavelength, np.zeros_like(wavelength)]))[:, 0])
+            bin_starts = pixel_bins(columns, start, stop)
+            averages = np.vstack([self.data[sample_name][1] for sample_name in sample_names])
+            indices = m4_decimation(averages, bin_starts, stop)
+            for row, sample_name in enumerate(sample_names):
+                _, avg, std_dev = self.data[sample_name]
+                line = np.column_stack([wavelength[indices[row]], avg[indices[row]]])
+                band = band_envelope(wavelength, avg - std_dev, avg + std_dev, bin_starts, stop)
+                self.decimated[sample_name] = (line, band)
+
+    def apply_styles(self) -> None:
+        """ Rebuild the collections from the decimated data and the styles of the visible samples. """
+        segments, colors, widths, styles, bands, band_colors = [], [], [], [], [], []
+        for sample_name, line in self.lines.items():
+            if not line.get_visible():
+                continue
+            vertices, band = self.decimated[sample_name]
+            bands.append(band)
+            band_colors.append(to_rgba(line.get_color(), self.band_alpha))
+            if line.get_linestyle() not in NO_LINE_STYLES:
+                segments.append(vertices)
+                colors.append(line.get_color())
+                widths.append(line.get_linewidth())
+                styles.append(line.get_linestyle())
+        self.line_layer.set_segments(segments)
+        if segments:
+            self.line_layer.set_color(colors)
+            self.line_layer.set_linewidth(widths)
+            self.line_layer.set_linestyle(styles)
+        self.band_layer.set_verts(bands)
+        self.band_layer.set_facecolor(band_colors)
+        self.update_markers()
+
+    def update_markers(self) -> None:
+        """ Draw the markers of the visible samples which have some, on their decimated points. """
+        for sample_name, line in self.lines.items():
+            has_markers = line.get_visible() and line.get_marker() not in NO_MARKERS
+            marker_line = self.marker_lines.get(sample_name)
+            if not has_markers:
+                if marker_line is not None:
+                    marker_line.set_visible(False)
+                continue
+            if marker_line is None:
+                marker_line = Line2D([], [], linestyle='None', transform=self.ax.transData)
+                marker_line.set_figure(self.ax.figure)
+                marker_line.axes = self.ax
+                marker_line.set_clip_path(self.ax.patch)
+                self.marker_lines[sample_name] = marker_line
+            vertices = self.decimated[sample_name][0]
+            marker_line.set_data(vertices[:, 0], vertices[:, 1])
+            marker_line.set(marker=line.get_marker(), markersize=line.get_markersize(), color=line.get_color(),
+                            visible=True)
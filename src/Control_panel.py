@@ -1,11 +1,62 @@
 import tkinter as tk
-from functools import partial
+from functools import lru_cache
 from tkinter import colorchooser
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import customtkinter as ctk
+import numpy as np
 import webcolors
+from matplotlib.colors import to_hex
 from matplotlib.lines import Line2D
+from matplotlib.markers import MarkerStyle
+
+# Style changes typed into the panel are applied at most once per interval, in milliseconds
+STYLE_UPDATE_INTERVAL = 50
+DEFAULT_MARKER_SIZE = 5
+INVALID_ENTRY_COLOR = 'red'
+# Sample rows built in the panel, reused for the samples scrolled into view
+VISIBLE_SAMPLE_ROWS = 14
+LINE_STYLES = ['-', '--', '-.', ':', '']
+
+
+def parse_size(text: str) -> Optional[float]:
+    """ A line width or marker size typed by the user, None if it is not a finite number >= 0 (yet). """
+    try:
+        size = float(text.strip())
+    except ValueError:
+        return None
+    return size if 0 <= size < float('inf') else None
+
+
+@lru_cache(maxsize=None)
+def css3_colors() -> Tuple[List[str], np.ndarray]:
+    """ Names and RGB values of the CSS3 colors, built once. """
+    if hasattr(webcolors, 'CSS3_HEX_TO_NAMES'):
+        hex_to_names = webcolors.CSS3_HEX_TO_NAMES
+    else:  # webcolors >= 24.6
+        hex_to_names = {}
+        for name in webcolors.names('css3'):
+            hex_to_names.setdefault(webcolors.name_to_hex(name), name)  # 'gray' before 'grey'
+    names = list(hex_to_names.values())
+    return names, np.array([tuple(webcolors.hex_to_rgb(key)) for key in hex_to_names], dtype=float)
+
+
+@lru_cache(maxsize=1024)
+def closest_color_name(rgb: Tuple[int, int, int]) -> str:
+    """ Name of the CSS3 color nearest to an RGB color. """
+    names, values = css3_colors()
+    return names[int(np.argmin(((values - rgb) ** 2).sum(axis=1)))]
+
+
+def parse_marker(marker: str):
+    """ A marker picked in the menu, the numbers 0 to 11 are the tick and caret markers. """
+    if marker in ('None', 'none'):
+        return ''
+    try:
+        MarkerStyle(marker)
+    except ValueError:
+        return int(marker)
+    return marker
 
 
 class ControlPanel(ctk.CTkToplevel):
@@ -25,40 +76,34 @@ class ControlPanel(ctk.CTkToplevel):
         self.geometry("1090x750")
         self.main_scrollable_frame = ctk.CTkScrollableFrame(self, width=1090, height=750, orientation="horizontal")
         self.main_scrollable_frame.pack()
-        self.checkboxes: List[ctk.CTkCheckBox] = []
-        self.color_buttons: List[Tuple[ctk.CTkButton, str]] = []
-
-        self.scrollable_frame = ctk.CTkScrollableFrame(self.main_scrollable_frame, width=500, height=580)
-        self.scrollable_frame.grid(row=0, column=0, pady=10, padx=10, sticky="nsew")
-
-        for sample_name, line in self.plotter.lines.items():
-            row_frame = ctk.CTkFrame(self.scrollable_frame)
-            row_frame.pack(fill='x', padx=5, pady=2)
-
-            chk = ctk.CTkCheckBox(row_frame, text=sample_name,
-                                  command=lambda name=sample_name: self.plotter.toggle_visibility(name))
-            chk.select()
-
-            self.checkboxes.append(chk)
-            hex_color = line.get_color()
-
-            line_styles = ['-', '--', '-.', ':', '']
-            line_style_menu = ctk.CTkOptionMenu(row_frame,
-                                                values=line_styles, width=55,
-                                                command=partial(self.update_line_style, line))
-            color_button = ctk.CTkButton(row_frame, fg_color=hex_color, text=f'{self.get_color_name(hex_color)}',
-                                         command=lambda name=sample_name: self.change_line_color(name))
-
-            self.color_buttons.append((color_button, sample_name))
-
-            line_width_entry = ctk.CTkEntry(row_frame, placeholder_text='Insert line width', width=50)
-            line_width_entry.insert(tk.END, '1')
-            line_width_entry.bind('<KeyRelease>', partial(self.line_width_change, line=line))
-
-            chk.pack(side=tk.LEFT, padx=5)
-            line_style_menu.pack(side=tk.RIGHT, padx=5)
-            line_width_entry.pack(side=tk.RIGHT, padx=5)
-            color_button.pack(side=tk.RIGHT, padx=5)
+        self.entry_border_color = ctk.ThemeManager.theme['CTkEntry']['border_color']
+        # The sample list is virtual: a few rows of widgets show the samples scrolled into view
+        self.sample_names: List[str] = list(self.plotter.lines)
+        self.filtered_names: List[str] = self.sample_names
+        self.line_width_texts: Dict[str, str] = {}  # Text typed into the line width entry of each sample
+        self.first_row = 0
+        # Style changes waiting to be applied: properties of each line, and the markers of all lines
+        self.pending_styles: Dict[Line2D, Dict[str, object]] = {}
+        self.pending_markers: Optional[Tuple[object, float]] = None
+        self.applied_markers: Tuple[object, float] = ('', DEFAULT_MARKER_SIZE)
+        self.style_update_id: Optional[str] = None
+
+        self.samples_frame = ctk.CTkFrame(self.main_scrollable_frame, width=500, height=580)
+        self.samples_frame.grid(row=0, column=0, pady=10, padx=10, sticky="nsew")
+        self.samples_frame.grid_propagate(False)  # Keep its size whatever the number of rows shown
+        self.samples_frame.grid_columnconfigure(0, weight=1)
+        self.samples_frame.grid_rowconfigure(1, weight=1)
+
+        self.search_entry = ctk.CTkEntry(self.samples_frame, placeholder_text="Search samples")
+        self.search_entry.grid(row=0, column=0, columnspan=2, pady=5, padx=5, sticky="ew")
+        self.search_entry.bind('<KeyRelease>', lambda event: self.filter_rows())
+
+        self.rows_frame = ctk.CTkFrame(self.samples_frame, fg_color="transparent")
+        self.rows_frame.grid(row=1, column=0, sticky="nsew")
+        self.rows_scrollbar = ctk.CTkScrollbar(self.samples_frame, command=self.scroll_rows)
+        self.rows_scrollbar.grid(row=1, column=1, sticky="ns")
+        self.rows = [self.build_row() for _ in range(VISIBLE_SAMPLE_ROWS)]
+        self.refresh_rows()
 
         self.control_frame = ctk.CTkScrollableFrame(self.main_scrollable_frame, width=500)
         self.control_frame.grid(row=0, column=1, pady=10, padx=10, sticky="nsew")
@@ -201,32 +246,191 @@ class ControlPanel(ctk.CTkToplevel):
         )
         self.legend_position_menu.pack(side=tk.LEFT, padx=(4, 0))
 
+        # Add widgets for the crosshair readout
+        self.readout_frame = ctk.CTkFrame(self.control_frame)
+        self.readout_frame.grid(row=9, column=0, pady=10, padx=10, sticky="ew")
+        self.crosshair_var = tk.BooleanVar(value=False)
+        self.crosshair_checkbox = ctk.CTkCheckBox(self.readout_frame, text="Crosshair readout",
+                                                  variable=self.crosshair_var,
+                                                  command=lambda: self.plotter.hover.set_enabled(
+                                                      self.crosshair_var.get()))
+        self.crosshair_checkbox.pack(side=tk.TOP, anchor='w')
+        self.readout_text = ctk.CTkTextbox(self.readout_frame, height=200, wrap='none')
+        self.readout_text.pack(side=tk.TOP, fill='x', pady=(4, 0))
+        self.readout_text.configure(state='disabled')
+
+    def show_readout(self, wavelength: Optional[float], rows: List[Tuple[str, float, float]]) -> None:
+        """
+        Show the values of the visible samples under the crosshair.
+
+        :param wavelength: Wavelength under the crosshair, None to clear the readout.
+        :param rows: Sample name, average and standard deviation of each visible sample.
+        """
+        if wavelength is None:
+            text = ''
+        else:
+            width = max((len(sample_name) for sample_name, _, _ in rows), default=0)
+            lines = [f'{sample_name:<{width}}  {avg:8.2f} ± {std_dev:.2f}' for sample_name, avg, std_dev in rows]
+            text = '\n'.join([f'{wavelength:.1f} nm'] + lines)
+        self.readout_text.configure(state='normal')
+        self.readout_text.delete('1.0', tk.END)
+        self.readout_text.insert('1.0', text)
+        self.readout_text.configure(state='disabled')
+
     def toggle_legend_visibility(self):
         """Toggle the visibility of the legend."""
         if self.legend_visibility_var.get():
             self.plotter.legend.set_visible(True)
         else:
             self.plotter.legend.set_visible(False)
-        self.plotter.fig.canvas.draw_idle()
+        self.plotter.redraw.request()
 
     def change_legend_position(self, _event: str = None):
         """Change the position of the legend."""
         new_position = self.legend_position_var.get()
         self.plotter.legend.set_loc(new_position)
-        self.plotter.fig.canvas.draw_idle()
+        self.plotter.redraw.request()
+
+    def queue_style(self, line: Optional[Line2D] = None, **properties) -> None:
+        """
+        Queue style changes, applied together at the next STYLE_UPDATE_INTERVAL tick with a single redraw, so
+        typing into an entry does not redraw the plot on each key.
+
+        :param line: Line to change, with properties such as linewidth=2.
+        """
+        if line is not None:
+            self.pending_styles.setdefault(line, {}).update(properties)
+        if self.style_update_id is None:
+            self.style_update_id = self.after(STYLE_UPDATE_INTERVAL, self.apply_pending_styles)
+
+    def apply_pending_styles(self) -> None:
+        """ Apply the queued style changes, then redraw once. """
+        self.style_update_id = None
+        pending_styles, self.pending_styles = self.pending_styles, {}
+        for line, properties in pending_styles.items():
+            line.set(**properties)
+        if self.pending_markers is not None and self.pending_markers != self.applied_markers:
+            marker, size = self.pending_markers
+            for line in self.plotter.lines.values():
+                line.set(marker=marker, markersize=size)
+            self.applied_markers = self.pending_markers
+        self.pending_markers = None
+        self.plotter.redraw.request()
+
+    def validate_entry(self, entry: ctk.CTkEntry, value: Optional[float]) -> Optional[float]:
+        """ Outline an entry in red while its value is invalid. """
+        entry.configure(border_color=self.entry_border_color if value is not None else INVALID_ENTRY_COLOR)
+        return value
 
     def line_width_change(self, event, line: Line2D):
         # Get the Entry widget that fired the event
-        entry_widget = event.widget
-        # Extract the value typed by the user into the Entry widget
-        entered_value = entry_widget.get().strip()  # Using strip() to remove leading and trailing whitespace
-        line.set_linewidth(entered_value)
-        self.plotter.fig.canvas.draw_idle()
+        entry_widget = event.widget.master if isinstance(event.widget, tk.Entry) else event.widget
+        width = self.validate_entry(entry_widget, parse_size(entry_widget.get()))
+        # Compared with the queued width, so typing back the applied width cancels a change not yet applied
+        if width is not None and width != self.pending_styles.get(line, {}).get('linewidth', line.get_linewidth()):
+            self.queue_style(line, linewidth=width)
+
+    def build_row(self) -> dict:
+        """ Build the widgets of a sample row: visibility checkbox, color, line width and line style. """
+        row = {'name': None, 'frame': ctk.CTkFrame(self.rows_frame)}
+        row['checkbox'] = ctk.CTkCheckBox(row['frame'], text='',
+                                          command=lambda: self.plotter.toggle_visibility(row['name']))
+        row['style_menu'] = ctk.CTkOptionMenu(row['frame'], values=LINE_STYLES, width=55,
+                                              command=lambda style: self.update_line_style(
+                                                  self.plotter.lines[row['name']], style))
+        row['color_button'] = ctk.CTkButton(row['frame'], text='',
+                                            command=lambda: self.change_line_color(row['name']))
+        row['width_entry'] = ctk.CTkEntry(row['frame'], placeholder_text='Insert line width', width=50)
+        row['width_entry'].bind('<KeyRelease>', lambda event: self.line_width_typed(event, row['name']))
+
+        row['checkbox'].pack(side=tk.LEFT, padx=5)
+        row['style_menu'].pack(side=tk.RIGHT, padx=5)
+        row['width_entry'].pack(side=tk.RIGHT, padx=5)
+        row['color_button'].pack(side=tk.RIGHT, padx=5)
+        for widget in (row['frame'], row['checkbox'], row['color_button'], row['width_entry']):
+            widget.bind('<MouseWheel>', self.wheel_rows)
+            widget.bind('<Button-4>', self.wheel_rows)
+            widget.bind('<Button-5>', self.wheel_rows)
+        return row
+
+    def refresh_rows(self) -> None:
+        """ Show the samples scrolled into view in the rows, with the current state of their lines. """
+        for index, row in enumerate(self.rows):
+            position = self.first_row + index
+            if position >= len(self.filtered_names):
+                row['name'] = None
+                row['frame'].pack_forget()
+                continue
+            sample_name = self.filtered_names[position]
+            line = self.plotter.lines[sample_name]
+            row['name'] = sample_name
+            row['checkbox'].configure(text=sample_name)
+            if line.get_visible():
+                row['checkbox'].select()
+            else:
+                row['checkbox'].deselect()
+            hex_color = to_hex(line.get_color())
+            row['color_button'].configure(fg_color=hex_color, text=self.get_color_name(hex_color))
+            width_text = self.line_width_texts.get(sample_name, '1')
+            row['width_entry'].delete(0, tk.END)
+            row['width_entry'].insert(tk.END, width_text)
+            self.validate_entry(row['width_entry'], parse_size(width_text))
+            line_style = line.get_linestyle()
+            row['style_menu'].set(line_style if line_style in LINE_STYLES else '')
+            row['frame'].pack(fill='x', padx=5, pady=2)
+        shown = len(self.filtered_names) or 1
+        self.rows_scrollbar.set(self.first_row / shown, min(self.first_row + len(self.rows), shown) / shown)
+
+    def scroll_rows(self, action: str, amount: str, unit: str = 'units') -> None:
+        """ Scrollbar command: move the rows to a fraction of the list, or by a number of rows or pages. """
+        if action == 'moveto':
+            first_row = round(float(amount) * len(self.filtered_names))
+        else:
+            first_row = self.first_row + int(float(amount)) * (len(self.rows) if unit == 'pages' else 1)
+        first_row = max(0, min(first_row, len(self.filtered_names) - len(self.rows)))
+        if first_row != self.first_row:
+            self.first_row = first_row
+            self.refresh_rows()
+
+    def wheel_rows(self, event) -> None:
+        """ Scroll the rows with the mouse wheel. """
+        up = event.num == 4 or getattr(event, 'delta', 0) > 0
+        self.scroll_rows('scroll', -3 if up else 3)
+
+    def filter_rows(self, keep_position: bool = False) -> None:
+        """
+        Show only the samples whose name contains the search text.
+
+        :param keep_position: Keep the rows scrolled where they are, e.g. when a sample is added, instead of going
+            back to the top for a new search.
+        """
+        search = self.search_entry.get().strip().lower()
+        self.filtered_names = [name for name in self.sample_names if search in name.lower()]
+        if keep_position:
+            self.first_row = max(0, min(self.first_row, len(self.filtered_names) - len(self.rows)))
+        else:
+            self.first_row = 0
+        self.refresh_rows()
+
+    def add_sample_row(self, sample_name: str, line: Line2D) -> None:
+        """
+        Add a sample to the list, e.g. after a live update.
+
+        :param sample_name: Name of the sample.
+        :param line: Line of the sample in the plot.
+        """
+        self.sample_names.append(sample_name)
+        self.filter_rows(keep_position=True)
+
+    def line_width_typed(self, event, sample_name: str) -> None:
+        """ Remember the text of a line width entry, so it is shown again when the sample scrolls back. """
+        if sample_name is not None:
+            self.line_width_texts[sample_name] = event.widget.get().strip()
+            self.line_width_change(event, self.plotter.lines[sample_name])
 
     def update_line_style(self, line: Line2D, style: str) -> None:
         """Update the line style in the plot based on user selection."""
-        line.set_linestyle(style)
-        self.plotter.fig.canvas.draw_idle()
+        self.queue_style(line, linestyle=style)
 
     def change_line_color(self, sample_name: str) -> None:
         """
@@ -239,30 +443,19 @@ class ControlPanel(ctk.CTkToplevel):
             # Set the new color to the line in the plot
             self.plotter.lines[sample_name].set_color(new_color)
 
-            # Find and update the corresponding color button
-            for button, name in self.color_buttons:
-                if name == sample_name:
-                    button.configure(fg_color=new_color, text=self.get_color_name(new_color))
-                    break
+            self.refresh_rows()
 
-            # Redraw the canvas to update the plot
-            self.plotter.fig.canvas.draw_idle()
+            # Redraw the lines and the legend
             self.plotter.update_legend()
+            self.plotter.redraw.request()
 
     @staticmethod
     def closest_color(requested_color):
-        min_colors = {}
-        for key, name in webcolors.CSS3_HEX_TO_NAMES.items():
-            r_c, g_c, b_c = webcolors.hex_to_rgb(key)
-            rd = (r_c - requested_color[0]) ** 2
-            gd = (g_c - requested_color[1]) ** 2
-            bd = (b_c - requested_color[2]) ** 2
-            min_colors[(rd + gd + bd)] = name
-        return min_colors[min(min_colors.keys())]
+        return closest_color_name(tuple(requested_color))
 
     def get_color_name(self, requested_color_hex):
         try:
-            requested_color_rgb = webcolors.hex_to_rgb(requested_color_hex)
+            requested_color_rgb = webcolors.hex_to_rgb(to_hex(requested_color_hex))
             closest_name = self.closest_color(requested_color_rgb)
         except ValueError:
             closest_name = "Unknown color"
@@ -270,16 +463,14 @@ class ControlPanel(ctk.CTkToplevel):
 
     def set_markers(self, _event=None) -> None:
         """Set the marker style and size in the plot based on user selection."""
-        new_marker = self.marker_style_var.get() if self.marker_style_var.get() != "None" else ''
-        # Try to convert the size entry to a float; if it fails, use a default size
-        try:
-            new_size = float(self.marker_size_entry.get())
-        except ValueError:
-            new_size = 5  # Default size if the entry is not a valid float
-        for line in self.plotter.lines.values():
-            line.set_marker(new_marker)
-            line.set_markersize(new_size)
-        self.plotter.fig.canvas.draw_idle()
+        new_marker = parse_marker(self.marker_style_var.get())
+        # An empty size entry means the default size, a size being typed is not applied until it is valid
+        entered_size = self.marker_size_entry.get()
+        new_size = parse_size(entered_size) if entered_size.strip() else DEFAULT_MARKER_SIZE
+        if self.validate_entry(self.marker_size_entry, new_size) is None:
+            return
+        self.pending_markers = (new_marker, new_size)
+        self.queue_style()
 
     def zoom_x(self) -> None:
         """ Zooms in on the x-axis of the plot based on the user input in the x-axis zoom fields. """
@@ -1,20 +1,24 @@
 from __future__ import annotations
 
-import os
+import queue
+import threading
+import traceback
 from tkinter import messagebox
-from typing import Dict
 
 import customtkinter as ctk
-from natsort import natsorted
+import matplotlib.pyplot as plt
 
 from src.Calculator import ProcessSpectroscopyData
-from src.Helpers import pick_the_last_one, find_all_matches
+from src.Folder_scanner import SpectroscopyFolderScanner
+from src.Live_watcher import LiveFolderWatcher
 from src.PLot_spectroscopy_data import TransmittanceAndHazePlotter
+from src.Progress_window import ProgressWindow
+from src.Results_store import StoredRun
+from src.Save_campaign_plots import SaveCampaignPlots
 from src.Save_results_into_single_xlsx import SaveIntoSingleExcel
-from src.settings import SETTINGS
 
 
-class InitialWindow(ctk.CTk):
+class InitialWindow(ctk.CTk, SpectroscopyFolderScanner):
     """ A CustomTkinter window class that prompts the user to open a file. """
 
     def __init__(self, file_naming: str = 'file_names_conventional'):
@@ -24,21 +28,16 @@ class InitialWindow(ctk.CTk):
         :param file_naming: File naming style. Default is "conventional".
         """
         super().__init__()
-        self.t3_path_root = None
-        self.t1_path_root = None
-        self.root_folder_name = None
-        self.root_folder_path = None
-        self.common_t1_and_t3_flag = False
-        self.data_folders = {}
-        self.file_naming = file_naming
+        SpectroscopyFolderScanner.__init__(self, file_naming)
         self.title("Open File")
-        self.geometry("310x430")
-        self.minsize(310, 430)
-        self.folders_to_show = {}  # This will be a dictionary to keep track of the counts
-        self.save_images_flag = False
-        self.save_xlsx_flag = False
-        self.save_all_flag = False
-        self.add_sample_name_row_flag = False
+        self.geometry("310x600")
+        self.minsize(310, 600)
+        self.run_thread: threading.Thread | None = None
+        self.progress_window: ProgressWindow | None = None
+        self.live_flag = False  # Keep watching the folder after the run and update the plots in place
+        self.live_watcher: LiveFolderWatcher | None = None
+        self.live_queue: queue.Queue = queue.Queue()
+        self.plotters = []
         self._setup_ui()
 
     def _setup_ui(self):
@@ -122,6 +121,31 @@ class InitialWindow(ctk.CTk):
                                                         command=lambda: self.flag_setter_checkboxes('Save_all'))
         self.save_all_in_one_checkbox.grid(row=10, column=0, pady=(0, 10), padx=5)
 
+        # Save all results into a binary store, which can be reopened without the raw spectra
+        self.save_store_checkbox = ctk.CTkCheckBox(self, text="Save results store",
+                                                   command=lambda: self.flag_setter_checkboxes('save_store'))
+        self.save_store_checkbox.grid(row=10, column=1, pady=(0, 10), padx=5)
+
+        # Reuse the results of samples unchanged since the last run of the folder
+        self.incremental_checkbox = ctk.CTkCheckBox(self, text="Skip unchanged samples",
+                                                    command=lambda: self.flag_setter_checkboxes('incremental'))
+        self.incremental_checkbox.grid(row=11, column=0, columnspan=2, pady=(0, 10), padx=5)
+
+        # Plots of all samples in one PDF and contact sheets, they use the image options too
+        self.save_pdf_checkbox = ctk.CTkCheckBox(self, text="Plots in one PDF", command=self.toggle_option_widgets)
+        self.save_pdf_checkbox.grid(row=12, column=0, pady=(0, 10), padx=5)
+        self.contact_sheet_checkbox = ctk.CTkCheckBox(self, text="Contact sheets", command=self.toggle_option_widgets)
+        self.contact_sheet_checkbox.grid(row=12, column=1, pady=(0, 10), padx=5)
+
+        # Live mode, new measurements of the opened folder are processed and shown as they are written
+        self.live_checkbox = ctk.CTkCheckBox(self, text="Watch folder (live)",
+                                             command=lambda: self.flag_setter_checkboxes('live'))
+        self.live_checkbox.grid(row=13, column=0, columnspan=2, pady=(0, 10), padx=5)
+
+        # Button to reopen a past run from its results store
+        self.open_store_button = ctk.CTkButton(self, text="Open saved run", command=self.open_results_store)
+        self.open_store_button.grid(row=14, column=0, columnspan=2, pady=(0, 10))
+
         # self.add_sample_name_row_checkbox = ctk.CTkCheckBox(self, text="Sample name row",
         #                                                     command=lambda:
         #                                                     self.flag_setter_checkboxes('Add_sample_name'))
@@ -151,7 +175,9 @@ class InitialWindow(ctk.CTk):
 
     def toggle_option_widgets(self):
         self.flag_setter_checkboxes('save_images')
-        state = 'normal' if self.save_images_flag else 'disabled'
+        self.flag_setter_checkboxes('save_pdf')
+        self.flag_setter_checkboxes('contact_sheet')
+        state = 'normal' if self.plots_requested() else 'disabled'
         self.image_width_entry.configure(state=state)
         self.image_height_entry.configure(state=state)
         self.image_format_option_menu.configure(state=state)
@@ -160,131 +186,191 @@ class InitialWindow(ctk.CTk):
         self.entry_y_min.configure(state=state)
         self.entry_y_max.configure(state=state)
 
+    def plots_requested(self) -> bool:
+        """ Whether any plot export, which needs the image options, is selected. """
+        return self.save_images_flag or self.save_pdf_flag or self.contact_sheet_flag
+
+    def show_warning(self, title: str, message: str) -> None:
+        """ Show scanning warnings in a message box, from the background thread through the progress queue. """
+        if threading.current_thread() is threading.main_thread() or self.progress_queue is None:
+            messagebox.showwarning(title, message)
+        else:
+            self.progress_queue.put(('warning', title, message))
+
+    def collect_image_options(self) -> dict:
+        """
+        Read the image export options from the widgets.
+
+        :return: Dict with the image size in cm, the format and the axis limits.
+        """
+        return {
+            'width': float(self.image_width_entry.get()),
+            'height': float(self.image_height_entry.get()),
+            'format': self.image_format_option_menu.get(),
+            'x_min': float(self.entry_x_min.get()),
+            'x_max': float(self.entry_x_max.get()),
+            'y_min': float(self.entry_y_min.get()),
+            'y_max': float(self.entry_y_max.get()),
+        }
+
     def open_folder(self) -> None:
         """
-        This doc is outdated.
-        Opens a file dialog for the user to select a file, and initializes a plotter for the file.
-        If the file is already opened, increments a counter for the file name.
+        Ask for a root folder and process it in a background thread, so the window stays responsive.
+        The progress is shown in a ProgressWindow, whose Cancel button stops the run after the current sample,
+        and the plots are opened once the results are ready.
         """
+        if self.run_thread is not None and self.run_thread.is_alive():
+            return
         self.root_folder_path = None
         self.root_folder_path = ctk.filedialog.askdirectory()  # Use a file dialog to get the file path
         if self.root_folder_path is not None and self.root_folder_path != '':
-            self.root_folder_name = os.path.basename(self.root_folder_path)
-            # Check if the file is already opened and increment the counter
-            if self.root_folder_name in self.folders_to_show:
-                self.folders_to_show[self.root_folder_name] += 1
-                self.root_folder_name = f"{self.root_folder_name} {self.folders_to_show[self.root_folder_name]}"
-            else:
-                self.folders_to_show[self.root_folder_name] = 1  # Initialize the counter
+            self.stop_live_mode()
+            self.set_root_folder(self.root_folder_path)
+            if self.plots_requested():
+                self.image_options = self.collect_image_options()
 
             self.state('iconic')
 
+            self.progress_queue = queue.Queue()
+            self.cancel_event = threading.Event()
+            self.progress_window = ProgressWindow(self.root_folder_name, self.cancel_event.set)
+            self.open_button.configure(state='disabled')
+            self.run_thread = threading.Thread(target=self.run_pipeline, daemon=True)
+            self.run_thread.start()
+            self.after(100, self.poll_progress)
+
+    def run_pipeline(self) -> None:
+        """
+        Discover, calculate and export the samples of the root folder. Runs in the background thread, so it
+        must not touch any widget: everything goes to the UI through progress_queue, ending with a 'done',
+        'cancelled' or 'error' event.
+        """
+        try:
+            self.report_progress('Scanning folders')
             self.proceed_each_folder()
             self.process_and_sort_data_folders()
             data_calculator = ProcessSpectroscopyData(self)
             data_calculator.process_samples()
-            SaveIntoSingleExcel(self)
-            TransmittanceAndHazePlotter(self, 'Transmittance')
-            TransmittanceAndHazePlotter(self, 'Haze')
-
-    def proceed_each_folder(self):
+            if self.cancel_requested():
+                self.progress_queue.put(('cancelled', len(data_calculator.cancelled_samples)))
+                return
+            if self.save_all_flag:
+                self.report_progress('Saving combined results')
+                SaveIntoSingleExcel(self)
+            if self.save_pdf_flag or self.contact_sheet_flag:
+                self.report_progress('Saving plots of all samples')
+                SaveCampaignPlots(self)
+            if self.save_store_flag:
+                self.report_progress('Saving results store')
+                self.export_results_store()
+            self.progress_queue.put(('done',))
+        except Exception as error:  # Reported by the UI, the window must survive a failing run
+            traceback.print_exc()
+            self.progress_queue.put(('error', f'{type(error).__name__}: {error}'))
+
+    def poll_progress(self) -> None:
+        """ Apply the events sent by the background thread, polled every 100 ms until the run ends. """
+        try:
+            while True:
+                event = self.progress_queue.get_nowait()
+                if event[0] == 'progress':
+                    if self.progress_window.winfo_exists():
+                        self.progress_window.update_progress(*event[1:])
+                elif event[0] == 'warning':
+                    messagebox.showwarning(*event[1:])
+                else:
+                    self.finish_run(event)
+                    return
+        except queue.Empty:
+            pass
+        self.after(100, self.poll_progress)
+
+    def finish_run(self, event: tuple) -> None:
         """
-        Apply the file-picking logic to the root directory and its immediate subdirectories.
+        End a run in the UI: show its final status and open the plots of the processed samples.
 
-        :return: A dictionary with folder names as keys and dictionaries of file paths as values.
+        :param event: The final ('done',), ('cancelled', number of samples left out) or ('error', message) event.
         """
-        self.data_folders.clear()
-        self.common_t1_and_t3_flag = False
-        self.t1_path_root, self.t3_path_root = None, None
-
-        # Apply function to the root directory
-        self.data_folders[self.root_folder_name] = self.proceed_with_given_folder(self.root_folder_path)
+        self.open_button.configure(state='normal')
+        window_open = self.progress_window is not None and self.progress_window.winfo_exists()
+        if event[0] == 'error':
+            if window_open:
+                self.progress_window.finish("Failed")
+            messagebox.showerror("Error!", f"Processing failed: {event[1]}")
+            return
+        if event[0] == 'cancelled':
+            if window_open:
+                self.progress_window.finish(f"Cancelled, {event[1]} sample(s) not processed")
+            return
+        if window_open:
+            self.progress_window.finish("Done")
+        if self.data_folders:
+            self.plotters = [TransmittanceAndHazePlotter(self, 'Transmittance'),
+                             TransmittanceAndHazePlotter(self, 'Haze')]
+            if self.live_flag:
+                self.start_live_mode()
+
+    def start_live_mode(self) -> None:
+        """ Watch the opened root folder, the updated samples are applied by poll_live_updates. """
+        # A stopped watcher may still finish its last sample, into the queue of its own session
+        self.live_queue = live_queue = queue.Queue()
+        self.live_watcher = LiveFolderWatcher(self, self.root_folder_path,
+                                              lambda sample_name, sample: live_queue.put((sample_name, sample)))
+        self.live_watcher.start()
+        print(f'Watching {self.root_folder_path} for new measurements')
+        self.after(100, self.poll_live_updates)
+
+    def stop_live_mode(self) -> None:
+        """ Stop watching the previously opened folder. """
+        if self.live_watcher is not None:
+            self.live_watcher.stop()
+            self.live_watcher = None
+
+    def poll_live_updates(self) -> None:
+        """ Apply the samples updated by the watcher to the data and the open plots, every 100 ms. """
+        if self.live_watcher is None:
+            return
         try:
-            self.t1_path_root = self.data_folders[self.root_folder_name]['t1']
-            self.t3_path_root = self.data_folders[self.root_folder_name]['t3']
-            if self.t1_path_root is not None and self.t3_path_root is not None:
-                self.common_t1_and_t3_flag = True
-        except KeyError:
-            messagebox.showwarning("Warning!", "No spectroscopy data was found!")
+            while True:
+                sample_name, sample = self.live_queue.get_nowait()
+                self.data_folders[sample_name] = sample
+                for plotter in self.plotters:
+                    if plt.fignum_exists(plotter.fig.number):  # Skip the closed plot windows
+                        plotter.update_sample(sample_name)
+        except queue.Empty:
+            pass
+        self.after(100, self.poll_live_updates)
+
+    def open_results_store(self) -> None:
+        """ Reopen the plots of a past run from its results store, without reparsing the raw spectra. """
+        store_path = ctk.filedialog.askopenfilename(filetypes=[("Results store", "*.npz")])
+        if not store_path:
             return
-        # Apply function to immediate subdirectories
-        for entry in os.listdir(self.root_folder_path):
-            full_path = os.path.join(self.root_folder_path, entry)
-            if os.path.isdir(full_path):
-                picked_data = self.proceed_with_given_folder(full_path)
-                if picked_data is not None:
-                    self.data_folders[entry] = picked_data
-        return
-
-    def proceed_with_given_folder(self, folder_path) -> None | Dict:
-        """
-        Proceed each folder and call spectroscopy calculation method is applicable.
-
-        :return: Dict with the paths
-        """
-        spectroscopy_data = {}
-
-        t1_file_path = pick_the_last_one(folder_path, SETTINGS[self.file_naming][0])
-        t2_files_paths = find_all_matches(folder_path, SETTINGS[self.file_naming][1])
-        t3_file_path = pick_the_last_one(folder_path, SETTINGS[self.file_naming][2])
-        t4_files_paths = find_all_matches(folder_path, SETTINGS[self.file_naming][3])
-
-        if t1_file_path is None and t2_files_paths is None and t3_file_path is None and t4_files_paths is None:
-            return None
-
-        spectroscopy_data["t2"] = t2_files_paths
-        spectroscopy_data["t4"] = t4_files_paths
-
-        # Assign common T1 and T3 if needed and available
-        if t1_file_path and t3_file_path:
-            spectroscopy_data["t1"] = t1_file_path
-            spectroscopy_data["t3"] = t3_file_path
-        if self.common_t1_and_t3_flag:
-            if t1_file_path is None:
-                spectroscopy_data["t1"] = self.t1_path_root
-            if t3_file_path is None:
-                spectroscopy_data["t3"] = self.t3_path_root
-        spectroscopy_data['path'] = folder_path
-        return spectroscopy_data
-
-    def process_and_sort_data_folders(self):
-        """
-        Processes and sorts the data folders.
-
-        Removes any entries where:
-        - Any of t1, t2, t3, or t4 data is missing (None or empty).
-        - The number of T2 and T4 files does not match.
-
-        Sorts the remaining entries using natural sorting.
-        """
-        # Create a list of keys to remove to avoid modifying the dictionary while iterating
-        keys_to_remove = []
-
-        for sample_name, data in self.data_folders.items():
-            # Check if any key is None or T2/T4 lists are empty
-            if data.get('t1') is None or not data.get('t2') or data.get('t3') is None or not data.get('t4'):
-                keys_to_remove.append(sample_name)
-                continue
-
-            # Ensure the number of T2 and T4 files is equal
-            if len(data['t2']) != len(data['t4']):
-                raise ValueError(f"The number of T2 and T4 files does not match for sample '{sample_name}'.")
-
-        # Remove identified samples
-        for key in keys_to_remove:
-            del self.data_folders[key]
-
-        # Natural sorting of keys
-        sorted_keys = natsorted(self.data_folders.keys())
-        self.data_folders = {key: self.data_folders[key] for key in sorted_keys}
-
-        return
+        try:
+            stored_run = StoredRun(store_path)
+        except (OSError, ValueError, KeyError) as error:
+            messagebox.showerror("Error!", f"Results store could not be opened: {error}")
+            return
+        TransmittanceAndHazePlotter(stored_run, 'Transmittance')
+        TransmittanceAndHazePlotter(stored_run, 'Haze')
 
     def flag_setter_checkboxes(self, which_checkbox: str) -> None:
         if which_checkbox == 'save_images':
             self.save_images_flag = bool(self.save_images_checkbox.get())
         if which_checkbox == 'save_xlsx':
             self.save_xlsx_flag = bool(self.save_xlsx_checkbox.get())
+        if which_checkbox == 'save_pdf':
+            self.save_pdf_flag = bool(self.save_pdf_checkbox.get())
+        if which_checkbox == 'contact_sheet':
+            self.contact_sheet_flag = bool(self.contact_sheet_checkbox.get())
+        if which_checkbox == 'live':
+            self.live_flag = bool(self.live_checkbox.get())
+            if not self.live_flag:
+                self.stop_live_mode()
+        if which_checkbox == 'save_store':
+            self.save_store_flag = bool(self.save_store_checkbox.get())
+        if which_checkbox == 'incremental':
+            self.incremental = bool(self.incremental_checkbox.get())
         if which_checkbox == 'Save_all':
             self.save_all_flag = bool(self.save_all_in_one_checkbox.get())
             state_xlsx = 'normal' if self.save_all_flag else 'disabled'
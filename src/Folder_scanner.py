@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from natsort import natsorted
+
+from src.Archive_reader import display_name, output_folder
+from src.Collection_plot import COLLECTION_PLOT_THRESHOLD
+from src.Helpers import FolderIndex
+from src.Results_store import save_results_store, default_store_path
+from src.Sample_record import SampleRecord
+from src.settings import SETTINGS, DEFAULT_IMAGE_OPTIONS
+
+
+class SpectroscopyFolderScanner:
+    """
+    GUI-free discovery of the T1-T4 measurement files of a root folder and its subfolders.
+
+    Holds the state and the processing options consumed by ProcessSpectroscopyData, SavePlotsImg and
+    SaveIntoSingleExcel, so the same pipeline can be driven by the InitialWindow or headless from a batch run.
+
+    :param file_naming: File naming style. Default is "conventional".
+    """
+
+    def __init__(self, file_naming: str = 'file_names_conventional'):
+        self.t3_path_root = None
+        self.t1_path_root = None
+        self.root_folder_name = None
+        self.root_folder_path = None
+        self.common_t1_and_t3_flag = False
+        self.data_folders = {}
+        self.file_naming = file_naming
+        self.folders_to_show = {}  # This will be a dictionary to keep track of the counts
+        self.save_images_flag = False
+        self.save_xlsx_flag = False
+        self.save_all_flag = False
+        self.combined_format = 'xlsx'  # Format of the combined results file: xlsx, csv or npz
+        self.save_pdf_flag = False  # Save the plots of all samples into one multi-page PDF
+        self.contact_sheet_flag = False  # Save contact sheets tiling the plots of many samples per image
+        self.contact_sheet_grid = (5, 4)  # Rows and columns of a contact sheet
+        self.add_sample_name_row_flag = False
+        self.image_options = dict(DEFAULT_IMAGE_OPTIONS)
+        self.workers = 1  # Number of processes used to process the samples
+        self.image_workers = 0  # Number of processes rendering the images, 0 for automatic, 1 for none
+        self.batched_metrics = False  # Calculate the metrics of all samples at once
+        self.streaming_stats = False  # Running statistics over the areas, loaded one at a time
+        self.float32_metrics = False  # Store the calculated metrics of the samples as float32
+        self.prefetch_depth = 2  # Samples read ahead by threads while one is processed, 0 to read in line
+        self.collection_plot_threshold = COLLECTION_PLOT_THRESHOLD  # Samples from which plots use collections, 0 never
+        self.max_depth = 1  # Subfolder levels searched below the root, None for no limit
+        self.discovery_threads = 8  # Threads listing the folders of a level in parallel
+        self.incremental = False  # Skip samples unchanged since the last run of the root folder
+        self.force_rebuild = False  # With incremental, ignore the last run and rebuild everything
+        self.save_store_flag = False  # Save all results of a run into a binary results store
+        self.progress_queue: Optional[queue.Queue] = None  # Receives the progress events of a run, if set
+        self.cancel_event: Optional[threading.Event] = None  # Set to stop a run after the current sample
+
+    def show_warning(self, title: str, message: str) -> None:
+        """
+        Report a non-fatal problem found while scanning. Overridden by the GUI to show a message box.
+
+        :param title: Short title of the warning.
+        :param message: Warning text.
+        """
+        print(f'{title} {message}')
+
+    def report_progress(self, stage: str, done: int = 0, total: int = 0, background: bool = False) -> None:
+        """
+        Send a ('progress', stage, done, total, background) event to progress_queue, used by the GUI to follow a
+        run from another thread. Does nothing without a queue. Can be called from any thread.
+
+        :param stage: Name of the current stage.
+        :param done: Items of the stage done so far.
+        :param total: Items of the stage, 0 if unknown.
+        :param background: The stage runs beside the current one, e.g. images saved by worker processes during
+            the calculation, and does not replace it.
+        """
+        if self.progress_queue is not None:
+            self.progress_queue.put(('progress', stage, done, total, background))
+
+    def cancel_requested(self) -> bool:
+        """ Whether the run was asked to stop after the current sample. """
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def set_root_folder(self, root_folder_path: str) -> None:
+        """
+        Set the root folder to proceed and give it a unique display name.
+
+        :param root_folder_path: Path of the root folder.
+        """
+        self.root_folder_path = root_folder_path
+        self.root_folder_name = display_name(os.path.basename(os.path.normpath(self.root_folder_path)))
+        # Check if the folder is already opened and increment the counter
+        if self.root_folder_name in self.folders_to_show:
+            self.folders_to_show[self.root_folder_name] += 1
+            self.root_folder_name = f"{self.root_folder_name} {self.folders_to_show[self.root_folder_name]}"
+        else:
+            self.folders_to_show[self.root_folder_name] = 1  # Initialize the counter
+
+    def export_results_store(self) -> None:
+        """ Save the processed data folders into the results store of the root folder, if selected. """
+        if self.save_store_flag and self.data_folders:
+            save_results_store(self.data_folders, default_store_path(output_folder(self.root_folder_path)),
+                               self.root_folder_name)
+
+    def proceed_each_folder(self):
+        """
+        Apply the file-picking logic to the root directory and its subdirectories down to self.max_depth levels
+        (1 = immediate subdirectories only, None = no limit).
+
+        The folders of each level are listed in parallel by a thread pool. A folder with its own T1 and T3 is the
+        shared reference for all its subdirectories, otherwise they use the nearest ancestor's pair.
+        Subdirectories of the root are keyed by their name, deeper ones by their relative path joined with '_'.
+        A key already taken (e.g. by root/a_b and root/a/b, or by x and x.zip) gets a ' (2)', ' (3)', ... suffix.
+
+        :return: A dictionary with folder names as keys and dictionaries of file paths as values.
+        """
+        self.data_folders.clear()
+        self.common_t1_and_t3_flag = False
+        self.t1_path_root, self.t3_path_root = None, None
+
+        # Apply function to the root directory, its index also lists the subdirectories
+        root_index = self.index_folder(self.root_folder_path)
+        self.data_folders[self.root_folder_name] = self.proceed_with_given_folder(self.root_folder_path, root_index)
+        self.t1_path_root, self.t3_path_root = self.own_references(root_index)
+        if self.t1_path_root is not None and self.t3_path_root is not None:
+            self.common_t1_and_t3_flag = True
+        references = (self.t1_path_root, self.t3_path_root) if self.common_t1_and_t3_flag else (None, None)
+
+        # Apply function to the subdirectories, level by level
+        level = [(entry.path, (entry.name,), references) for entry in root_index.subfolders]
+        depth = 1
+        scanned = 1
+        self.report_progress('Scanning folders', scanned)
+        with ThreadPoolExecutor(max_workers=self.discovery_threads) as executor:
+            while level and (self.max_depth is None or depth <= self.max_depth):
+                next_level = []
+                indexes = executor.map(self.index_folder, [folder_path for folder_path, _, _ in level])
+                for (folder_path, relative_parts, references), index in zip(level, indexes):
+                    picked_data = self.proceed_with_given_folder(folder_path, index, references)
+                    sample_name = self.unique_sample_name('_'.join(relative_parts), folder_path, picked_data)
+                    if sample_name is not None:
+                        self.data_folders[sample_name] = picked_data
+                    # The nearest folder with both T1 and T3 is the reference for the deeper levels
+                    own_t1, own_t3 = self.own_references(index)
+                    child_references = (own_t1, own_t3) if own_t1 and own_t3 else references
+                    next_level.extend((entry.path, relative_parts + (entry.name,), child_references)
+                                      for entry in index.subfolders)
+                scanned += len(level)
+                self.report_progress('Scanning folders', scanned)
+                level = next_level
+                depth += 1
+
+        if not any(data is not None and data.get('t1') and data.get('t3') and data['t2'] and data['t4']
+                   for data in self.data_folders.values()):
+            self.show_warning("Warning!", "No spectroscopy data was found!")
+        return
+
+    def unique_sample_name(self, sample_name: str, folder_path: str, picked_data) -> Optional[str]:
+        """
+        The key of a sample in self.data_folders, suffixed if another folder with measurements already has it.
+        Folders without T2 files do not take a name from, nor give it to, one with measurements.
+
+        :param sample_name: Name derived from the folder's relative path.
+        :param folder_path: Path of the folder, for the warning shown by show_warning.
+        :param picked_data: Files picked in the folder.
+        :return: The key, None if the folder has nothing to store.
+        """
+        if picked_data is None:
+            return None
+        existing = self.data_folders.get(sample_name)
+        if existing is None or not existing.get('t2'):
+            return sample_name
+        if not picked_data.get('t2'):
+            return None
+        counter = 2
+        while f'{sample_name} ({counter})' in self.data_folders:
+            counter += 1
+        self.show_warning("Warning!", f'{folder_path} has the same sample name as another folder, it is saved as '
+                                      f'"{sample_name} ({counter})"')
+        return f'{sample_name} ({counter})'
+
+    def index_folder(self, folder_path: str) -> FolderIndex:
+        """
+        Index a folder in a single scan, classifying its files by the T1-T4 names of the file naming style.
+
+        :param folder_path: Path of the folder.
+        :return: The folder index.
+        """
+        return FolderIndex(folder_path, SETTINGS[self.file_naming])
+
+    def own_references(self, index: FolderIndex) -> Tuple[Optional[str], Optional[str]]:
+        """
+        The T1 and T3 files of the folder itself.
+
+        :param index: Index of the folder.
+        :return: Paths of the latest T1 and T3 files, None for a missing one.
+        """
+        return (index.pick_the_last_one(SETTINGS[self.file_naming][0]),
+                index.pick_the_last_one(SETTINGS[self.file_naming][2]))
+
+    def proceed_with_given_folder(self, folder_path, index: FolderIndex = None,
+                                  references: Tuple[Optional[str], Optional[str]] = None) -> None | SampleRecord:
+        """
+        Proceed each folder and call spectroscopy calculation method is applicable.
+
+        :param folder_path: Path of the folder.
+        :param index: Index of the folder, it is scanned if not given.
+        :param references: Shared T1 and T3 paths used where the folder has none, the root ones if not given.
+        :return: SampleRecord with the paths
+        """
+        spectroscopy_data = SampleRecord(float32_metrics=self.float32_metrics)
+        if index is None:
+            index = self.index_folder(folder_path)
+        if references is None:
+            references = (self.t1_path_root, self.t3_path_root) if self.common_t1_and_t3_flag else (None, None)
+
+        t1_file_path, t3_file_path = self.own_references(index)
+        t2_files_paths = index.find_all_matches(SETTINGS[self.file_naming][1])
+        t4_files_paths = index.find_all_matches(SETTINGS[self.file_naming][3])
+
+        if t1_file_path is None and t2_files_paths is None and t3_file_path is None and t4_files_paths is None:
+            return None
+
+        spectroscopy_data["t2"] = t2_files_paths
+        spectroscopy_data["t4"] = t4_files_paths
+
+        # Assign common T1 and T3 if needed and available
+        if t1_file_path and t3_file_path:
+            spectroscopy_data["t1"] = t1_file_path
+            spectroscopy_data["t3"] = t3_file_path
+        if references[0] and references[1]:
+            if t1_file_path is None:
+                spectroscopy_data["t1"] = references[0]
+            if t3_file_path is None:
+                spectroscopy_data["t3"] = references[1]
+        spectroscopy_data['path'] = folder_path
+        return spectroscopy_data
+
+    def process_and_sort_data_folders(self):
+        """
+        Processes and sorts the data folders.
+
+        Removes any entries where:
+        - Any of t1, t2, t3, or t4 data is missing (None or empty).
+        - The number of T2 and T4 files does not match.
+
+        Sorts the remaining entries using natural sorting.
+        """
+        # Create a list of keys to remove to avoid modifying the dictionary while iterating
+        keys_to_remove = []
+
+        for sample_name, data in self.data_folders.items():
+            # Check if any key is None or T2/T4 lists are empty
+            if data.get('t1') is None or not data.get('t2') or data.get('t3') is None or not data.get('t4'):
+                keys_to_remove.append(sample_name)
+                continue
+
+            # Ensure the number of T2 and T4 files is equal
+            if len(data['t2']) != len(data['t4']):
+                raise ValueError(f"The number of T2 and T4 files does not match for sample '{sample_name}'.")
+
+        # Remove identified samples
+        for key in keys_to_remove:
+            del self.data_folders[key]
+
+        # Natural sorting of keys
+        sorted_keys = natsorted(self.data_folders.keys())
+        self.data_folders = {key: self.data_folders[key] for key in sorted_keys}
+
+        return
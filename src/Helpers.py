@@ -1,5 +1,13 @@
+from __future__ import annotations
+
 import os
-from typing import Optional, List
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, List, Pattern
+
+from natsort import natsorted
+
+from src.Archive_reader import ARCHIVE_EXTENSION, COMPRESSED_EXTENSION, ArchiveEntry, display_name, list_folder
 
 
 def pick_the_last_one(path: str, name: str, extension: Optional[str] = '.txt') -> Optional[str]:
@@ -11,26 +19,7 @@ def pick_the_last_one(path: str, name: str, extension: Optional[str] = '.txt') -
     :param extension: File extension (default is '.txt').
     :return: The full path of the most recently created matching file, or None if no match is found.
     """
-    latest_time = 0
-    latest_file = None
-
-    # Check if the provided path is a directory
-    if not os.path.isdir(path):
-        return None
-
-    # Loop through all files in the specified directory
-    for file in os.listdir(path):
-        full_file_path = os.path.join(path, file)
-        # Check if the file name contains the specified name and has the correct extension
-        if name.lower() in file.lower() and file.endswith(extension):
-            # Get the creation time of the file
-            creation_time = os.path.getctime(full_file_path)
-            # Update latest_file if this file is newer
-            if creation_time > latest_time:
-                latest_time = creation_time
-                latest_file = full_file_path
-
-    return latest_file
+    return FolderIndex(path, [name], extension).pick_the_last_one(name)
 
 
 def find_any_match(path: str, name: str, extension: Optional[str] = '.txt') -> Optional[str]:
@@ -42,20 +31,7 @@ def find_any_match(path: str, name: str, extension: Optional[str] = '.txt') -> O
     :param extension: File extension (default is '.txt').
     :return: The full path of a matching file, or None if no match is found.
     """
-    # Check if the provided path is a directory
-    if not os.path.isdir(path):
-        return None
-
-    # Loop through all files in the specified directory
-    for file in os.listdir(path):
-        full_file_path = os.path.join(path, file)
-        # Check if the file name contains the specified name and has the correct extension
-        if name.lower() in file.lower() and file.endswith(extension):
-            # Return the first match
-            return full_file_path
-
-    # Return None if no match is found
-    return None
+    return FolderIndex(path, [name], extension).find_any_match(name)
 
 
 def find_all_matches(path: str, name: str, extension: Optional[str] = '.txt') -> List[str]:
@@ -67,17 +43,95 @@ def find_all_matches(path: str, name: str, extension: Optional[str] = '.txt') ->
     :param extension: File extension (default is '.txt').
     :return: A list of full paths of matching files, or an empty list if no match is found.
     """
-    matches = []
+    return FolderIndex(path, [name], extension).find_all_matches(name)
+
+
+@lru_cache(maxsize=None)
+def name_pattern(name: str) -> Pattern:
+    """
+    Anchored, case-insensitive pattern for a measurement name in a file name.
+
+    The name must not be glued to a preceding letter or digit, nor followed by a digit, so 'T1' matches
+    'T1.txt', 'sample_T1.txt' and 't1-2.txt', but not 'T10.txt', 'T11.txt' or 'ST1.txt'.
+
+    :param name: Base name, e.g. 'T1'.
+    :return: Compiled pattern.
+    """
+    return re.compile(rf'(?<![0-9a-z]){re.escape(name)}(?![0-9])', re.IGNORECASE)
+
+
+class FolderIndex:
+    """
+    Index of a folder built with a single os.scandir pass.
+
+    Files with the given extension are classified by the measurement names they contain, subfolders are listed,
+    and the stat results of the entries are cached, so the lookups below do not touch the file system again.
 
-    # Check if the provided path is a directory
-    if not os.path.isdir(path):
-        return matches
+    Gzip-compressed files (e.g. T2-1.txt.gz) count as files with the extension. A .zip archive is listed as a
+    subfolder named without its extension, and a path inside an archive (e.g. campaign.zip/sample1) is indexed
+    from the archive's member list, see Archive_reader.
 
-    # Loop through all files in the specified directory
-    for file in os.listdir(path):
-        full_file_path = os.path.join(path, file)
-        # Check if the file name contains the specified name and has the correct extension
-        if name.lower() in file.lower() and file.endswith(extension):
-            matches.append(full_file_path)
+    :param path: The directory path to index.
+    :param names: Base names to classify the files by, e.g. ['T1', 'T2', 'T3', 'T4'].
+    :param extension: File extension (default is '.txt').
+    """
 
-    return matches
+    def __init__(self, path: str, names: Iterable[str], extension: Optional[str] = '.txt'):
+        self.path = path
+        self.names = list(names)
+        self.files: Dict[str, List[os.DirEntry | ArchiveEntry]] = {name: [] for name in self.names}
+        self.subfolders: List[os.DirEntry | ArchiveEntry] = []
+
+        # Check if the provided path is a directory
+        if os.path.isdir(path):
+            with os.scandir(path) as entries:
+                self._classify(entries, extension)
+        else:
+            listing = list_folder(path)
+            if listing is not None:
+                self._classify([*listing[0], *listing[1]], extension)
+
+    def _classify(self, entries: Iterable[os.DirEntry | ArchiveEntry], extension: str) -> None:
+        patterns = [(name, name_pattern(name)) for name in self.names]
+        extensions = (extension, extension + COMPRESSED_EXTENSION)
+        for entry in entries:
+            if entry.is_dir():
+                self.subfolders.append(entry)
+            elif entry.name.lower().endswith(ARCHIVE_EXTENSION) and isinstance(entry, os.DirEntry):
+                self.subfolders.append(ArchiveEntry(display_name(entry.name), entry.path, True))
+            elif entry.name.endswith(extensions):
+                for name, pattern in patterns:
+                    if pattern.search(entry.name):
+                        self.files[name].append(entry)
+
+    def pick_the_last_one(self, name: str) -> Optional[str]:
+        """
+        The most recently created indexed file with a given name.
+
+        :param name: One of the names the index was built with.
+        :return: The full path of the most recently created matching file, or None if no match is found.
+        """
+        matches = self.files[name]
+        if not matches:
+            return None
+        return max(matches, key=lambda entry: entry.stat().st_ctime).path
+
+    def find_any_match(self, name: str) -> Optional[str]:
+        """
+        Any indexed file with a given name.
+
+        :param name: One of the names the index was built with.
+        :return: The full path of a matching file, or None if no match is found.
+        """
+        matches = self.files[name]
+        return matches[0].path if matches else None
+
+    def find_all_matches(self, name: str) -> List[str]:
+        """
+        All indexed files with a given name, in natural order, so T2-n pairs with T4-n whatever the order of the
+        listing (folder, archive or gzip copy).
+
+        :param name: One of the names the index was built with.
+        :return: A list of full paths of matching files, or an empty list if no match is found.
+        """
+        return natsorted(entry.path for entry in self.files[name])
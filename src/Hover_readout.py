@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from matplotlib.lines import Line2D
+from numpy import ndarray
+
+# Mouse motion is handled at most once per interval, in milliseconds
+HOVER_INTERVAL = 30
+
+
+class WavelengthIndex:
+    """
+    Sorted copy of a wavelength grid for binary searches, the spectra are usually stored from the longest
+    wavelength down.
+
+    :param wavelength: Wavelength grid of one or more samples.
+    """
+
+    def __init__(self, wavelength: ndarray):
+        self.order = np.argsort(wavelength, kind='stable')
+        self.sorted = np.asarray(wavelength)[self.order]
+
+    def nearest(self, x: float) -> int:
+        """ Index in the grid of the wavelength nearest to x, in O(log n). """
+        position = int(np.searchsorted(self.sorted, x))
+        if position == len(self.sorted) or (
+                position > 0 and x - self.sorted[position - 1] < self.sorted[position] - x):
+            position -= 1
+        return int(self.order[position])
+
+
+class HoverReadout:
+    """
+    Crosshair mode of a TransmittanceAndHazePlotter: the wavelength under the mouse is looked up in each visible
+    sample, and the averages and standard deviations there are sent to show(rows).
+
+    The lookup is a binary search in a WavelengthIndex, built once per wavelength grid and shared by the
+    samples measured on it. Motion events only record the position, which is handled once per HOVER_INTERVAL.
+    The crosshair is blitted over a copy of the plot taken after each redraw, so the samples are not redrawn
+    while the mouse moves.
+
+    :param plotter: Plotter to read out.
+    :param show: Receives the wavelength and the (sample name, average, standard deviation) of each visible
+        sample, or None when the mouse leaves the axes.
+    """
+
+    def __init__(self, plotter, show: Callable[[Optional[float], List[Tuple[str, float, float]]], None]):
+        self.plotter = plotter
+        self.show = show
+        self.ax = plotter.ax
+        self.canvas = plotter.fig.canvas
+        self.enabled = False
+        self.indexes: Dict[int, Tuple[ndarray, WavelengthIndex]] = {}  # Grid and its index, by id of the grid
+        self.background = None
+        self.background_bounds: Optional[Tuple[float, ...]] = None
+        self.position: Optional[Tuple[float, float]] = None  # Last mouse position in data coordinates
+        self.pending = False
+        # Added as plain artists, so they do not count in the data limits
+        self.v_line = Line2D([0, 0], [0, 1], transform=self.ax.get_xaxis_transform(), color='0.3', lw=0.8,
+                             animated=True, visible=False)
+        self.h_line = Line2D([0, 1], [0, 0], transform=self.ax.get_yaxis_transform(), color='0.3', lw=0.8,
+                             animated=True, visible=False)
+        self.ax.add_artist(self.v_line)
+        self.ax.add_artist(self.h_line)
+        self.timer = self.canvas.new_timer(interval=HOVER_INTERVAL)
+        self.timer.single_shot = True
+        self.timer.add_callback(self.update)
+        self.canvas.mpl_connect('motion_notify_event', self.on_motion)
+        self.canvas.mpl_connect('axes_leave_event', self.on_leave)
+        plotter.redraw.listeners.append(self.take_background)
+
+    def set_enabled(self, enabled: bool) -> None:
+        """ Turn the crosshair mode on or off. """
+        self.enabled = enabled
+        if not enabled:
+            self.on_leave()
+
+    def take_background(self) -> None:
+        """ Copy the plot without the crosshair, called after each redraw, then put the crosshair back. """
+        if self.canvas.supports_blit:
+            self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+            self.background_bounds = self.ax.bbox.bounds
+            if self.v_line.get_visible():
+                self.blit()
+
+    def on_motion(self, event) -> None:
+        if not self.enabled:
+            return
+        if event.inaxes is not self.ax or event.xdata is None:
+            self.on_leave()
+            return
+        self.position = (event.xdata, event.ydata)
+        if not self.pending:
+            self.pending = True
+            self.timer.start()
+
+    def on_leave(self, _event=None) -> None:
+        self.position = None
+        if self.v_line.get_visible():
+            self.v_line.set_visible(False)
+            self.h_line.set_visible(False)
+            self.blit()
+            self.show(None, [])
+
+    def sample_values(self, x: float) -> Tuple[Optional[float], List[Tuple[str, float, float]]]:
+        """
+        The averages and standard deviations of the visible samples at the wavelength nearest to x.
+
+        :return: Wavelength found (of the first visible sample) and (sample name, average, std) of each sample.
+        """
+        prefix = 'Transmittance' if self.plotter.plot_type == "Transmittance" else 'Haze'
+        wavelength, rows = None, []
+        for sample_name, line in self.plotter.lines.items():
+            if not line.get_visible():
+                continue
+            metrics = self.plotter.data[sample_name]
+            grid = metrics['Wavelength']
+            indexed_grid, index = self.indexes.get(id(grid), (None, None))
+            if indexed_grid is not grid:
+                index = WavelengthIndex(grid)
+                self.indexes[id(grid)] = (grid, index)
+            position = index.nearest(x)
+            if wavelength is None:
+                wavelength = float(grid[position])
+            rows.append((sample_name, float(metrics[f'{prefix}_Avg'][position]),
+                         float(metrics[f'{prefix}_Std_Dev'][position])))
+        return wavelength, rows
+
+    def update(self) -> None:
+        """ Move the crosshair to the last mouse position and show the values there. """
+        self.pending = False
+        if self.position is None:
+            return
+        x, y = self.position
+        wavelength, rows = self.sample_values(x)
+        self.v_line.set_xdata([x if wavelength is None else wavelength] * 2)
+        self.h_line.set_ydata([y, y])
+        self.v_line.set_visible(True)
+        self.h_line.set_visible(True)
+        self.blit()
+        self.show(wavelength, rows)
+
+    def blit(self) -> None:
+        if self.background is None or self.background_bounds != self.ax.bbox.bounds:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        for line in (self.v_line, self.h_line):
+            if line.get_visible():
+                self.ax.draw_artist(line)
+        self.canvas.blit(self.ax.bbox)
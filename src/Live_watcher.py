@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.Archive_reader import file_stat
+from src.Calculator import ProcessSpectroscopyData
+from src.Folder_scanner import SpectroscopyFolderScanner
+from src.Manifest import SampleManifest
+from src.Sample_record import SampleRecord
+from src.Spectra_loader import ReferenceSpectrumCache
+from src.Streaming_stats import SampleAccumulator
+
+# (path, size, mtime_ns) of every input file of a sample
+Signature = Tuple[Tuple[str, int, int], ...]
+
+
+class LiveFolderWatcher:
+    """
+    Watch a root folder during a measurement session and recalculate only the samples whose files changed.
+
+    The folder is polled, so it works on any platform and on network shares: each poll rediscovers the samples
+    (new T2-n/T4-n files, new sample folders) and compares the size and mtime of their input files with the
+    previous poll. A changed sample is processed once its files have not changed for settle_time, so files still
+    being written by the instrument are not read. A sample waits until it has as many T4 as T2 files, and a file
+    which can not be parsed yet is retried on the next change.
+
+    Only the metrics are calculated, no files are written. Each processed sample is passed to on_update. The
+    running statistics of each sample are kept, so when only new areas were added, just those are loaded.
+
+    :param scanner: Scanner whose file naming, max_depth and root folder name are used, so the root sample keeps
+        the name it has in the GUI. It is not modified.
+    :param root_folder_path: Path of the watched root folder.
+    :param on_update: Called with (sample name, sample dict with the paths and the metrics), from the thread
+        running the watcher.
+    :param poll_interval: Seconds between two polls.
+    :param settle_time: Seconds a changed sample must stay unchanged before it is processed.
+    """
+
+    def __init__(self, scanner: SpectroscopyFolderScanner, root_folder_path: str,
+                 on_update: Callable[[str, Dict], None], poll_interval: float = 0.25, settle_time: float = 0.5):
+        self.scanner = SpectroscopyFolderScanner(scanner.file_naming)
+        self.scanner.max_depth = scanner.max_depth
+        self.scanner.discovery_threads = scanner.discovery_threads
+        self.scanner.float32_metrics = scanner.float32_metrics
+        self.scanner.show_warning = lambda title, message: None  # An empty folder is normal at the start
+        self.scanner.set_root_folder(root_folder_path)
+        if scanner.root_folder_name is not None:  # Named as in the GUI, e.g. 'session 2' for a reopened folder
+            self.scanner.root_folder_name = scanner.root_folder_name
+        self.on_update = on_update
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.reference_cache = ReferenceSpectrumCache()
+        self.signatures: Dict[str, Signature] = {}  # Processed (or baseline) state of each sample
+        self.changed: Dict[str, Tuple[Signature, float]] = {}  # Changed samples: signature and when it was seen
+        self.failed: Dict[str, Signature] = {}  # Samples which could not be parsed, until they change again
+        # Running statistics of each processed sample and the (path, size, mtime) of the files they contain
+        self.accumulators: Dict[str, Tuple[Signature, SampleAccumulator]] = {}
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def discover(self) -> Dict[str, Dict]:
+        """
+        The complete samples of the root folder, as found by the scanner. Unlike process_and_sort_data_folders,
+        a sample with more T2 than T4 files is kept, it is normal while its areas are being measured.
+        The T2 and T4 files come in natural order (see FolderIndex.find_all_matches), so the areas keep their pairs
+        and their order as new ones arrive.
+        """
+        self.scanner.proceed_each_folder()
+        samples = {}
+        for sample_name, sample in self.scanner.data_folders.items():
+            if sample.get('t1') and sample.get('t3') and sample['t2'] and sample['t4']:
+                samples[sample_name] = SampleRecord(sample, self.scanner.float32_metrics)
+        return samples
+
+    @staticmethod
+    def signature(sample: Dict) -> Optional[Signature]:
+        """ Size and mtime of the input files of a sample, None if one of them disappeared. """
+        records = []
+        for path in SampleManifest.input_paths(sample):
+            try:
+                stat = file_stat(path)
+            except OSError:
+                return None
+            records.append((path, stat.st_size, stat.st_mtime_ns))
+        return tuple(records)
+
+    def set_baseline(self, process_existing: bool = False) -> None:
+        """
+        Record the current state of the folder, so only later changes are processed.
+
+        :param process_existing: Treat the existing samples as changed, so they are all processed once.
+        """
+        for sample_name, sample in self.discover().items():
+            signature = self.signature(sample)
+            if signature is None:
+                continue
+            if process_existing:
+                self.changed[sample_name] = (signature, time.monotonic())
+            else:
+                self.signatures[sample_name] = signature
+
+    def poll_once(self) -> List[str]:
+        """
+        Poll the folder once and process the changed samples which settled.
+
+        :return: Names of the processed samples.
+        """
+        now = time.monotonic()
+        samples = self.discover()
+        ready = []
+        for sample_name, sample in samples.items():
+            signature = self.signature(sample)
+            if signature is None or signature == self.signatures.get(sample_name):
+                self.changed.pop(sample_name, None)
+                continue
+            if signature == self.failed.get(sample_name):
+                continue
+            previous = self.changed.get(sample_name)
+            if previous is None or previous[0] != signature:
+                self.changed[sample_name] = (signature, now)  # Still changing, wait until it settles
+            elif now - previous[1] >= self.settle_time and len(sample['t2']) == len(sample['t4']):
+                ready.append(sample_name)
+
+        processed = []
+        for sample_name in ready:
+            if self.stop_event.is_set():
+                break
+            signature = self.changed.pop(sample_name)[0]
+            if self.process_sample(sample_name, samples[sample_name], signature):
+                self.signatures[sample_name] = signature
+                self.failed.pop(sample_name, None)
+                processed.append(sample_name)
+            else:
+                self.failed[sample_name] = signature
+        return processed
+
+    def process_sample(self, sample_name: str, sample: Dict, signature: Optional[Signature] = None) -> bool:
+        """
+        Calculate the metrics of a sample and pass it to on_update. If the files already added to the sample's
+        running statistics are unchanged, only the new areas are loaded.
+
+        :param sample_name: Name of the sample.
+        :param sample: Dict with the T1-T4 paths and the sample folder path.
+        :param signature: Signature of the sample's files, read if None.
+        :return: False if the files could not be read.
+        """
+        signature = signature if signature is not None else self.signature(sample)
+        if signature is None:
+            return False
+        accumulator = self.reusable_accumulator(sample_name, sample, signature)
+        n_reused = accumulator.n_areas if accumulator is not None else 0
+        self.scanner.data_folders = {sample_name: sample}
+        calculator = ProcessSpectroscopyData(self.scanner, self.reference_cache)
+        try:
+            accumulator = calculator.accumulate_areas(sample_name, accumulator)
+        except (OSError, ValueError, IndexError) as error:
+            self.accumulators.pop(sample_name, None)  # It may hold some areas of the failed update
+            print(f'Live update failed for {sample_name}, retried when its files change: {error}')
+            return False
+        self.accumulators[sample_name] = (self.added_files(sample, signature, accumulator.n_areas), accumulator)
+        self.on_update(sample_name, sample)
+        print(f'Live update of {sample_name} ({accumulator.n_areas} area(s), {accumulator.n_areas - n_reused} new)')
+        return True
+
+    @staticmethod
+    def added_files(sample: Dict, signature: Signature, n_areas: int) -> Signature:
+        """ Records of the references and of the first n_areas T2/T4 files of a sample, from its signature. """
+        records = {record[0]: record for record in signature}
+        paths = [sample['t1'], sample['t3'], *sample['t2'][:n_areas], *sample['t4'][:n_areas]]
+        return tuple(records[path] for path in paths)
+
+    def reusable_accumulator(self, sample_name: str, sample: Dict, signature: Signature) \
+            -> Optional[SampleAccumulator]:
+        """ The running statistics of a sample, if the files they were built from are all unchanged. """
+        if sample_name not in self.accumulators:
+            return None
+        added, accumulator = self.accumulators[sample_name]
+        if len(sample['t2']) < accumulator.n_areas:
+            return None  # Areas were removed
+        return accumulator if self.added_files(sample, signature, accumulator.n_areas) == added else None
+
+    def run(self) -> None:
+        """ Poll until stop() is called. """
+        while not self.stop_event.is_set():
+            try:
+                self.poll_once()
+            except (OSError, ValueError) as error:  # E.g. a network share briefly unavailable
+                print(f'Watching {self.scanner.root_folder_path} failed, retrying: {error}')
+            self.stop_event.wait(self.poll_interval)
+
+    def start(self, process_existing: bool = False) -> None:
+        """
+        Record the baseline and start watching in a daemon thread.
+
+        :param process_existing: Process all existing samples once, see set_baseline.
+        """
+        self.set_baseline(process_existing)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: Optional[float] = 0) -> None:
+        """
+        Stop watching. The sample being processed is finished in the background, the next ones are skipped.
+
+        :param timeout: Seconds to wait for the thread to end, None to wait until it does. The GUI does not wait,
+            so it is not frozen while a sample is being processed.
+        """
+        self.stop_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread() and timeout != 0:
+            self.thread.join(timeout)
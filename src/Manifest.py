@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.Archive_reader import file_stat, open_input, output_folder
+
+MANIFEST_FILE_NAME = '.transmittance_haze_manifest.json'
+CACHE_FOLDER_NAME = '.transmittance_haze_cache'
+MANIFEST_VERSION = 2  # Bump when the calculation changes, so every cached sample is recomputed
+METRIC_KEYS = ('Wavelength', 'Transmittance_Avg', 'Transmittance_Std_Dev', 'Haze_Avg', 'Haze_Std_Dev',
+               'Transmittance_Per_Area', 'Haze_Per_Area')
+
+
+def file_sha1(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    SHA-1 of a file's content.
+
+    :param path: Path of the file.
+    :param chunk_size: Bytes read at once.
+    :return: Hex digest.
+    """
+    digest = hashlib.sha1()
+    with open_input(path) as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SampleManifest:
+    """
+    Per-sample record of a root folder's last run, stored in the root folder, used to skip unchanged samples.
+
+    For each sample it keeps the input files with their sizes, mtimes and content hashes, the settings of the run,
+    the produced output files and the calculated metrics (in a .npz per sample). A sample is up to date when its
+    inputs, settings and outputs are unchanged. Files are hashed only when their size or mtime changed, so a
+    touched but unchanged file does not trigger a recalculation.
+
+    :param root_folder_path: Path of the root folder.
+    """
+
+    def __init__(self, root_folder_path: str):
+        root_folder_path = output_folder(root_folder_path)  # Next to the archive for an archived campaign
+        self.path = os.path.join(root_folder_path, MANIFEST_FILE_NAME)
+        self.cache_folder = os.path.join(root_folder_path, CACHE_FOLDER_NAME)
+        self.samples: Dict[str, Dict] = {}
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as file:
+                    manifest = json.load(file)
+                if manifest.get('version') == MANIFEST_VERSION:
+                    self.samples = manifest['samples']
+            except (OSError, ValueError, KeyError) as error:
+                print(f'Manifest {self.path} could not be read and is ignored: {error}')
+
+    def clear(self) -> None:
+        """ Forget all samples, so everything is rebuilt. """
+        self.samples.clear()
+
+    @staticmethod
+    def input_paths(sample: Dict) -> List[str]:
+        """ All input files of a sample, in a fixed order. """
+        return [sample['t1'], sample['t3'], *sample['t2'], *sample['t4']]
+
+    @staticmethod
+    def file_record(path: str, previous: Optional[Dict] = None) -> Dict:
+        """
+        Size, mtime and content hash of a file. The hash is reused from the previous record if the size and mtime
+        did not change.
+
+        :param path: Path of the file.
+        :param previous: The previous record of the same file.
+        :return: The record.
+        """
+        stat = file_stat(path)
+        record = {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        if previous and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+            record['sha1'] = previous['sha1']
+        else:
+            record['sha1'] = file_sha1(path)
+        return record
+
+    def is_up_to_date(self, sample_name: str, sample: Dict, settings: Dict) -> bool:
+        """
+        Check whether the sample's inputs, settings and outputs are unchanged since it was recorded.
+
+        :param sample_name: Name of the sample.
+        :param sample: Dict with the T1-T4 paths and the sample folder path.
+        :param settings: Settings of the current run.
+        :return: True if the sample can be skipped.
+        """
+        entry = self.samples.get(sample_name)
+        if entry is None or entry['settings'] != settings or entry['path'] != sample['path']:
+            return False
+        paths = self.input_paths(sample)
+        if [record['path'] for record in entry['inputs']] != paths:
+            return False
+        if not os.path.isfile(os.path.join(self.cache_folder, entry['metrics'])):
+            return False
+        if not all(os.path.exists(output) for output in entry['outputs']):
+            return False
+        try:
+            for record in entry['inputs']:
+                current = self.file_record(record['path'], record)
+                if current['sha1'] != record['sha1']:
+                    return False
+                # Touched but unchanged file, remember the new stat so it is not hashed again
+                record.update(current)
+        except OSError:
+            return False
+        return True
+
+    def load_metrics(self, sample_name: str) -> Dict[str, np.ndarray]:
+        """
+        Cached metrics of a sample.
+
+        :param sample_name: Name of the sample.
+        :return: Dict with the wavelength, the transmittance and haze averages and standard deviations and the
+            values of each area, if they were kept (not with streaming_stats).
+        """
+        with np.load(os.path.join(self.cache_folder, self.samples[sample_name]['metrics'])) as metrics:
+            return {key: metrics[key] for key in METRIC_KEYS if key in metrics.files}
+
+    def record(self, sample_name: str, sample: Dict, settings: Dict) -> None:
+        """
+        Record a processed sample, its metrics and its outputs (sample['outputs']).
+
+        :param sample_name: Name of the sample.
+        :param sample: Dict with the paths, the calculated metrics and the output files of the sample.
+        :param settings: Settings of the run.
+        """
+        os.makedirs(self.cache_folder, exist_ok=True)
+        metrics_file = hashlib.sha1(sample_name.encode('utf-8')).hexdigest()[:16] + '.npz'
+        np.savez(os.path.join(self.cache_folder, metrics_file),
+                 **{key: sample[key] for key in METRIC_KEYS if key in sample})
+        previous = {record['path']: record for record in self.samples.get(sample_name, {}).get('inputs', [])}
+        self.samples[sample_name] = {
+            'path': sample['path'],
+            'inputs': [self.file_record(path, previous.get(path)) for path in self.input_paths(sample)],
+            'settings': settings,
+            'outputs': list(sample.get('outputs', [])),
+            'metrics': metrics_file,
+        }
+
+    def save(self) -> None:
+        """ Write the manifest, replacing the previous one only once it is completely written. """
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump({'version': MANIFEST_VERSION, 'samples': self.samples}, file, indent=1)
+        os.replace(temporary_path, self.path)
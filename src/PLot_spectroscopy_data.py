@@ -2,7 +2,11 @@ import matplotlib.pyplot as plt
 from matplotlib import rcParams
 from matplotlib.ticker import AutoMinorLocator
 
+from src.Blit_redraw import BlitRedrawer
+from src.Collection_plot import COLLECTION_PLOT_THRESHOLD, SampleCollections
 from src.Control_panel import ControlPanel
+from src.Hover_readout import HoverReadout
+from src.Save_results_img import update_line_and_band
 
 
 class TransmittanceAndHazePlotter:
@@ -11,6 +15,14 @@ class TransmittanceAndHazePlotter:
 
     :param parent: Parental class containing all necessary sorted and prepared data to plot.
     :param plot_type: Which spectroscopy data to plot (transmittance or haze).
+
+    From parent.collection_plot_threshold samples on, the samples are drawn by a SampleCollections (a single
+    LineCollection and a single band collection, decimated to the pixel width) and self.lines holds their
+    SampleLine stand-ins, which the control panel and the legend use like the lines of the per-line mode.
+
+    Changes that keep the axes as they are (visibility, styles, legend, additional lines) are redrawn by
+    self.redraw, which blits the data artists over the cached axes, see BlitRedrawer. In the crosshair mode,
+    self.hover reads the values of the visible samples under the mouse into the control panel, see HoverReadout.
     """
 
     def __init__(self, parent, plot_type: str):
@@ -49,8 +61,13 @@ class TransmittanceAndHazePlotter:
         self.fig, self.ax = plt.subplots()
         self.fig.canvas.manager.set_window_title(f"{self.window_name} {self.plot_type}")
         self.lines = {}
+        self.bands = {}  # Std band of each sample
         self.additional_lines = []
+        threshold = getattr(self.parent, 'collection_plot_threshold', COLLECTION_PLOT_THRESHOLD)
+        self.collections = SampleCollections(self.ax) if threshold and len(self.data) >= threshold else None
         self._plot_initial_data()
+        self.redraw = BlitRedrawer(self.fig, self.dynamic_artists, lambda: self.legend)
+        self.hover = HoverReadout(self, lambda wavelength, rows: self.control_panel.show_readout(wavelength, rows))
         self.original_x_lim = self.ax.get_xlim()
         self.original_y_lim = self.ax.get_ylim()
         plt.gca().xaxis.set_minor_locator(AutoMinorLocator(n=2))
@@ -72,14 +89,54 @@ class TransmittanceAndHazePlotter:
                 std_dev = metrics['Haze_Std_Dev']
                 y_label = 'Haze (%)'
 
-            line, = self.ax.plot(wavelengths, avg, lw=1, label=sample_name)
-            self.lines[sample_name] = line
-            self.ax.fill_between(wavelengths, avg - std_dev, avg + std_dev, alpha=0.1)
+            self._add_sample(sample_name, wavelengths, avg, std_dev)
 
+        if self.collections is not None:
+            self.ax.autoscale_view()
         self.ax.set_xlabel('Wavelength (nm)')
         self.ax.set_ylabel(y_label)
-        self.ax.legend()
-        self.legend = self.ax.legend()
+        self.legend = self.ax.legend(list(self.lines.values()), list(self.lines))
+
+    def _add_sample(self, sample_name: str, wavelengths, avg, std_dev):
+        """ Draw the line and the std band of a new sample and return its line. """
+        if self.collections is not None:
+            colors = rcParams['axes.prop_cycle'].by_key()['color']
+            line = self.collections.add_sample(sample_name, wavelengths, avg, std_dev,
+                                               colors[len(self.lines) % len(colors)])
+        else:
+            line, = self.ax.plot(wavelengths, avg, lw=1, label=sample_name)
+            self.bands[sample_name] = self.ax.fill_between(wavelengths, avg - std_dev, avg + std_dev, alpha=0.1)
+        self.lines[sample_name] = line
+        return line
+
+    def dynamic_artists(self) -> list:
+        """ Artists redrawn over the cached axes, below the legend: the samples and the additional lines. """
+        if self.collections is not None:
+            artists = [self.collections.band_layer, self.collections.line_layer]
+        else:
+            artists = [*self.bands.values(), *self.lines.values()]
+        return artists + self.additional_lines
+
+    def update_sample(self, sample_name: str) -> None:
+        """
+        Redraw a sample from self.data in place, e.g. after a live update: its line and std band get the new
+        values, a new sample gets a line, a band and a row in the control panel.
+
+        :param sample_name: Name of the sample.
+        """
+        metrics = self.data[sample_name]
+        prefix = 'Transmittance' if self.plot_type == "Transmittance" else 'Haze'
+        wavelengths, avg, std_dev = metrics['Wavelength'], metrics[f'{prefix}_Avg'], metrics[f'{prefix}_Std_Dev']
+        if sample_name in self.lines and self.collections is not None:
+            self.collections.set_sample(sample_name, wavelengths, avg, std_dev)
+        elif sample_name in self.lines:
+            self.bands[sample_name] = update_line_and_band(self.ax, self.lines[sample_name], self.bands[sample_name],
+                                                           wavelengths, avg, std_dev)
+        else:
+            line = self._add_sample(sample_name, wavelengths, avg, std_dev)
+            self.control_panel.add_sample_row(sample_name, line)
+            self.update_legend()
+        self.redraw.request()
 
     def reset_view(self) -> None:
         """ Reset the plot view to the initial x and y-axis limits. """
@@ -103,25 +160,23 @@ class TransmittanceAndHazePlotter:
         line = self.lines[sample_name]
         line.set_visible(not line.get_visible())
         self.update_legend()
-        self.fig.canvas.draw_idle()
+        self.redraw.request()
 
     def show_all(self) -> None:
         """ Set all data lines to visible in the plot. """
         for line in self.lines.values():
             line.set_visible(True)
         self.update_legend()
-        self.fig.canvas.draw_idle()
-        for chk in self.control_panel.checkboxes:
-            chk.select()
+        self.redraw.request()
+        self.control_panel.refresh_rows()
 
     def hide_all(self) -> None:
         """ Set all data lines to hidden in the plot. """
         for line in self.lines.values():
             line.set_visible(False)
         self.update_legend()
-        self.fig.canvas.draw_idle()
-        for chk in self.control_panel.checkboxes:
-            chk.deselect()
+        self.redraw.request()
+        self.control_panel.refresh_rows()
 
     def zoom_to_x(self, x_min: float, x_max: float) -> None:
         """
@@ -151,7 +206,7 @@ class TransmittanceAndHazePlotter:
         """
         h_line = self.ax.axhline(y=y_value, **kwargs)
         self.additional_lines.append(h_line)
-        self.fig.canvas.draw_idle()
+        self.redraw.request()
 
     def draw_vertical_line(self, x_value: float, **kwargs) -> None:
         """
@@ -161,11 +216,11 @@ class TransmittanceAndHazePlotter:
         """
         v_line = self.ax.axvline(x=x_value, **kwargs)
         self.additional_lines.append(v_line)
-        self.fig.canvas.draw_idle()
+        self.redraw.request()
 
     def remove_additional_lines(self) -> None:
         """ Remove all additional lines (horizontal or vertical) from the plot. """
         while self.additional_lines:
             line = self.additional_lines.pop()
             line.remove()
-        self.fig.canvas.draw_idle()
+        self.redraw.request()
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import time
+from typing import Callable, List, Optional, Tuple
+
+import customtkinter as ctk
+
+
+class ProgressWindow(ctk.CTkToplevel):
+    """
+    Shows the progress of a run executed in a background thread: the current stage with its progress bar, the
+    progress of a stage running beside it, the time spent in each finished stage and a Cancel button.
+
+    :param title: Title of the window, e.g. the name of the root folder.
+    :param on_cancel: Called when Cancel is pressed.
+    """
+
+    def __init__(self, title: str, on_cancel: Callable[[], None]):
+        super().__init__()
+        self.title(f"{title} Progress")
+        self.geometry("380x290")
+        self.resizable(False, False)
+        self.on_cancel = on_cancel
+        self.run_started = time.perf_counter()
+        self.stage: Optional[str] = None
+        self.stage_started = self.run_started
+        self.timings: List[Tuple[str, float]] = []
+        self.background_stage: Optional[str] = None
+
+        self.stage_label = ctk.CTkLabel(self, text="Starting...", anchor='w')
+        self.stage_label.pack(fill='x', padx=10, pady=(10, 5))
+        self.progress_bar = ctk.CTkProgressBar(self, mode='determinate')
+        self.progress_bar.set(0)
+        self.progress_bar.pack(fill='x', padx=10, pady=5)
+        self.background_label = ctk.CTkLabel(self, text="", anchor='w')
+        self.background_label.pack(fill='x', padx=10)
+        self.timings_label = ctk.CTkLabel(self, text="", anchor='nw', justify='left')
+        self.timings_label.pack(fill='both', expand=True, padx=10, pady=5)
+        self.cancel_button = ctk.CTkButton(self, text="Cancel", command=self.cancel)
+        self.cancel_button.pack(pady=(5, 10))
+        self.protocol("WM_DELETE_WINDOW", self.cancel)
+
+    def update_progress(self, stage: str, done: int, total: int, background: bool = False) -> None:
+        """
+        Show a progress event, a new stage closes the timing of the previous one.
+
+        :param stage: Name of the current stage.
+        :param done: Items of the stage done so far.
+        :param total: Items of the stage, 0 if unknown.
+        :param background: The stage runs beside the current one, it is shown below it until it becomes the
+            current stage.
+        """
+        now = time.perf_counter()
+        if background and stage != self.stage:
+            self.background_stage = stage
+            self.background_label.configure(text=f"{stage}: {done}/{total}" if total else f"{stage}: {done}")
+            return
+        if stage == self.background_stage:
+            self.background_stage = None
+            self.background_label.configure(text="")
+        if stage != self.stage:
+            self._close_stage(now)
+            self.stage, self.stage_started = stage, now
+            if total:
+                self.progress_bar.configure(mode='determinate')
+                self.progress_bar.stop()
+            else:
+                self.progress_bar.configure(mode='indeterminate')
+                self.progress_bar.start()
+        if total:
+            self.progress_bar.set(done / total)
+            self.stage_label.configure(text=f"{stage}: {done}/{total} ({now - self.stage_started:.1f} s)")
+        else:
+            self.stage_label.configure(text=f"{stage}: {done} ({now - self.stage_started:.1f} s)")
+
+    def finish(self, message: str) -> None:
+        """
+        Show the end of the run with the total time, the window stays open until closed.
+
+        :param message: Final status, e.g. "Done" or "Cancelled".
+        """
+        now = time.perf_counter()
+        self._close_stage(now)
+        self.stage = None
+        self.background_label.configure(text="")
+        self.progress_bar.stop()
+        self.progress_bar.configure(mode='determinate')
+        self.progress_bar.set(1)
+        self.stage_label.configure(text=f"{message} ({now - self.run_started:.1f} s)")
+        self.cancel_button.configure(text="Close", state='normal', command=self.destroy)
+        self.protocol("WM_DELETE_WINDOW", self.destroy)
+
+    def cancel(self) -> None:
+        """ Ask the run to stop after the current sample. """
+        self.cancel_button.configure(text="Cancelling...", state='disabled')
+        self.on_cancel()
+
+    def _close_stage(self, now: float) -> None:
+        if self.stage is None:
+            return
+        self.timings.append((self.stage, now - self.stage_started))
+        self.timings_label.configure(text='\n'.join(f"{stage}: {seconds:.1f} s" for stage, seconds in self.timings))
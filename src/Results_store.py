@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import os
+import struct
+import zipfile
+from datetime import date
+from typing import Dict, List
+
+import numpy as np
+from numpy import ndarray
+
+STORE_VERSION = 1
+# Per-wavelength columns of the store and the data_folders keys they hold
+WAVELENGTH_COLUMNS = {
+    'wavelength': 'Wavelength',
+    'transmittance_avg': 'Transmittance_Avg',
+    'transmittance_std_dev': 'Transmittance_Std_Dev',
+    'haze_avg': 'Haze_Avg',
+    'haze_std_dev': 'Haze_Std_Dev',
+}
+# Per-area columns, (areas, wavelengths) per sample, stored flattened
+AREA_COLUMNS = {
+    'transmittance_per_area': 'Transmittance_Per_Area',
+    'haze_per_area': 'Haze_Per_Area',
+}
+
+
+def save_results_store(data_folders: Dict[str, Dict], path: str, root_folder_name: str = '') -> str:
+    """
+    Save the results of all samples of a run into a single uncompressed .npz of flat columns.
+
+    The per-wavelength columns of all samples are concatenated, sample i owning the rows
+    wavelength_offsets[i]:wavelength_offsets[i + 1], so samples on different wavelength grids are kept exactly.
+    The per-area values are concatenated the same way, using area_value_offsets and n_areas.
+
+    :param data_folders: Processed data folders.
+    :param path: Path of the .npz file.
+    :param root_folder_name: Name of the run, shown when the store is reopened.
+    :return: The path of the saved file.
+    """
+    samples = list(data_folders.values())
+    lengths = [len(sample['Wavelength']) for sample in samples]
+    n_areas = [len(sample['Transmittance_Per_Area']) if 'Transmittance_Per_Area' in sample else 0
+               for sample in samples]
+    columns = {
+        'version': np.array(STORE_VERSION),
+        'root_folder_name': np.array(root_folder_name),
+        'sample_names': np.array(list(data_folders.keys()), dtype=str),
+        'sample_paths': np.array([sample.get('path', '') for sample in samples], dtype=str),
+        'wavelength_offsets': np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+        'n_areas': np.array(n_areas, dtype=np.int64),
+        'area_value_offsets': np.concatenate(([0], np.cumsum(np.multiply(lengths, n_areas)))).astype(np.int64),
+    }
+    for column, key in WAVELENGTH_COLUMNS.items():
+        columns[column] = np.concatenate([np.asarray(sample[key], dtype=np.float64) for sample in samples])
+    for column, key in AREA_COLUMNS.items():
+        columns[column] = np.concatenate([np.asarray(sample[key], dtype=np.float64).ravel()
+                                          for sample in samples if key in sample] or [np.empty(0)])
+    np.savez(path, **columns)
+    print(f'Results store is saved in {path}')
+    return path
+
+
+def default_store_path(root_folder_path: str) -> str:
+    """ Path of the results store of a root folder. """
+    return os.path.join(root_folder_path, f'{date.today()}_results.npz')
+
+
+def _memory_map_npz(path: str) -> Dict[str, ndarray]:
+    """
+    Memory-map the arrays of an uncompressed .npz. np.load ignores mmap_mode for .npz, but the members written
+    by np.savez are stored as plain .npy files, so their data can be mapped straight from the archive.
+
+    :param path: Path of the .npz file.
+    :return: Dict of read-only memory-mapped arrays. Compressed members are read into memory.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as file:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+            # Skip the local file header, its name and extra field lengths may differ from the central directory
+            file.seek(info.header_offset)
+            local_header = file.read(30)
+            name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+            file.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+            elif version == (2, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+            else:
+                shape = None
+            if shape is None or not shape or 0 in shape or dtype.hasobject:
+                # Scalars, empty arrays and unknown formats are simply read
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+            arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=file.tell(), shape=shape,
+                                     order='F' if fortran_order else 'C')
+    return arrays
+
+
+class ResultsStore:
+    """
+    A results store opened for reading.
+
+    :param path: Path of the .npz file.
+    :param mmap: Memory-map the columns instead of reading them, so opening is instant and only the data used
+        is read from disk.
+    """
+
+    def __init__(self, path: str, mmap: bool = True):
+        self.path = path
+        if mmap:
+            self.columns = _memory_map_npz(path)
+        else:
+            with np.load(path, allow_pickle=False) as npz:
+                self.columns = {name: npz[name] for name in npz.files}
+        if int(self.columns['version']) != STORE_VERSION:
+            raise ValueError(f'{path}: unsupported results store version {int(self.columns["version"])}')
+        self.root_folder_name = str(self.columns['root_folder_name'])
+        self.sample_names: List[str] = [str(name) for name in self.columns['sample_names']]
+
+    def sample(self, index: int) -> Dict:
+        """
+        Results of a single sample, as views into the columns.
+
+        :param index: Position of the sample in the store.
+        :return: Dict with the same keys as a processed data_folders entry.
+        """
+        start, stop = self.columns['wavelength_offsets'][index:index + 2]
+        sample = {'path': str(self.columns['sample_paths'][index])}
+        for column, key in WAVELENGTH_COLUMNS.items():
+            sample[key] = self.columns[column][start:stop]
+        n_areas = int(self.columns['n_areas'][index])
+        if n_areas:
+            area_start, area_stop = self.columns['area_value_offsets'][index:index + 2]
+            for column, key in AREA_COLUMNS.items():
+                sample[key] = self.columns[column][area_start:area_stop].reshape(n_areas, stop - start)
+        return sample
+
+    def rebuild_data_folders(self) -> Dict[str, Dict]:
+        """ The data_folders of the stored run, in the stored order. """
+        return {sample_name: self.sample(index) for index, sample_name in enumerate(self.sample_names)}
+
+
+def load_results_store(path: str, mmap: bool = True) -> ResultsStore:
+    """
+    Open a results store saved by save_results_store.
+
+    :param path: Path of the .npz file.
+    :param mmap: Memory-map the columns.
+    :return: The opened store.
+    """
+    return ResultsStore(path, mmap)
+
+
+class StoredRun:
+    """
+    A past run reopened from its results store, usable as the parent of TransmittanceAndHazePlotter and
+    SaveIntoSingleExcel without reparsing the raw spectra.
+
+    :param path: Path of the .npz file.
+    """
+
+    def __init__(self, path: str):
+        store = load_results_store(path)
+        self.root_folder_path = os.path.dirname(os.path.abspath(path))
+        self.root_folder_name = store.root_folder_name or os.path.splitext(os.path.basename(path))[0]
+        self.data_folders = store.rebuild_data_folders()
+        self.save_all_flag = False
+        self.add_sample_name_row_flag = False
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Deque, Iterable, Iterator, Tuple
+
+
+class SamplePrefetcher:
+    """
+    Read the upcoming samples in a thread pool while the current one is calculated and saved.
+
+    Iterating yields (sample name, loaded sample) in the order of sample_names. At most depth samples are read
+    ahead, which caps the memory held by loaded but not yet processed samples. An error of load is raised when
+    its sample is reached. Leaving the loop early cancels the reads not started yet.
+
+    The time the caller waited for the reads (io_wait) and spent between two samples (compute) is measured, with
+    depth 0 the samples are read in line and all the reading time is waiting.
+
+    :param sample_names: Names of the samples, in processing order.
+    :param load: Reads a sample, called from the pool threads, e.g. ProcessSpectroscopyData.load_sample.
+    :param depth: Number of samples read ahead, 0 to read each sample when it is reached.
+    """
+
+    def __init__(self, sample_names: Iterable[str], load: Callable[[str], Any], depth: int = 2):
+        self.sample_names = list(sample_names)
+        self.load = load
+        self.depth = max(0, depth)
+        self.read_time = 0.0  # Time spent reading, summed over the threads
+        self._read_time_lock = threading.Lock()
+        self.io_wait = 0.0  # Time the caller waited for a sample to be read
+        self.compute = 0.0  # Time the caller spent on the samples
+
+    def __len__(self) -> int:
+        return len(self.sample_names)
+
+    def __iter__(self) -> Iterator[Tuple[str, Any]]:
+        if self.depth == 0:
+            for sample_name in self.sample_names:
+                start = time.perf_counter()
+                loaded = self._timed_load(sample_name)
+                self.io_wait += time.perf_counter() - start
+                yield from self._timed_yield(sample_name, loaded)
+            return
+
+        names = iter(self.sample_names)
+        pending: Deque[Tuple[str, Future]] = deque()
+        with ThreadPoolExecutor(max_workers=self.depth, thread_name_prefix='prefetch') as executor:
+            try:
+                for sample_name in islice(names, self.depth):
+                    pending.append((sample_name, executor.submit(self._timed_load, sample_name)))
+                while pending:
+                    sample_name, future = pending.popleft()
+                    start = time.perf_counter()
+                    try:
+                        loaded = future.result()
+                    finally:
+                        self.io_wait += time.perf_counter() - start
+                    next_name = next(names, None)
+                    if next_name is not None:
+                        pending.append((next_name, executor.submit(self._timed_load, next_name)))
+                    yield from self._timed_yield(sample_name, loaded)
+            finally:
+                for _, future in pending:  # The loop was left early
+                    future.cancel()
+
+    def _timed_load(self, sample_name: str) -> Any:
+        start = time.perf_counter()
+        try:
+            return self.load(sample_name)
+        finally:
+            with self._read_time_lock:
+                self.read_time += time.perf_counter() - start
+
+    def _timed_yield(self, sample_name: str, loaded: Any) -> Iterator[Tuple[str, Any]]:
+        start = time.perf_counter()
+        try:
+            yield sample_name, loaded
+        finally:
+            self.compute += time.perf_counter() - start
+
+    def report(self) -> str:
+        """ Summary of the time spent reading and computing. """
+        return (f'Prefetch (depth {self.depth}): waited {self.io_wait:.2f} s for reads, '
+                f'computed {self.compute:.2f} s, reads took {self.read_time:.2f} s')
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+import weakref
+from collections.abc import MutableMapping
+from typing import Any, Iterator, Mapping, Optional
+
+import numpy as np
+from numpy import ndarray
+
+# The keys a sample can hold: its input files, its folder, the calculated metrics and the saved files
+SAMPLE_KEYS = ('t1', 't2', 't3', 't4', 'path', 'Wavelength', 'Transmittance_Avg', 'Transmittance_Std_Dev',
+               'Haze_Avg', 'Haze_Std_Dev', 'Transmittance_Per_Area', 'Haze_Per_Area', 'outputs')
+# Metrics derived from the spectra, stored as float32 in the compact mode
+DERIVED_METRIC_KEYS = ('Transmittance_Avg', 'Transmittance_Std_Dev', 'Haze_Avg', 'Haze_Std_Dev',
+                       'Transmittance_Per_Area', 'Haze_Per_Area')
+
+# Interned wavelength grids, an entry lives as long as a sample uses it
+_grids: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+_grids_lock = threading.Lock()
+
+
+def intern_wavelength_grid(wavelength: ndarray) -> ndarray:
+    """
+    The shared, read-only copy of a wavelength grid, so samples measured on the same grid hold a single array.
+
+    :param wavelength: Wavelengths of a sample.
+    :return: The interned grid, equal to wavelength.
+    """
+    wavelength = np.asarray(wavelength, dtype=np.float64)
+    key = (wavelength.shape, hashlib.blake2b(np.ascontiguousarray(wavelength).tobytes(), digest_size=16).digest())
+    with _grids_lock:
+        grid = _grids.get(key)
+        if grid is None:
+            grid = np.array(wavelength)  # Own copy, a view would keep its base alive
+            grid.setflags(write=False)
+            _grids[key] = grid
+        return grid
+
+
+class SampleRecord(MutableMapping):
+    """
+    Compact record of a sample in data_folders, used like the dict it replaces (sample['t2'], sample.get('path'),
+    'Haze_Avg' in sample, dict(sample), ...).
+
+    The keys are limited to SAMPLE_KEYS and stored in slots, the wavelength grid is interned (see
+    intern_wavelength_grid) and, with float32_metrics, the derived metrics are stored as float32, which halves
+    their memory at about 7 significant digits, well below the precision of the measurements.
+
+    :param values: Initial keys and values.
+    :param float32_metrics: Store the derived metrics as float32.
+    """
+
+    __slots__ = SAMPLE_KEYS + ('float32_metrics',)
+
+    def __init__(self, values: Optional[Mapping[str, Any]] = None, float32_metrics: bool = False):
+        self.float32_metrics = float32_metrics
+        if values:
+            self.update(values)
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in SAMPLE_KEYS:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in SAMPLE_KEYS:
+            raise KeyError(f'{key} is not a key of a sample record')
+        if key == 'Wavelength':
+            value = intern_wavelength_grid(value)
+        elif key in DERIVED_METRIC_KEYS and self.float32_metrics:
+            value = np.asarray(value, dtype=np.float32)
+        setattr(self, key, value)
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        delattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for key in SAMPLE_KEYS if hasattr(self, key))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __contains__(self, key: object) -> bool:
+        return key in SAMPLE_KEYS and hasattr(self, key)
+
+    def __repr__(self) -> str:
+        return f'SampleRecord({dict(self)!r})'
+
+    def __reduce__(self):
+        return SampleRecord, (dict(self), self.float32_metrics)
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import math
+import os
+from datetime import date
+from typing import List
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+from matplotlib.ticker import MaxNLocator
+from tqdm import tqdm
+
+from src.Archive_reader import output_folder
+from src.Save_results_img import (IMAGE_KINDS, ImageSettings, apply_image_style, fix_layout, setup_metric_axes,
+                                  update_line_and_band)
+
+
+class SaveCampaignPlots:
+    """
+    Save the plots of all samples of a run into the root folder: one multi-page PDF with a page per sample
+    (transmittance and haze side by side) and, optionally, contact sheets tiling many samples per image.
+
+    A single figure is reused for all pages (or sheets) and each page is written to the file as soon as it is
+    rendered, so the memory use does not grow with the number of samples.
+
+    :param parent: Holds data_folders, root_folder_path, image_options and the save_pdf_flag and
+        contact_sheet_flag options.
+    """
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.data = self.parent.data_folders
+        self.settings = ImageSettings.from_options(self.parent.image_options)
+        self.saved_paths: List[str] = []
+        if self.data and getattr(self.parent, 'save_pdf_flag', False):
+            self.save_pdf()
+        if self.data and getattr(self.parent, 'contact_sheet_flag', False):
+            self.save_contact_sheets()
+
+    def save_pdf(self) -> str:
+        """
+        Stream a page per sample into {date}_all_samples.pdf.
+
+        :return: Path of the PDF.
+        """
+        cm = 1 / 2.54  # convert px to cm
+        path = os.path.join(output_folder(self.parent.root_folder_path), f'{date.today()}_all_samples.pdf')
+        fig = Figure(figsize=(2 * self.settings.width * cm, (self.settings.height + 1.5) * cm))
+        FigureCanvasAgg(fig)
+        axes = fig.subplots(1, len(IMAGE_KINDS))
+        artists = [list(setup_metric_axes(ax, self.settings, y_label))
+                   for ax, (_, _, _, y_label, _) in zip(axes, IMAGE_KINDS)]
+        title = fig.suptitle(next(iter(self.data)))
+        apply_image_style(fig)
+        fix_layout(fig)
+
+        with PdfPages(path) as pdf:
+            for sample_name, sample in tqdm(self.data.items(), desc="Saving PDF", colour='blue'):
+                title.set_text(sample_name)
+                for ax, pair, (_, avg_key, std_key, _, _) in zip(axes, artists, IMAGE_KINDS):
+                    pair[1] = update_line_and_band(ax, *pair, sample['Wavelength'], sample[avg_key],
+                                                   sample[std_key])
+                pdf.savefig(fig)
+            pdf.infodict()['Title'] = str(self.parent.root_folder_name or '')
+        self.saved_paths.append(path)
+        print(f'Plots of all samples are saved in {path}')
+        return path
+
+    def save_contact_sheets(self) -> List[str]:
+        """
+        Tile the samples into {date}_contact_sheet_N images of parent.contact_sheet_grid (rows, columns) cells,
+        each cell showing the transmittance and haze of one sample.
+
+        :return: Paths of the sheets.
+        """
+        rows, columns = getattr(self.parent, 'contact_sheet_grid', (5, 4))
+        rows = min(rows, math.ceil(len(self.data) / columns))  # No empty rows when everything fits in one sheet
+        per_sheet = rows * columns
+        n_sheets = math.ceil(len(self.data) / per_sheet)
+        items = list(self.data.items())
+        cm = 1 / 2.54  # convert px to cm
+        paths = []
+        fig = Figure(dpi=150, figsize=(columns * 6 * cm, rows * 4.5 * cm))
+        FigureCanvasAgg(fig)
+        axes = fig.subplots(rows, columns, squeeze=False).ravel()
+        cells = []
+        for ax in axes:
+            # Both metrics on the same axes, the colors come from the style's cycle
+            cells.append([list(setup_metric_axes(ax, self.settings, None)) for _ in IMAGE_KINDS])
+            # Fewer ticks, the cells are small
+            ax.xaxis.set_major_locator(MaxNLocator(nbins=4, integer=True))
+            ax.yaxis.set_major_locator(MaxNLocator(nbins=5, integer=True))
+            ax.set_title(' ')
+        fig.legend([pair[0] for pair in cells[0]], [title for *_, title in IMAGE_KINDS], loc='upper center',
+                   ncol=len(IMAGE_KINDS), fontsize=7)  # Its spacing follows the font size given here
+        fig.supxlabel('Wavelength ($\\mathrm{nm}$)')
+        fig.supylabel('%')
+        apply_image_style(fig, font_size=7)
+        fix_layout(fig, rect=(0, 0, 1, 0.97))
+
+        for sheet in tqdm(range(n_sheets), desc="Saving Contact Sheets", colour='blue'):
+            for ax, cell, index in zip(axes, cells, range(sheet * per_sheet, (sheet + 1) * per_sheet)):
+                if index >= len(items):
+                    ax.set_visible(False)  # Empty cells of the last sheet
+                    continue
+                sample_name, sample = items[index]
+                ax.title.set_text(sample_name)  # Keeps the style, set_title would reset it
+                for pair, (_, avg_key, std_key, _, _) in zip(cell, IMAGE_KINDS):
+                    pair[1] = update_line_and_band(ax, *pair, sample['Wavelength'], sample[avg_key],
+                                                   sample[std_key])
+            path = os.path.join(output_folder(self.parent.root_folder_path),
+                                f'{date.today()}_contact_sheet_{sheet + 1}.{self.settings.format}')
+            fig.savefig(path, format=self.settings.format)
+            paths.append(path)
+        self.saved_paths.extend(paths)
+        print(f'{len(paths)} contact sheet(s) of {len(items)} samples are saved in '
+              f'{output_folder(self.parent.root_folder_path)}')
+        return paths
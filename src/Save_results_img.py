@@ -1,100 +1,331 @@
+from __future__ import annotations
+
 import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, fields
 from datetime import date
+from multiprocessing import get_context
+from typing import Callable, Dict, List, Tuple
 
-import matplotlib.pyplot as plt
 import matplotlib.style as style
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from matplotlib.text import Text
 from matplotlib.ticker import (AutoMinorLocator, MaxNLocator)
+from numpy import ndarray
+from tqdm import tqdm
+
+from src.Archive_reader import output_folder
+
+# Style of the saved images, applied to their figures and artists (see apply_image_style): the rcParams are global,
+# changing them from the thread saving the images would also restyle the plots of the GUI
+IMAGE_COLORS = style.library['seaborn-v0_8-colorblind']['axes.prop_cycle'].by_key()['color']
+IMAGE_FONT = ['Arial', 'sans-serif']
+# Metric plotted in each image: file name prefix, data key of the average and the std, y-axis label, title
+IMAGE_KINDS = (
+    ('T', 'Transmittance_Avg', 'Transmittance_Std_Dev', 'Transmittance ($\\%$)', 'Transmittance'),
+    ('haze', 'Haze_Avg', 'Haze_Std_Dev', 'Haze ($\\%$)', 'Haze'),
+)
+
+
+@dataclass(frozen=True)
+class ImageSettings:
+    """
+    Size, format and axis limits of the saved images, independent of the GUI so it can be sent to worker processes.
+
+    :param width: Image width in cm.
+    :param height: Image height in cm.
+    :param format: Image format, e.g. "png".
+    """
+    width: float
+    height: float
+    format: str
+    x_min: float
+    x_max: float
+    y_min: float
+    y_max: float
+    dpi: int = 300
+
+    @classmethod
+    def from_options(cls, image_options: Dict) -> ImageSettings:
+        """ Settings from an image_options dict (see settings.DEFAULT_IMAGE_OPTIONS), unknown keys are ignored. """
+        names = {field.name for field in fields(cls)}
+        return cls(**{key: value for key, value in image_options.items() if key in names})
+
+
+def unique_image_path(folder: str, prefix: str, sample_name: str, file_format: str) -> str:
+    """
+    Path of a new image, with a -copyN suffix if the file already exists.
+
+    :param folder: Folder of the image.
+    :param prefix: Prefix after the date, "T" or "haze".
+    :param sample_name: Name of the sample.
+    :param file_format: Image format.
+    :return: The path.
+    """
+    path = folder + '/' + f'{date.today()}_{prefix}_' + sample_name + '.' + file_format
+    # Check if the file exists and modify the filename accordingly
+    counter = 1
+    original_path = path
+    while os.path.exists(path):
+        len_extension = len(file_format) + 1
+        path = f"{original_path[:-len_extension]}-copy{counter}{original_path[-len_extension:]}"
+        counter += 1
+        print(f'The filename already exist {original_path} changed to {path}')
+    return path
+
+
+def setup_metric_axes(ax, settings: ImageSettings, y_label: str | None) -> Tuple[Line2D, PolyCollection]:
+    """
+    Set up the limits, locators and labels of the axes of one metric, with an empty line and std band.
+
+    :param ax: Axes to set up.
+    :param settings: Image settings with the axis limits.
+    :param y_label: Label of the y-axis, None for no axis labels.
+    :return: The line of the average and the band of the standard deviation, filled by update_line_and_band.
+    """
+    if not ax.lines:  # The next metrics of the same axes continue the cycle
+        ax.set_prop_cycle(color=IMAGE_COLORS)
+    line, = ax.plot([], [], lw=1, zorder=3)
+    band = ax.fill_between([], [], [], alpha=0.1, zorder=1)
+
+    ax.set_xlim([settings.x_min, settings.x_max])
+    ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+    ax.xaxis.set_minor_locator(AutoMinorLocator(n=2))
+
+    ax.set_ylim([settings.y_min, settings.y_max])
+    ax.yaxis.set_major_locator(MaxNLocator(integer=True))  # For integer ticks
+    ax.yaxis.set_minor_locator(AutoMinorLocator(n=2))
+
+    if y_label is not None:
+        ax.set_xlabel('Wavelength ($\\mathrm{nm}$)')
+        ax.set_ylabel(y_label)
+    return line, band
+
+
+def update_line_and_band(ax, line: Line2D, band: PolyCollection, wavelength: ndarray, avg: ndarray,
+                         std: ndarray) -> PolyCollection:
+    """
+    Swap the data of a line and of its std band in place.
+
+    :return: The band, a new one on matplotlib < 3.10 where the band can not be updated.
+    """
+    line.set_data(wavelength, avg)
+    if hasattr(band, 'set_data'):  # matplotlib >= 3.10
+        band.set_data(wavelength, avg - std, avg + std)
+        return band
+    facecolor = band.get_facecolor()
+    band.remove()
+    return ax.fill_between(wavelength, avg - std, avg + std, facecolor=facecolor, alpha=0.1, zorder=band.zorder)
+
+
+def apply_image_style(fig: Figure, font_size: float | None = None) -> None:
+    """
+    Set the font of the image style on all texts of a figure, including the tick labels created later, without
+    LaTeX. Called once the texts are created and before fix_layout, which depends on their size.
+
+    :param fig: Figure to style.
+    :param font_size: Size of all texts, None to keep their sizes.
+    """
+    for text in fig.findobj(Text):
+        text.set(fontfamily=IMAGE_FONT, usetex=False)
+        if font_size is not None:
+            text.set_fontsize(font_size)
+    for ax in fig.axes:
+        ax.tick_params(which='both', labelfontfamily=IMAGE_FONT)
+        if font_size is not None:
+            ax.tick_params(which='both', labelsize=font_size)
+
+
+def fix_layout(fig: Figure, **kwargs) -> None:
+    """
+    Apply tight_layout once and keep the positions. tight_layout leaves a placeholder layout engine on the figure,
+    which makes every savefig draw the figure one extra time, so it is removed.
+
+    :param fig: Figure to lay out.
+    :param kwargs: Passed to tight_layout.
+    """
+    fig.tight_layout(**kwargs)
+    fig.set_layout_engine('none')
+
+
+class FigureTemplate:
+    """
+    Figure of one metric (transmittance or haze) built once for given image settings: the axes, limits, locators,
+    labels and layout are set up on creation, and each sample only swaps the data of the line and of the std band
+    before saving. The layout does not depend on the data, the limits being fixed.
+
+    :param settings: Image settings.
+    :param y_label: Label of the y-axis.
+    """
+
+    def __init__(self, settings: ImageSettings, y_label: str):
+        self.settings = settings
+        cm = 1 / 2.54  # convert px to cm
+        self.fig = Figure(dpi=settings.dpi, figsize=(settings.width * cm, settings.height * cm))
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        self.line, self.band = setup_metric_axes(self.ax, settings, y_label)
+        apply_image_style(self.fig)
+        fix_layout(self.fig)
+
+    def save(self, wavelength: ndarray, avg: ndarray, std: ndarray, path: str) -> None:
+        """
+        Draw a sample into the figure and save it.
+
+        :param wavelength: Wavelengths of the sample.
+        :param avg: Average of the metric.
+        :param std: Standard deviation of the metric, drawn as a band around the average.
+        :param path: Path of the image.
+        """
+        self.band = update_line_and_band(self.ax, self.line, self.band, wavelength, avg, std)
+        self.fig.savefig(path, format=self.settings.format)
+
+
+# Figure templates of this process, by image settings and metric. Kept for the life of the process, so a worker
+# builds its figures only once
+_figure_templates: Dict[Tuple[ImageSettings, str], FigureTemplate] = {}
+
+
+def get_figure_template(settings: ImageSettings, y_label: str) -> FigureTemplate:
+    """ The figure template of this process for the settings and the metric, built on first use. """
+    key = (settings, y_label)
+    if key not in _figure_templates:
+        if len(_figure_templates) >= 8:  # The settings changed several times, drop the old figures
+            _figure_templates.clear()
+        _figure_templates[key] = FigureTemplate(settings, y_label)
+    return _figure_templates[key]
+
+
+def render_sample_images(sample_name: str, sample: Dict, settings: ImageSettings, paths: List[str],
+                         reuse_templates: bool = True) -> List[str]:
+    """
+    Render the transmittance and haze images of a sample with the Agg canvas, without pyplot, so it works the
+    same in the GUI, in a headless run and in a worker process.
+
+    :param sample_name: Name of the sample.
+    :param sample: Dict with the wavelength and the averages and standard deviations of the sample.
+    :param settings: Image settings.
+    :param paths: Paths of the transmittance and haze images.
+    :param reuse_templates: Draw into the cached figure templates of this process instead of new figures.
+    :return: The saved paths.
+    """
+    for (_, avg_key, std_key, y_label, title), path in zip(IMAGE_KINDS, paths):
+        template = get_figure_template(settings, y_label) if reuse_templates else FigureTemplate(settings, y_label)
+        template.save(sample['Wavelength'], sample[avg_key], sample[std_key], path)
+        print(f'Plot of {title} for {sample_name} is saved in {path}')
+    return list(paths)
 
 
 class SavePlotsImg:
+    """
+    Save the transmittance and haze images of a sample on the calling thread.
+
+    :param parent: ProcessSpectroscopyData, its parent holds the image_options.
+    :param sample_name: Name of the sample.
+    """
+
     def __init__(self, parent, sample_name: str):
         self.parent = parent
         self.sample_name = sample_name
         self.data = self.parent.data
-        style.use('seaborn-v0_8-colorblind')
+        self.settings = ImageSettings.from_options(self.parent.parent.image_options)
+        sample = self.data[self.sample_name]
+        paths = [unique_image_path(output_folder(sample['path']), prefix, sample_name, self.settings.format)
+                 for prefix, *_ in IMAGE_KINDS]
+        self.saved_paths = render_sample_images(sample_name, sample, self.settings, paths)
 
-        plt.rc('text', usetex=True)  # use latex text
 
-        cm = 1 / 2.54  # convert px to cm
-        plt.rcParams.update({
-            "text.usetex": False,
-            "font.family": "sans-serif",
-            "font.sans-serif": ["Arial"]})
-
-        self.wavelength = self.data[self.sample_name]['Wavelength']
-        self.transmittance_avg = self.data[self.sample_name]['Transmittance_Avg']
-        self.transmittance_std = self.data[self.sample_name]['Transmittance_Std_Dev']
-        self.haze_avg = self.data[self.sample_name]['Haze_Avg']
-        self.haze_std = self.data[self.sample_name]['Haze_Std_Dev']
-        self.path = self.data[self.sample_name]['path']
-        self.img_width = float(self.parent.parent.image_width_entry.get()) * cm
-        self.img_height = float(self.parent.parent.image_height_entry.get()) * cm
-        self.format = self.parent.parent.image_format_option_menu.get()
-        self.y_min = float(self.parent.parent.entry_y_min.get())
-        self.y_max = float(self.parent.parent.entry_y_max.get())
-        self.x_min = float(self.parent.parent.entry_x_min.get())
-        self.x_max = float(self.parent.parent.entry_x_max.get())
-        self.plot_transmittance()
-        self.plot_haze()
-
-    def plot_transmittance(self):
-        fig, ax = plt.subplots(dpi=300, figsize=(self.img_width, self.img_height))
-        ax.plot(self.wavelength, self.transmittance_avg, lw=1, zorder=3)
-        ax.fill_between(self.wavelength, self.transmittance_avg - self.transmittance_std,
-                        self.transmittance_avg + self.transmittance_std, alpha=0.1, zorder=1)
-
-        ax.set_xlim([self.x_min, self.x_max])
-        ax.xaxis.set_major_locator(MaxNLocator(integer=True))
-        ax.xaxis.set_minor_locator(AutoMinorLocator(n=2))
-
-        ax.set_ylim([self.y_min, self.y_max])
-        ax.yaxis.set_major_locator(MaxNLocator(integer=True))  # For integer ticks
-        ax.yaxis.set_minor_locator(AutoMinorLocator(n=2))
-
-        ax.set_xlabel('Wavelength ($\mathrm{nm}$)')
-        ax.set_ylabel('Transmittance ($\%$)')
-
-        plt.tight_layout()
-        path = self.path + '/' + f'{date.today()}_T_' + self.sample_name + '.' + self.format
-        # Check if the file exists and modify the filename accordingly
-        counter = 1
-        original_path = path
-        while os.path.exists(path):
-            len_extension = len(self.format) + 1
-            path = f"{original_path[:-len_extension]}-copy{counter}{original_path[-len_extension:]}"
-            counter += 1
-            print(f'The filename already exist {original_path} changed to {path}')
-        fig.savefig(path, format=self.format)
-        plt.close(fig)  # Close the figure after saving to free up memory
-        print(f'Plot of Transmittance for {self.sample_name} is saved in {path}')
-
-    def plot_haze(self):
-        fig, ax = plt.subplots(dpi=300, figsize=(self.img_width, self.img_height))
-        ax.plot(self.wavelength, self.haze_avg, lw=1, zorder=3)
-        ax.fill_between(self.wavelength, self.haze_avg - self.haze_std,
-                        self.haze_avg + self.haze_std, alpha=0.1, zorder=1)
-
-        ax.set_xlim([self.x_min, self.x_max])
-        ax.xaxis.set_major_locator(MaxNLocator(integer=True))
-        ax.xaxis.set_minor_locator(AutoMinorLocator(n=2))
-
-        ax.set_ylim([self.y_min, self.y_max])
-        ax.yaxis.set_major_locator(MaxNLocator(integer=True))  # For integer ticks
-        ax.yaxis.set_minor_locator(AutoMinorLocator(n=2))
-
-        ax.set_xlabel('Wavelength ($\mathrm{nm}$)')
-        ax.set_ylabel('Haze ($\%$)')
-
-        plt.tight_layout()
-        path = self.path + '/' + f'{date.today()}_haze_' + self.sample_name + '.' + self.format
-        # Check if the file exists and modify the filename accordingly
-        counter = 1
-        original_path = path
-        while os.path.exists(path):
-            len_extension = len(self.format) + 1
-            path = f"{original_path[:-len_extension]}-copy{counter}{original_path[-len_extension:]}"
-            counter += 1
-            print(f'The filename already exist {original_path} changed to {path}')
-        fig.savefig(path, format=self.format)
-        plt.close(fig)  # Close the figure after saving to free up memory
-        print(f'Plot of Haze for {self.sample_name} is saved in {path}')
+class ImageExporter:
+    """
+    Render the images of many samples in a pool of worker processes, while the caller goes on with the next
+    samples. The image paths are chosen when a sample is submitted, so they are known right away.
+
+    :param settings: Image settings.
+    :param workers: Number of worker processes, 1 renders each sample on the calling thread when submitted.
+    :param progress: Called with (done, submitted) each time the images of a sample are saved or failed, as
+        soon as they complete. With worker processes it is called from a thread of the pool.
+    """
+
+    def __init__(self, settings: ImageSettings, workers: int = 1,
+                 progress: Callable[[int, int], None] | None = None):
+        self.settings = settings
+        self.workers = workers
+        self.progress = progress
+        self.executor = None
+        self.futures: Dict[Future, str] = {}
+        self.failed_samples: Dict[str, str] = {}
+        self.submitted = 0
+        self.done = 0
+        self.lock = threading.Lock()  # The counts are updated from the threads of the pool
+
+    def submit(self, sample_name: str, sample: Dict) -> List[str]:
+        """
+        Queue the images of a sample.
+
+        :param sample_name: Name of the sample.
+        :param sample: Dict with the sample folder path and the calculated metrics.
+        :return: Paths of the images.
+        """
+        paths = [unique_image_path(output_folder(sample['path']), prefix, sample_name, self.settings.format)
+                 for prefix, *_ in IMAGE_KINDS]
+        # Only what the rendering needs is sent to the workers
+        metrics = {key: sample[key] for _, avg_key, std_key, *_ in IMAGE_KINDS for key in (avg_key, std_key)}
+        metrics['Wavelength'] = sample['Wavelength']
+        with self.lock:
+            self.submitted += 1
+        if self.workers <= 1:
+            try:
+                render_sample_images(sample_name, metrics, self.settings, paths)
+            except Exception as error:  # Report the failing sample and keep going
+                self._report_failure(sample_name, error)
+            self._count_done()
+            return paths
+        if self.executor is None:
+            # 'spawn' gives clean workers, a forked copy of a running Tk application is not safe to use
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('spawn'))
+        future = self.executor.submit(render_sample_images, sample_name, metrics, self.settings, paths)
+        self.futures[future] = sample_name
+        future.add_done_callback(self._image_done)
+        return paths
+
+    def _image_done(self, future: Future) -> None:
+        """ Record the images of a sample completed by the pool, called by the pool as soon as they are. """
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:  # Report the failing sample and keep going
+            self._report_failure(self.futures[future], error)
+        self._count_done()
+
+    def _count_done(self) -> None:
+        with self.lock:
+            self.done += 1
+            done, submitted = self.done, self.submitted
+        if self.progress is not None:
+            self.progress(done, submitted)
+
+    def finish(self) -> Dict[str, str]:
+        """
+        Wait for all queued images and shut the pool down. Their progress is reported as they complete, see
+        progress.
+
+        :return: Dict of the samples whose images failed, with the error.
+        """
+        if self.executor is None:
+            return self.failed_samples
+        try:
+            for _ in tqdm(as_completed(self.futures), total=len(self.futures), desc="Saving Images", colour='blue'):
+                pass
+        finally:
+            self.executor.shutdown()  # Also waits for the done callbacks
+            self.executor = None
+            self.futures.clear()
+        return self.failed_samples
+
+    def _report_failure(self, sample_name: str, error: BaseException) -> None:
+        self.failed_samples[sample_name] = f'{type(error).__name__}: {error}'
+        print(f'Saving images failed for {sample_name}: {self.failed_samples[sample_name]}')
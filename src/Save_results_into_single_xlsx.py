@@ -1,7 +1,15 @@
+from __future__ import annotations
+
 import os
+from typing import List, Tuple
 
+import numpy as np
 import pandas as pd
 from datetime import date
+from numpy import ndarray
+from openpyxl import Workbook
+
+from src.Archive_reader import output_folder
 
 
 class SaveIntoSingleExcel:
@@ -9,32 +17,91 @@ class SaveIntoSingleExcel:
         self.parent = parent
         self.data = self.parent.data_folders
         self.include_sample_names = self.parent.add_sample_name_row_flag
-        if self.parent.save_all_flag:
+        self.file_format = getattr(self.parent, 'combined_format', 'xlsx')
+        if self.parent.save_all_flag and self.data:
             self.save_combined_results_xlsx()
 
     def save_combined_results_xlsx(self) -> None:
         """
-        Save the combined metrics of all samples into a single Excel file.
+        Save the combined metrics of all samples into a single Excel file (or .csv/.npz, see combined_format).
+
+        """
+        column_names, table = self.build_combined_table()
+
+        root_folder_path = output_folder(self.parent.root_folder_path)
+        file_path = os.path.join(root_folder_path, f'{date.today()}_combined_results.{self.file_format}')
+        if self.file_format == 'csv':
+            pd.DataFrame(table, columns=column_names, copy=False).to_csv(file_path, index=False)
+        elif self.file_format == 'npz':
+            np.savez(file_path, **{name: table[:, index] for index, name in enumerate(column_names)})
+        else:
+            self.write_xlsx(file_path, column_names, table)
+        print(f'Combined results file is saved in {file_path}')
+
+    def build_combined_table(self) -> Tuple[List[str], ndarray]:
+        """
+        Build the combined table in one preallocated array: the wavelength, then the transmittance average and
+        standard deviation of every sample, then the haze average and standard deviation of every sample.
 
+        Samples measured on different wavelength grids are aligned on the union of all grids, with empty (NaN)
+        cells where a sample has no value.
+
+        :return: Column names and the table of shape (wavelengths, columns).
         """
-        # Initialize an empty DataFrame with Wavelength as the first column
+        wavelength, rows = self.common_wavelength_grid()
+        column_names = ['Wavelength']
+        column_names += [f'{sample_name}_{metric}' for sample_name in self.data
+                         for metric in ('Transmittance_Avg', 'Transmittance_Std_Dev')]
+        column_names += [f'{sample_name}_{metric}' for sample_name in self.data
+                         for metric in ('Haze_Avg', 'Haze_Std_Dev')]
+
+        n_samples = len(self.data)
+        table = np.full((len(wavelength), 1 + 4 * n_samples), np.nan)
+        table[:, 0] = wavelength
+        for index, metrics in enumerate(self.data.values()):
+            sample_rows = rows[index] if rows is not None else slice(None)
+            table[sample_rows, 1 + 2 * index] = metrics['Transmittance_Avg']
+            table[sample_rows, 2 + 2 * index] = metrics['Transmittance_Std_Dev']
+            table[sample_rows, 1 + 2 * (n_samples + index)] = metrics['Haze_Avg']
+            table[sample_rows, 2 + 2 * (n_samples + index)] = metrics['Haze_Std_Dev']
+        return column_names, table
 
-        # Initialize an empty DataFrame with Wavelength as the first column
-        combined_df = pd.DataFrame()
-        combined_df['Wavelength'] = self.data[next(iter(self.data))]['Wavelength']
+    def common_wavelength_grid(self) -> Tuple[ndarray, List[ndarray] | None]:
+        """
+        The wavelength column of the combined table.
 
-        for sample_name, metrics in self.data.items():
-            # Adding metrics for each sample as new columns
-            combined_df[f'{sample_name}_Transmittance_Avg'] = metrics['Transmittance_Avg']
-            combined_df[f'{sample_name}_Transmittance_Std_Dev'] = metrics['Transmittance_Std_Dev']
+        :return: The wavelengths shared by all samples and None, or, if the samples are measured on different
+            grids, the union of the grids and the rows of each sample in it.
+        """
+        wavelengths = [np.asarray(metrics['Wavelength']) for metrics in self.data.values()]
+        first = wavelengths[0]
+        if all(np.array_equal(first, wavelength) for wavelength in wavelengths[1:]):
+            return first, None
 
-        for sample_name, metrics in self.data.items():
-            # Adding metrics for each sample as new columns
-            combined_df[f'{sample_name}_Haze_Avg'] = metrics['Haze_Avg']
-            combined_df[f'{sample_name}_Haze_Std_Dev'] = metrics['Haze_Std_Dev']
+        union = np.unique(np.concatenate(wavelengths))
+        descending = len(first) > 1 and first[0] > first[-1]
+        rows = [np.searchsorted(union, wavelength) for wavelength in wavelengths]
+        if descending:  # Keep the order of the instrument's export
+            union = union[::-1]
+            rows = [len(union) - 1 - sample_rows for sample_rows in rows]
+        n_grids = len({wavelength.tobytes() for wavelength in wavelengths})
+        print(f'Warning! The samples are measured on {n_grids} different wavelength grids, the combined results '
+              f'are aligned on their union of {len(union)} wavelengths, missing values are left empty')
+        return union, rows
 
-        # Save to Excel
-        root_folder_path = self.parent.root_folder_path
-        excel_file_path = os.path.join(root_folder_path, f'{date.today()}_combined_results.xlsx')
-        combined_df.to_excel(excel_file_path, index=False)
-        print(f'Combined results file is saved in {excel_file_path}')
+    @staticmethod
+    def write_xlsx(file_path: str, column_names: List[str], table: ndarray) -> None:
+        """
+        Write the table with a streaming (write-only) openpyxl workbook, NaN values are written as empty cells.
+
+        :param file_path: Path of the .xlsx file.
+        :param column_names: Header row.
+        :param table: Table of shape (rows, columns).
+        """
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('Sheet1')
+        sheet.append(column_names)
+        rows_with_nan = np.isnan(table).any(axis=1)
+        for row, has_nan in zip(table.tolist(), rows_with_nan.tolist()):
+            sheet.append([None if value != value else value for value in row] if has_nan else row)
+        workbook.save(file_path)
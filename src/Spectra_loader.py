@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import io
+import os
+import threading
+import warnings
+from typing import BinaryIO, Dict, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy import ndarray
+
+from src.Archive_reader import file_stat, read_input
+
+
+class SpectrumFormatError(ValueError):
+    """ Raised when a file does not follow the Shimadzu UV-2600 two-column text export format. """
+
+
+def parse_shimadzu_txt(raw: bytes, source: str = '<bytes>') -> Tuple[ndarray, ndarray]:
+    """
+    Parse the content of a Shimadzu UV-2600 text export.
+
+    The export has a title line, a header line with two comma-separated column names
+    (e.g. "Wavelength nm.","T%") and one "wavelength,value" pair per line.
+
+    :param raw: Content of the file.
+    :param source: Name of the file, used in error messages.
+    :return: Contiguous float64 arrays of wavelengths and measured values.
+    :raises SpectrumFormatError: If the header or the number of points does not match the format.
+    """
+    values = parse_shimadzu_pairs(raw, source)
+    return np.ascontiguousarray(values[:, 0]), np.ascontiguousarray(values[:, 1])
+
+
+def parse_shimadzu_pairs(raw: bytes, source: str = '<bytes>') -> ndarray:
+    """
+    Parse the content of a Shimadzu UV-2600 text export into a single array, see parse_shimadzu_txt.
+
+    :param raw: Content of the file.
+    :param source: Name of the file, used in error messages.
+    :return: float64 array of shape (points, 2), wavelengths and measured values.
+    :raises SpectrumFormatError: If the header or the number of points does not match the format.
+    """
+    lines = raw.split(b'\n', 2)
+    if len(lines) < 3:
+        raise SpectrumFormatError(f'{source}: no data lines found')
+    header = lines[1].strip()
+    if header.count(b',') != 1 or not header.lstrip(b'"').lower().startswith(b'wavelength'):
+        raise SpectrumFormatError(f'{source}: unexpected header line {header!r}')
+
+    body = lines[2].replace(b'\r', b'').strip()
+    if not body:
+        raise SpectrumFormatError(f'{source}: no data lines found')
+    n_points = body.count(b'\n') + 1
+    try:
+        with warnings.catch_warnings():
+            # Older numpy only warns on unparsable data, treat it the same as newer numpy does
+            warnings.simplefilter('error', DeprecationWarning)
+            values = np.fromstring(body.replace(b'\n', b','), dtype=np.float64, sep=',')
+    except (ValueError, DeprecationWarning) as error:
+        raise SpectrumFormatError(f'{source}: {error}') from None
+    if values.size != 2 * n_points:
+        raise SpectrumFormatError(f'{source}: expected {n_points} points, parsed {values.size / 2:g}')
+    return values.reshape(n_points, 2)
+
+
+def read_spectrum_pandas(path: str | BinaryIO) -> Tuple[ndarray, ndarray]:
+    """
+    Read a spectrum through pandas. Slower, but tolerant to files which do not follow the strict format.
+
+    :param path: Path of the file, or a binary file object.
+    :return: Contiguous float64 arrays of wavelengths and measured values.
+    """
+    values = pd.read_csv(path, sep=",", header=1).values
+    return (np.ascontiguousarray(values[:, 0], dtype=np.float64),
+            np.ascontiguousarray(values[:, 1], dtype=np.float64))
+
+
+# Set once the pandas fallback was warned about in this process
+_pandas_fallback_warned = threading.Event()
+
+
+def load_spectrum_pairs(path: str) -> ndarray:
+    """
+    Load a single spectrum file into a single array, falling back to pandas for odd files. The fallback is warned
+    about once per process, a run with many odd files would otherwise flood the log.
+
+    :param path: Path of the file, possibly gzip-compressed or inside a .zip archive (see Archive_reader).
+    :return: float64 array of shape (points, 2), wavelengths and measured values.
+    """
+    raw = read_input(path)
+    try:
+        return parse_shimadzu_pairs(raw, path)
+    except SpectrumFormatError as error:
+        if not _pandas_fallback_warned.is_set():
+            _pandas_fallback_warned.set()
+            warnings.warn(f'Falling back to pandas, for this file and any other one not in the Shimadzu format: '
+                          f'{error}', stacklevel=2)
+        return np.column_stack(read_spectrum_pandas(io.BytesIO(raw)))
+
+
+def load_spectrum(path: str) -> Tuple[ndarray, ndarray]:
+    """
+    Load a single spectrum file, using the dedicated Shimadzu parser and falling back to pandas for odd files.
+
+    :param path: Path of the file.
+    :return: Contiguous float64 arrays of wavelengths and measured values.
+    """
+    values = load_spectrum_pairs(path)
+    return np.ascontiguousarray(values[:, 0]), np.ascontiguousarray(values[:, 1])
+
+
+def load_area_matrix(paths: Sequence[str]) -> ndarray:
+    """
+    Load the measured values of several spectra on the same grid, e.g. the T2 files of a sample, as the columns
+    of one matrix.
+
+    The matrix is allocated once, sized from the first file, and each file is parsed straight into its column,
+    so only the matrix and the file being parsed are in memory. It is Fortran-ordered, each area is a contiguous
+    column.
+
+    :param paths: Paths of the files, one per column.
+    :return: float64 array of shape (points, files).
+    :raises ValueError: If a file has a different number of points than the first one.
+    """
+    first = load_spectrum_pairs(paths[0])
+    matrix = np.empty((first.shape[0], len(paths)), order='F')
+    matrix[:, 0] = first[:, 1]
+    del first
+    for column, path in enumerate(paths[1:], start=1):
+        values = load_spectrum_pairs(path)
+        if values.shape[0] != matrix.shape[0]:
+            raise ValueError(f'{path}: {values.shape[0]} points, but {paths[0]} has {matrix.shape[0]}')
+        matrix[:, column] = values[:, 1]
+    return matrix
+
+
+class ReferenceSpectrumCache:
+    """
+    Cache of parsed T1/T3 reference spectra, so a reference shared by many samples is parsed once per run.
+
+    Entries are keyed by the absolute path and validated against the file's mtime and size, a changed file is
+    parsed again. The cached arrays are read-only, as the same arrays are shared by all samples. The cache can be
+    used from several threads, e.g. by the SamplePrefetcher.
+    """
+
+    def __init__(self):
+        self._spectra: Dict[str, Tuple[Tuple[int, int], Tuple[ndarray, ndarray]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, path: str) -> Tuple[ndarray, ndarray]:
+        """
+        Return the parsed reference spectrum, loading it on the first request.
+
+        :param path: Path of the reference file.
+        :return: Read-only arrays of wavelengths and measured values.
+        """
+        key = os.path.abspath(path)
+        stat = file_stat(key)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._spectra.get(key)
+            if cached is not None and cached[0] == signature:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        # Parsed outside the lock, two threads missing the same reference at once both parse it
+        wavelength, values = load_spectrum(path)
+        wavelength.setflags(write=False)
+        values.setflags(write=False)
+        with self._lock:
+            self._spectra[key] = (signature, (wavelength, values))
+        return wavelength, values
+
+    def report(self) -> str:
+        """ Summary of the cache usage. """
+        return (f'Reference spectra cache: {len(self._spectra)} distinct references, '
+                f'{self.hits} hits, {self.misses} misses')
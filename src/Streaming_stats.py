@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from typing import Dict
+
+import numpy as np
+from numpy import ndarray
+
+
+class RunningStats:
+    """
+    Running mean and population variance per wavelength (Welford's algorithm).
+
+    Each added area updates the statistics in O(wavelengths), so any number of areas is handled at constant
+    memory. The results equal np.average and np.std (ddof=0) over the same areas up to floating point rounding.
+
+    :param n_points: Number of wavelengths.
+    """
+
+    def __init__(self, n_points: int):
+        self.count = 0
+        self.mean = np.zeros(n_points)
+        self.m2 = np.zeros(n_points)  # Sum of the squared deviations from the mean
+
+    def add(self, values: ndarray) -> None:
+        """
+        Add the values of one area.
+
+        :param values: Values of shape (wavelengths,).
+        """
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+
+    @property
+    def std(self) -> ndarray:
+        """ Population standard deviation, NaN before the first area. """
+        if self.count == 0:
+            return np.full(self.mean.shape, np.nan)
+        return np.sqrt(self.m2 / self.count)
+
+    def state(self) -> Dict[str, ndarray]:
+        """ Serialisable state, see from_state. """
+        return {'count': np.array(self.count), 'mean': self.mean.copy(), 'm2': self.m2.copy()}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, ndarray]) -> RunningStats:
+        """ Restore the statistics saved by state(). """
+        stats = cls(len(state['mean']))
+        stats.count = int(state['count'])
+        stats.mean[...] = state['mean']
+        stats.m2[...] = state['m2']
+        return stats
+
+
+class SampleAccumulator:
+    """
+    Transmittance and haze statistics of a sample, updated one measurement area at a time.
+
+    Uses the formulas of ProcessSpectroscopyData.calculate_metrics: transmittance = 100 * t2 / t1 and haze by
+    ASTM-D1003-21, 100 * (t4 / t2 - t3 / t1), per area.
+
+    :param wavelength: Wavelengths of the sample, taken from T1.
+    :param t1: Reference transmittance measurement.
+    :param t3: Reference haze measurement.
+    """
+
+    def __init__(self, wavelength: ndarray, t1: ndarray, t3: ndarray):
+        self.wavelength = wavelength
+        self.t1 = t1
+        self.t3 = t3
+        self.reference_haze = t3 / t1
+        self.transmittance = RunningStats(len(wavelength))
+        self.haze = RunningStats(len(wavelength))
+
+    @property
+    def n_areas(self) -> int:
+        """ Number of areas added so far. """
+        return self.transmittance.count
+
+    def add_area(self, t2: ndarray, t4: ndarray) -> None:
+        """
+        Add the T2 and T4 measurements of one area.
+
+        :param t2: Transmittance measurement of the area, shape (wavelengths,).
+        :param t4: Haze measurement of the area, shape (wavelengths,).
+        """
+        if t2.shape != self.t1.shape or t4.shape != self.t1.shape:
+            raise ValueError(f'Area of {t2.shape[0]}/{t4.shape[0]} points does not match the reference of '
+                             f'{self.t1.shape[0]} points')
+        self.transmittance.add(100 * (t2 / self.t1))
+        self.haze.add(100 * (t4 / t2 - self.reference_haze))
+
+    def metrics(self) -> Dict[str, ndarray]:
+        """ Wavelength, average and standard deviation of transmittance and haze, as in data_folders. """
+        return {
+            'Wavelength': self.wavelength,
+            'Transmittance_Avg': self.transmittance.mean.copy(),
+            'Transmittance_Std_Dev': self.transmittance.std,
+            'Haze_Avg': self.haze.mean.copy(),
+            'Haze_Std_Dev': self.haze.std,
+        }
+
+    def state(self) -> Dict[str, ndarray]:
+        """ Serialisable state (flat dict of arrays, e.g. for np.savez), see from_state. """
+        state = {'wavelength': self.wavelength, 't1': self.t1, 't3': self.t3}
+        for prefix, stats in (('transmittance', self.transmittance), ('haze', self.haze)):
+            state.update({f'{prefix}_{key}': value for key, value in stats.state().items()})
+        return state
+
+    @classmethod
+    def from_state(cls, state: Dict[str, ndarray]) -> SampleAccumulator:
+        """ Restore an accumulator saved by state(), more areas can then be added. """
+        accumulator = cls(np.asarray(state['wavelength']), np.asarray(state['t1']), np.asarray(state['t3']))
+        for prefix in ('transmittance', 'haze'):
+            setattr(accumulator, prefix, RunningStats.from_state(
+                {key: state[f'{prefix}_{key}'] for key in ('count', 'mean', 'm2')}))
+        return accumulator
@@ -6,3 +6,14 @@ SETTINGS = {
     # T4: Haze measurement of the sample, focusing on the scattered light caused by the sample itself.
     'file_names_custom': [...]  # Set 4 different filenames here
 }
+
+# Default options of the per-sample image export (width and height are in cm)
+DEFAULT_IMAGE_OPTIONS = {
+    'width': 16.0,
+    'height': 12.0,
+    'format': 'png',
+    'x_min': 200.0,
+    'x_max': 1100.0,
+    'y_min': 0.0,
+    'y_max': 100.0,
+}